@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for LC Maths builds
+Generates synthetic PreTeXt books modelled on the structure of the real
+Number chapter (sections, subsections, definitions, theorems, examples,
+paragraphs and chapter exercises), builds each size for both targets and
+records time, peak memory, output file count and output bytes.
+"""
+
+import argparse
+import csv
+import shutil
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from build_runner import pretext_command, run_measured
+from ptx_source import MAIN_FILE, PROJECT_FILE, PUBLICATION_FILE, docinfo_text
+
+BENCH_DIR = Path(".build-cache") / "bench"
+MODEL_CHAPTER = Path("source") / "number" / "chapter.ptx"
+
+# (chapters, sections per chapter): from today's five strands to hundreds of sections
+DEFAULT_SIZES = [(5, 4), (5, 10), (10, 10), (20, 10), (20, 25)]
+
+BLOCKS = ("definition", "theorem", "example", "assemblage")
+
+
+def chapter_profile(project_dir):
+    """Average per-section counts of the elements in the model chapter"""
+    root = ET.parse(Path(project_dir) / MODEL_CHAPTER).getroot()
+    sections = root.findall("section")
+    counts = {name: 0 for name in ("subsection", "p") + BLOCKS}
+    for section in sections:
+        for name in counts:
+            counts[name] += len(section.findall(f".//{name}"))
+    per_section = {name: max(1, round(total / len(sections))) for name, total in counts.items()}
+    per_section["exercise"] = max(1, len(root.findall("exercises/exercise")))
+    return per_section
+
+
+def paragraph(n):
+    """A paragraph with some inline and display math"""
+    return (
+        f"<p>Paragraph {n} relates <m>x_{{{n}}}</m> to <m>\\R</m> and "
+        f"<m>\\frac{{a}}{{b}} + {n}</m>:<me>\\sum_{{k=1}}^{{{n}}} k^2 = "
+        f"\\frac{{{n}({n}+1)(2 \\cdot {n}+1)}}{{6}}</me></p>"
+    )
+
+
+def block(kind, ident, n):
+    """A definition, theorem, example or assemblage"""
+    if kind == "assemblage":
+        return f'<assemblage xml:id="{ident}"><title>Tool {n}</title>{paragraph(n)}</assemblage>'
+    body = f"<statement>{paragraph(n)}</statement>"
+    if kind in ("theorem", "example"):
+        tag = "proof" if kind == "theorem" else "solution"
+        body += f"<{tag}>{paragraph(n + 1)}</{tag}>"
+    return f'<{kind} xml:id="{ident}"><title>{kind.title()} {n}</title>{body}</{kind}>'
+
+
+def synthetic_section(prefix, profile):
+    """One section following the model chapter's element mix"""
+    subsections = profile["subsection"]
+    parts = [f'<section xml:id="{prefix}"><title>Section {prefix}</title>']
+    for s in range(subsections):
+        sub_id = f"{prefix}-s{s}"
+        parts.append(f'<subsection xml:id="{sub_id}"><title>Subsection {sub_id}</title>')
+        for p in range(max(1, profile["p"] // subsections)):
+            parts.append(paragraph(p))
+        for kind in BLOCKS:
+            for b in range(max(1, profile[kind] // subsections)):
+                parts.append(block(kind, f"{sub_id}-{kind}-{b}", b))
+        parts.append("</subsection>")
+    parts.append("</section>")
+    return "\n".join(parts)
+
+
+def synthetic_chapter(index, sections, profile):
+    """One chapter with `sections` sections and a chapter exercise set"""
+    chapter_id = f"ch{index}"
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<chapter xml:id="{chapter_id}"><title>Chapter {index}</title>',
+    ]
+    for s in range(sections):
+        parts.append(synthetic_section(f"{chapter_id}-sec{s}", profile))
+    parts.append(f'<exercises xml:id="{chapter_id}-exercises"><title>Exercises</title>')
+    for e in range(profile["exercise"]):
+        parts.append(
+            f"<exercise><statement>{paragraph(e)}</statement>"
+            f"<answer><p><m>{e}</m></p></answer></exercise>"
+        )
+    parts.append("</exercises></chapter>")
+    return "\n".join(parts)
+
+
+def generate_book(project_dir, book_dir, chapters, sections, profile):
+    """Write a complete synthetic project (project.ptx, publication, source)"""
+    project_dir, book_dir = Path(project_dir), Path(book_dir)
+    if book_dir.exists():
+        shutil.rmtree(book_dir)
+    (book_dir / "source").mkdir(parents=True)
+    (book_dir / "publication").mkdir()
+    shutil.copy(project_dir / PROJECT_FILE, book_dir / PROJECT_FILE)
+    shutil.copy(project_dir / PUBLICATION_FILE, book_dir / PUBLICATION_FILE)
+
+    includes = []
+    for c in range(chapters):
+        name = f"ch{c}.ptx"
+        (book_dir / "source" / name).write_text(
+            synthetic_chapter(c, sections, profile), encoding="utf-8"
+        )
+        includes.append(f'<xi:include href="{name}"/>')
+    main = f"""<?xml version="1.0" encoding="UTF-8"?>
+<pretext xmlns:xi="http://www.w3.org/2001/XInclude">
+{docinfo_text(project_dir)}
+<book xml:id="bench-book"><title>Synthetic Book</title>
+<frontmatter xml:id="frontmatter"><titlepage><author><personname>Benchmark</personname></author></titlepage></frontmatter>
+{chr(10).join(includes)}
+<backmatter xml:id="backmatter"><index><title>Index</title><index-list/></index></backmatter>
+</book>
+</pretext>
+"""
+    (book_dir / MAIN_FILE).write_text(main, encoding="utf-8")
+
+
+def output_stats(output_dir):
+    """Return (file count, total bytes, knowl file count) of a build output"""
+    files = [path for path in Path(output_dir).rglob("*") if path.is_file()]
+    knowls = [path for path in files if path.parent.name == "knowl"]
+    return len(files), sum(path.stat().st_size for path in files), len(knowls)
+
+
+def run_benchmark(project_dir, python, sizes, targets):
+    """Build every size for every target; return a list of result rows"""
+    profile = chapter_profile(project_dir)
+    print(f"Per-section model from {MODEL_CHAPTER.as_posix()}: {profile}")
+    rows = []
+    for chapters, sections in sizes:
+        book_dir = Path(project_dir) / BENCH_DIR / f"book-{chapters}x{sections}"
+        generate_book(project_dir, book_dir, chapters, sections, profile)
+        for target in targets:
+            print(f"Building {chapters} chapters x {sections} sections ({target})...")
+            cmd = pretext_command(python, "build", target)
+            result = run_measured(cmd, cwd=book_dir, prefix=f"{chapters}x{sections}:{target}")
+            files, size, knowls = output_stats(book_dir / "output" / target)
+            rows.append({
+                "chapters": chapters,
+                "sections": chapters * sections,
+                "target": target,
+                "returncode": result["returncode"],
+                "wall": round(result["wall"], 2),
+                "peak_rss_mb": round((result["peak_rss_kb"] or 0) / 1024, 1),
+                "files": files,
+                "bytes": size,
+                "knowls": knowls,
+            })
+    return rows
+
+
+def print_table(rows):
+    """Print results with per-section growth, the early-warning numbers"""
+    print()
+    print("=" * 78)
+    print(f"{'target':<7}{'sections':>9}{'wall s':>9}{'s/sec':>8}{'peak MB':>9}"
+          f"{'files':>8}{'knowls':>8}{'MB out':>9}{'knowl %':>9}")
+    print("=" * 78)
+    for row in rows:
+        per_section = row["wall"] / row["sections"]
+        knowl_share = 100 * row["knowls"] / row["files"] if row["files"] else 0
+        print(f"{row['target']:<7}{row['sections']:>9}{row['wall']:>9.1f}{per_section:>8.2f}"
+              f"{row['peak_rss_mb']:>9.0f}{row['files']:>8}{row['knowls']:>8}"
+              f"{row['bytes'] / 1e6:>9.1f}{knowl_share:>8.0f}%")
+    print()
+    print("A rising s/sec means build time grows faster than the book; a high")
+    print("knowl % means per-paragraph knowls dominate the web output.")
+
+
+def plot(rows, path):
+    """Chart the results if matplotlib is available"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib not installed - skipping chart")
+        return
+    metrics = [("wall", "time (s)"), ("peak_rss_mb", "peak memory (MB)"),
+               ("files", "output files"), ("bytes", "output bytes")]
+    fig, axes = plt.subplots(2, 2, figsize=(10, 7))
+    for ax, (key, label) in zip(axes.flat, metrics):
+        for target in sorted({row["target"] for row in rows}):
+            points = [(row["sections"], row[key]) for row in rows if row["target"] == target]
+            ax.plot(*zip(*points), marker="o", label=target)
+        ax.set_xlabel("sections")
+        ax.set_ylabel(label)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"✓ Chart written to {path}")
+
+
+def parse_size(text):
+    """Parse a CHAPTERSxSECTIONS size such as 10x25"""
+    chapters, _, sections = text.lower().partition("x")
+    return int(chapters), int(sections)
+
+
+def bench(project_dir, python, sizes=DEFAULT_SIZES, targets=("web", "print"),
+          generate_only=False):
+    """Generate (and unless `generate_only`, build) every size; return 0 on success"""
+    if generate_only:
+        profile = chapter_profile(project_dir)
+        for chapters, sections in sizes:
+            book_dir = Path(project_dir) / BENCH_DIR / f"book-{chapters}x{sections}"
+            generate_book(project_dir, book_dir, chapters, sections, profile)
+            print(f"✓ {book_dir}")
+        return 0
+
+    rows = run_benchmark(project_dir, python, sizes, targets)
+    results = Path(project_dir) / BENCH_DIR / "results.csv"
+    with open(results, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print_table(rows)
+    print(f"✓ Results written to {results}")
+    plot(rows, results.with_suffix(".png"))
+    return 1 if any(row["returncode"] != 0 for row in rows) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark builds of synthetic books")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Python interpreter with pretext installed")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--sizes", nargs="+", type=parse_size,
+                        default=DEFAULT_SIZES, metavar="CxS",
+                        help="book sizes as CHAPTERSxSECTIONS (default: 5x4 ... 20x25)")
+    parser.add_argument("--targets", nargs="+", default=["web", "print"])
+    parser.add_argument("--generate-only", action="store_true",
+                        help="write the synthetic books without building them")
+    args = parser.parse_args()
+    return bench(args.project_dir, args.python, args.sizes, args.targets, args.generate_only)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Build history for LC Maths
+Stores wall time, CPU time, peak memory and per-phase timings of each
+pretext build in a local SQLite database keyed by git commit and target,
+and reports builds that got slower or heavier than the recent baseline.
+
+Each build also has a mode, so only like is compared with like: "full"
+for whole-target builds and "partial" for `-x <xml:id>` rebuilds of a
+few divisions, which take seconds rather than minutes. "profiled" builds
+(build_profile.py) run slower under the profiler and are left out of the
+report altogether.
+"""
+
+import argparse
+import json
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import closing
+from pathlib import Path
+
+HISTORY_FILE = Path(".build-cache") / "history.sqlite3"
+DEFAULT_THRESHOLD = 0.15
+BASELINE_BUILDS = 5
+# Ignore timing changes smaller than this, whatever the percentage
+MIN_SECONDS = 0.5
+FULL, PARTIAL, PROFILED = "full", "partial", "profiled"
+PARTIAL_OPTIONS = ("-x", "--xmlid")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    git_commit TEXT NOT NULL,
+    dirty INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'full',
+    command TEXT NOT NULL,
+    returncode INTEGER NOT NULL,
+    wall REAL NOT NULL,
+    cpu REAL,
+    peak_rss_kb INTEGER,
+    phases TEXT NOT NULL
+)
+"""
+
+
+def git_state(project_dir):
+    """Return (commit, dirty) for the project, or ("unknown", False)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_dir,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=project_dir,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(status)
+
+
+def connect(project_dir):
+    """Open (and create if needed) the history database
+
+    The caller closes the connection, e.g. `with closing(connect(...)) as db`.
+    """
+    path = Path(project_dir) / HISTORY_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.execute(SCHEMA)
+    return db
+
+
+def build_mode(cmd):
+    """PARTIAL for a pretext build restricted to some xml:ids, else FULL"""
+    return PARTIAL if any(str(part) in PARTIAL_OPTIONS for part in cmd) else FULL
+
+
+def record_build(project_dir, target, cmd, result, mode=None):
+    """Store one measured build (see build_runner.run_measured); return its id
+
+    `mode` defaults to what the command line says (see build_mode).
+    """
+    commit, dirty = git_state(project_dir)
+    # closing() closes the connection; `db` itself commits the insert
+    with closing(connect(project_dir)) as db, db:
+        cursor = db.execute(
+            "INSERT INTO builds (started, git_commit, dirty, target, mode, command,"
+            " returncode, wall, cpu, peak_rss_kb, phases)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                result.get("started", time.time()), commit, int(dirty), target,
+                mode or build_mode(cmd), " ".join(str(part) for part in cmd), result["returncode"],
+                result["wall"], result.get("cpu"), result.get("peak_rss_kb"),
+                json.dumps(result.get("phases", {})),
+            ),
+        )
+        return cursor.lastrowid
+
+
+def metrics(row):
+    """Flatten a history row into {metric name: value}"""
+    values = {"wall": row["wall"], "cpu": row["cpu"], "peak_rss_kb": row["peak_rss_kb"]}
+    for phase, seconds in json.loads(row["phases"]).items():
+        values[f"phase:{phase}"] = seconds
+    return {name: value for name, value in values.items() if value is not None}
+
+
+def find_regressions(latest, baseline_rows, threshold):
+    """Compare one build with the median of earlier builds of the same target and mode"""
+    regressions = []
+    current = metrics(latest)
+    for name, value in current.items():
+        history = [metrics(row)[name] for row in baseline_rows if name in metrics(row)]
+        if not history:
+            continue
+        baseline = statistics.median(history)
+        if name != "peak_rss_kb" and value - baseline < MIN_SECONDS:
+            continue
+        if baseline > 0 and (value - baseline) / baseline > threshold:
+            regressions.append((name, baseline, value))
+    return regressions
+
+
+def report(project_dir, threshold=DEFAULT_THRESHOLD, target=None):
+    """Print the latest build per target and mode and flag regressions; return 1 if any"""
+    with closing(connect(project_dir)) as db:
+        groups = [(row["target"], row["mode"]) for row in db.execute(
+            "SELECT DISTINCT target, mode FROM builds WHERE mode != ? AND (target = ? OR ? IS NULL)"
+            " ORDER BY target, mode", (PROFILED, target, target))]
+        latest_rows = {group: db.execute(
+            "SELECT * FROM builds WHERE target = ? AND mode = ? AND returncode = 0"
+            " ORDER BY id DESC LIMIT ?",
+            (*group, BASELINE_BUILDS + 1),
+        ).fetchall() for group in groups}
+    if not groups:
+        print("No builds recorded yet.")
+        return 0
+
+    found = False
+    print("=" * 60)
+    print(f"Build report (regression threshold {threshold:.0%})")
+    print("=" * 60)
+    for name, mode in groups:
+        rows = latest_rows[name, mode]
+        if not rows:
+            continue
+        latest, baseline_rows = rows[0], rows[1:]
+        dirty = "+dirty" if latest["dirty"] else ""
+        label = name if mode == FULL else f"{name} ({mode})"
+        print(f"{label} @ {latest['git_commit']}{dirty}")
+        for metric, value in metrics(latest).items():
+            unit = " KB" if metric == "peak_rss_kb" else "s"
+            print(f"  {metric:<20} {value:12.2f}{unit}")
+        for metric, baseline, value in find_regressions(latest, baseline_rows, threshold):
+            found = True
+            change = (value - baseline) / baseline
+            print(f"  ✗ {metric} regressed: {baseline:.2f} -> {value:.2f} (+{change:.0%})")
+        print()
+    if not found:
+        print("✓ No regressions")
+    return 1 if found else 0
+
+
+def list_builds(project_dir, limit=20):
+    """Print the most recent builds"""
+    with closing(connect(project_dir)) as db:
+        rows = db.execute("SELECT * FROM builds ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    for row in rows:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["started"]))
+        rss = f"{row['peak_rss_kb'] / 1024:.0f} MB" if row["peak_rss_kb"] else "-"
+        status = "ok" if row["returncode"] == 0 else f"rc={row['returncode']}"
+        print(f"  {row['id']:>4} {when} {row['git_commit']:<9} {row['target']:<6} "
+              f"{row['mode']:<8} {row['wall']:7.1f}s {rss:>8} {status}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build timing history")
+    parser.add_argument("--project-dir", default=".")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report_parser = sub.add_parser("report", help="flag regressions in the latest builds")
+    report_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                               help="fractional slowdown to flag (default 0.15)")
+    report_parser.add_argument("--target")
+    sub.add_parser("list", help="show recent builds")
+    args = parser.parse_args()
+    if args.command == "report":
+        return report(args.project_dir, args.threshold, args.target)
+    return list_builds(args.project_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
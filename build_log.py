@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Live log parsing for pretext and LaTeX builds
+Reads build output line by line as it arrives and classifies PreTeXt
+(PTX:...), pretext CLI, Python and LaTeX messages as warnings, errors or
+fatal errors. Each message is mapped back to a source file and xml:id where
+it names one: an xml:id or xref target, a .ptx file and line, an undefined
+LaTeX reference, or the nearest \\label before a LaTeX error line.
+
+build_runner.run_build feeds every pretext build through a BuildLog. The
+first fatal error stops the build at once, so the remaining LaTeX passes are
+not wasted, and a deduplicated summary is printed at the end, one block per
+target even when several builds run in parallel.
+
+    python build_log.py output/latex/parts/algebra/book.log   # summarise a saved log
+"""
+
+import argparse
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+WARNING, ERROR, FATAL = "warning", "error", "fatal"
+LEVELS = (WARNING, ERROR, FATAL)
+SUMMARY_LIMIT = 20
+# Lines after a message that may still belong to it (LaTeX wraps at 79 columns)
+CONTEXT_LINES = 6
+
+# (level, category, pattern), first match wins
+RULES = [
+    (FATAL, "latex", re.compile(r"^! Emergency stop|Fatal error occurred, no output PDF")),
+    (FATAL, "latex-missing-file", re.compile(r"^! LaTeX Error: File `[^']+' not found"
+                                             r"|^! I can't find file")),
+    (FATAL, "pretext", re.compile(r"PTX:FATAL")),
+    (FATAL, "pretext", re.compile(r"^\s*CRITICAL\b")),
+    (ERROR, "pretext", re.compile(r"PTX:(ERROR|BUG)")),
+    (ERROR, "pretext", re.compile(r"^\s*ERROR\b|^error:", re.I)),
+    (ERROR, "python", re.compile(r"^Traceback \(most recent call last\)")),
+    (ERROR, "latex", re.compile(r"^! |^Runaway argument")),
+    (WARNING, "latex-reference", re.compile(r"LaTeX Warning: (Reference|Citation) `")),
+    (WARNING, "latex-box", re.compile(r"^(Over|Under)full \\[hv]box")),
+    (WARNING, "latex", re.compile(r"(LaTeX|Package \S+|Class \S+) Warning:")),
+    (WARNING, "pretext-deprecation", re.compile(r"PTX:DEPRECATE")),
+    (WARNING, "pretext", re.compile(r"PTX:WARNING|^\s*WARNING\b", re.I)),
+]
+
+XML_ID_RE = re.compile(r"""(?:xml:id|@ref|\bref)\s*=?\s*["']([\w.:-]+)["']""")
+LATEX_REF_RE = re.compile(r"(?:Reference|Citation) `([^']+)'")
+PTX_LOCATION_RE = re.compile(r"([\w./\\:-]+\.ptx)(?::|,? line\s+)(\d+)")
+TEX_LINE_RE = re.compile(r"(?:^|\s)l\.(\d+) |on input line (\d+)|at lines (\d+)--\d+")
+TEX_FILE_RE = re.compile(r"\(([^()\s]+\.tex)")
+LABEL_RE = re.compile(r"\\label\{([^}]+)\}")
+
+
+@dataclass
+class LogMessage:
+    level: str
+    category: str
+    text: str
+    file: str = None
+    line: int = None
+    xml_id: str = None
+
+    def location(self):
+        where = f"{self.file}:{self.line}" if self.file and self.line else self.file or ""
+        if self.xml_id:
+            where = f"{where} [{self.xml_id}]" if where else f"[{self.xml_id}]"
+        return where
+
+    def key(self):
+        return (self.level, self.category, self.text, self.file, self.line, self.xml_id)
+
+
+class BuildLog:
+    """
+    Streaming classifier for one build's output.
+
+    feed() each line; it returns True once the build should be stopped
+    (a message at or above `fail_on`, default the first fatal error).
+    """
+
+    def __init__(self, project_dir=".", fail_on=FATAL, cwd=None):
+        self.project_dir = Path(project_dir)
+        self.cwd = Path(cwd) if cwd else self.project_dir
+        self.fail_on = fail_on
+        self.messages = []
+        self.stop_reason = None
+        self.current = None
+        self.context = []
+        self.in_traceback = False
+        self.tex_file = None
+        self.tex_labels = {}
+        self._definitions = None
+        self._files = {}
+
+    # Parsing
+
+    def feed(self, line):
+        line = line.rstrip("\r\n")
+        for match in TEX_FILE_RE.finditer(line):
+            self.tex_file = match.group(1)
+        if self.in_traceback:
+            # The exception itself is the first unindented line after the frames
+            if line and not line.startswith(" "):
+                self.in_traceback = False
+                self.current.text = line.strip()
+            return self.stop_reason is not None
+        rule = next(((level, category) for level, category, pattern in RULES
+                     if pattern.search(line)), None)
+        if rule is None:
+            if self.current is not None:
+                if line.strip() and len(self.context) < CONTEXT_LINES:
+                    self.context.append(line)
+                elif not line.strip():
+                    self.close()
+            return self.stop_reason is not None
+        self.close()
+        level, category = rule
+        self.current = LogMessage(level, category, line.strip())
+        self.in_traceback = category == "python"
+        if self.should_stop(level):
+            self.stop_reason = line.strip()
+            # Nothing more is coming for this message once the build is killed
+            if not self.in_traceback:
+                self.close()
+        return self.stop_reason is not None
+
+    def should_stop(self, level):
+        return (self.stop_reason is None and self.fail_on is not None
+                and LEVELS.index(level) >= LEVELS.index(self.fail_on))
+
+    def close(self):
+        """Finish the open message: locate it and add it to the list"""
+        message, self.current = self.current, None
+        context, self.context = self.context, []
+        self.in_traceback = False
+        if message is None:
+            return
+        self.locate(message, " ".join([message.text] + [line.strip() for line in context]))
+        self.messages.append(message)
+
+    def finish(self):
+        self.close()
+
+    # Mapping back to the source
+
+    def definitions(self):
+        """xml:id -> (file, line, tag, parent) from the dependency graph"""
+        if self._definitions is None:
+            try:
+                from depgraph import load_graph
+                graph = load_graph(self.project_dir)
+                self._definitions = graph.definitions()
+                self._files = graph.files
+            except (OSError, KeyError, ValueError, SyntaxError):
+                self._definitions, self._files = {}, {}
+        return self._definitions
+
+    def known_id(self, name):
+        """An xml:id for a LaTeX label or id-like name, if the book defines one"""
+        definitions = self.definitions()
+        for candidate in (name, name.rsplit(":", 1)[-1]):
+            if candidate in definitions:
+                return candidate
+        return None
+
+    def label_before(self, tex_file, line):
+        """The last \\label at or before `line` of a LaTeX file"""
+        if tex_file not in self.tex_labels:
+            path = Path(tex_file)
+            path = path if path.is_absolute() else self.cwd / path
+            labels = []
+            if path.is_file():
+                for number, text in enumerate(
+                        path.read_text(encoding="utf-8", errors="replace").splitlines(), 1):
+                    labels += [(number, label) for label in LABEL_RE.findall(text)]
+            self.tex_labels[tex_file] = labels
+        found = [label for number, label in self.tex_labels[tex_file] if number <= line]
+        return found[-1] if found else None
+
+    def locate(self, message, text):
+        match = PTX_LOCATION_RE.search(text)
+        if match:
+            message.file = self.relative(match.group(1))
+            message.line = int(match.group(2))
+            message.xml_id = self.enclosing_id(message.file, message.line)
+        names = LATEX_REF_RE.findall(text) + XML_ID_RE.findall(text)
+        for name in names:
+            xml_id = self.known_id(name)
+            if xml_id:
+                message.xml_id = xml_id
+                break
+        else:
+            if names and message.xml_id is None:
+                message.xml_id = names[0]
+        if message.xml_id and message.file is None and message.xml_id in self.definitions():
+            message.file, message.line = self.definitions()[message.xml_id][:2]
+        tex_line = TEX_LINE_RE.search(text)
+        if message.category.startswith("latex") and tex_line and self.tex_file:
+            number = int(next(group for group in tex_line.groups() if group))
+            if message.xml_id is None:
+                label = self.label_before(self.tex_file, number)
+                xml_id = self.known_id(label) if label else None
+                if xml_id:
+                    message.xml_id = xml_id
+                    message.file, message.line = self.definitions()[xml_id][:2]
+            if message.file is None:
+                message.file, message.line = Path(self.tex_file).name, number
+
+    def relative(self, path):
+        path = Path(path.replace("file://", ""))
+        try:
+            return path.resolve().relative_to(self.project_dir.resolve()).as_posix()
+        except (OSError, ValueError):
+            return path.as_posix()
+
+    def enclosing_id(self, rel, line):
+        """The last xml:id declared at or before `line` in a source file"""
+        self.definitions()
+        ids = [(number, xml_id) for xml_id, number, _, _ in self._files.get(rel, {}).get("ids", [])
+               if number <= line]
+        return max(ids)[1] if ids else None
+
+    # Reporting
+
+    def counts(self):
+        return dict(Counter(message.level for message in self.messages))
+
+    def summary(self, title="build"):
+        """Deduplicated summary lines, worst first"""
+        self.finish()
+        if not self.messages and self.stop_reason is None:
+            return []
+        unique = Counter(message.key() for message in self.messages)
+        first = {}
+        for message in self.messages:
+            first.setdefault(message.key(), message)
+        counts = self.counts()
+        parts = [f"{counts.get(level, 0)} {level}(s)" for level in reversed(LEVELS)
+                 if counts.get(level)]
+        lines = [f"Log summary ({title}): {', '.join(parts) or 'no messages'}, "
+                 f"{len(unique)} distinct"]
+        if self.stop_reason:
+            lines.append(f"  ✗ Stopped early on: {self.stop_reason}")
+        for level in reversed(LEVELS):
+            keys = [key for key in first if key[0] == level]
+            if level == WARNING and len(keys) > SUMMARY_LIMIT:
+                by_category = Counter(first[key].category for key in keys)
+                lines.append("  warnings by kind: " + ", ".join(
+                    f"{category} ×{count}" for category, count in by_category.most_common()))
+            for key in keys[:SUMMARY_LIMIT]:
+                message = first[key]
+                repeat = f" (×{unique[key]})" if unique[key] > 1 else ""
+                where = message.location()
+                lines.append(f"  {level:<7} {where + '  ' if where else ''}{message.text}{repeat}")
+            if len(keys) > SUMMARY_LIMIT:
+                lines.append(f"  ... and {len(keys) - SUMMARY_LIMIT} more {level}(s)")
+        return lines
+
+
+def parse_file(path, project_dir=".", cwd=None):
+    """Classify a saved log file; returns the finished BuildLog"""
+    log = BuildLog(project_dir, fail_on=None, cwd=cwd or Path(path).parent)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            log.feed(line)
+    log.finish()
+    return log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a pretext or LaTeX build log")
+    parser.add_argument("log", nargs="?", help="log file (default: standard input)")
+    parser.add_argument("--project-dir", default=".")
+    args = parser.parse_args()
+    if args.log:
+        log = parse_file(args.log, args.project_dir)
+    else:
+        log = BuildLog(args.project_dir, fail_on=None)
+        for line in sys.stdin:
+            log.feed(line)
+    for line in log.summary(args.log or "stdin"):
+        print(line)
+    return 1 if log.counts().get(ERROR) or log.counts().get(FATAL) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
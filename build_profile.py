@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Build profiler for LC Maths
+Runs a pretext build under a sampling profiler: a thread in the pretext
+process records the main thread's Python stack every few milliseconds,
+and every lxml XSLT transform is run with libxslt's template profiling
+on. The samples are written as folded stacks and drawn as a flamegraph,
+and the XSLT template timings are added up across all transforms.
+
+The profile is saved in .build-cache/profiles/<build id>/, where the id
+is the build's build-history record, so profiles of two commits can be
+compared:
+
+    python build_profile.py build web           # profiled build
+    python build_profile.py build web --divisions section
+    python build_profile.py show                # tables for the latest profile
+    python build_profile.py compare 41 57       # two build ids (or git commits)
+
+`--divisions` also times a preview build of every chapter or section
+(see preview.py), to show which parts of the source cost the most.
+`lcmaths.py build --profile` and `quick.py <choice> --profile` profile
+their pretext builds the same way. libxslt's profiling slows the XSLT
+passes down, so compare profiled builds with profiled builds.
+"""
+
+import argparse
+import functools
+import json
+import os
+import re
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import closing
+from html import escape
+from pathlib import Path
+
+PROFILE_DIR = Path(".build-cache") / "profiles"
+STACKS_FILE = "stacks.folded"
+TEMPLATES_FILE = "templates.json"
+META_FILE = "meta.json"
+DIVISIONS_FILE = "divisions.json"
+FLAMEGRAPH_FILE = "flamegraph.svg"
+
+DEFAULT_INTERVAL = 0.005
+# libxslt profile times are in units of 1/XSLT_TIMESTAMP_TICS_PER_SEC
+XSLT_TICKS_PER_SECOND = 100000
+TOP = 15
+
+# Where a sample's time goes: the phase of the innermost frame whose module
+# path (relative to its sys.path entry, see module_path) and function name
+# both match. This is a heuristic - it only knows pretext's own conversion
+# functions and this profiler's XSLT hook, and XInclude and knowls run
+# inside the XSLT passes, so they count as xslt.
+PRETEXT_MODULE = r"pretext/.+\.py"
+STACK_PHASES = [
+    ("latex", re.compile(PRETEXT_MODULE),
+     re.compile(r"latex|pdf|latex_image_conversion|asymptote_conversion")),
+    ("mathjax", re.compile(PRETEXT_MODULE), re.compile(r"mathjax_\w+")),
+    ("xslt", re.compile(r"build_profile\.py"), re.compile(r"xslt_transform")),
+    ("xslt", re.compile(PRETEXT_MODULE), re.compile(r"xsltproc")),
+]
+FRAME = re.compile(r"(?P<function>.*) \((?P<module>.*):\d+\)")
+
+# Flamegraph layout
+SVG_WIDTH = 1200
+ROW_HEIGHT = 16
+MIN_WIDTH = 0.5
+
+
+# In the pretext process
+
+@functools.lru_cache(maxsize=None)
+def module_path(filename):
+    """`filename` relative to its sys.path entry, e.g. pretext/core/pretext.py"""
+    path = Path(filename)
+    roots = sorted((Path(entry).resolve() for entry in sys.path if entry),
+                   key=lambda root: len(root.parts), reverse=True)
+    for root in roots:
+        try:
+            return path.resolve().relative_to(root).as_posix()
+        except (OSError, ValueError):
+            continue
+    return path.name
+
+
+def frame_label(code):
+    return f"{code.co_name} ({module_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """Counts the folded Python stacks of one thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.ticks = 0
+        self.done = threading.Event()
+
+    def run(self):
+        skip = {__file__, runpy.__file__, "<frozen runpy>"}
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            # Drop the sampler's own frames below pretext's entry point
+            while codes and codes[-1].co_filename in skip:
+                codes.pop()
+            if codes:
+                self.stacks[";".join(frame_label(code) for code in reversed(codes))] += 1
+                self.ticks += 1
+
+
+def hook_xslt(templates):
+    """Turn on template profiling for every lxml XSLT transform; False without lxml"""
+    try:
+        from lxml import etree
+    except ImportError:
+        return False
+    original = etree.XSLT
+
+    def xslt_transform(xslt, args, kwargs):
+        kwargs.setdefault("profile_run", True)
+        result = xslt.transform(*args, **kwargs)
+        profile = getattr(result, "xslt_profile", None)
+        if profile is not None:
+            for node in profile.getroot():
+                key = "|".join([xslt.stylesheet, node.get("match", ""), node.get("name", ""),
+                                node.get("mode", "")])
+                entry = templates.setdefault(key, {"calls": 0, "ticks": 0})
+                entry["calls"] += int(node.get("calls", 0))
+                entry["ticks"] += int(node.get("time", 0))
+        return result
+
+    class ProfiledXSLT:
+        def __init__(self, xslt_input, *args, **kwargs):
+            self.transform = original(xslt_input, *args, **kwargs)
+            try:
+                tree = xslt_input.getroottree() if hasattr(xslt_input, "getroottree") else xslt_input
+                self.stylesheet = Path(tree.docinfo.URL or "").name or "stylesheet"
+            except AttributeError:
+                self.stylesheet = "stylesheet"
+
+        def __call__(self, *args, **kwargs):
+            return xslt_transform(self, args, kwargs)
+
+        def __getattr__(self, name):
+            return getattr(self.transform, name)
+
+    for name in ("strparam", "set_global_max_depth"):
+        if hasattr(original, name):
+            setattr(ProfiledXSLT, name, staticmethod(getattr(original, name)))
+    etree.XSLT = ProfiledXSLT
+    return True
+
+
+def sample_module(out, module, args, interval):
+    """Run `python -m module args` in this process under the sampler; return its exit code"""
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    templates = {}
+    xslt = hook_xslt(templates)
+    sampler = Sampler(threading.main_thread().ident, interval)
+    sys.argv = [module] + list(args)
+    start = time.perf_counter()
+    sampler.start()
+    returncode = 0
+    try:
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+    except SystemExit as error:
+        code = error.code
+        returncode = code if isinstance(code, int) else (0 if code is None else 1)
+    finally:
+        sampler.done.set()
+        sampler.join()
+        wall = time.perf_counter() - start
+        (out / STACKS_FILE).write_text(
+            "".join(f"{stack} {count}\n" for stack, count in sampler.stacks.items()),
+            encoding="utf-8")
+        (out / TEMPLATES_FILE).write_text(json.dumps(templates), encoding="utf-8")
+        (out / META_FILE).write_text(json.dumps({
+            "args": list(args), "wall": wall, "samples": sampler.ticks,
+            "seconds_per_sample": wall / sampler.ticks if sampler.ticks else interval,
+            "xslt_profiled": xslt,
+        }, indent=2), encoding="utf-8")
+    return returncode
+
+
+# In the build script
+
+def profiled_command(cmd, out, interval=DEFAULT_INTERVAL):
+    """Rewrite `python -m pretext ...` to run under the sampler, writing to `out`"""
+    if list(cmd[1:3]) != ["-m", "pretext"]:
+        raise ValueError(f"not a pretext command: {' '.join(map(str, cmd))}")
+    return [cmd[0], str(Path(__file__).resolve()), "sample", "--out", str(Path(out).resolve()),
+            "--interval", str(interval), "--", "pretext", *cmd[3:]]
+
+
+def profile_path(project_dir, build_id):
+    return Path(project_dir) / PROFILE_DIR / str(build_id)
+
+
+def profile_build(cmd, project_dir, target, prefix=None, log=None, env=None):
+    """Run and record a pretext build under the profiler (see build_runner.run_build)"""
+    from build_history import PROFILED, record_build
+    from build_runner import emit, run_measured
+
+    (Path(project_dir) / PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+    # Unique per build, as build_targets profiles several targets at once
+    pending = Path(tempfile.mkdtemp(prefix="pending-", dir=Path(project_dir) / PROFILE_DIR))
+    result = run_measured(profiled_command(cmd, pending), cwd=project_dir, prefix=prefix,
+                          log=log, env=env)
+    # Its own mode, so the profiler's overhead never reads as a regression
+    result["id"] = record_build(project_dir, target, cmd, result, mode=PROFILED)
+    final = profile_path(project_dir, result["id"])
+    if not (pending / META_FILE).exists():
+        shutil.rmtree(pending, ignore_errors=True)
+    else:
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(pending, final)
+        write_flamegraph(final, f"pretext {' '.join(map(str, cmd[3:]))} (build {result['id']})")
+        emit(f"Profile saved in {final} (python build_profile.py show {result['id']})", prefix)
+    return result
+
+
+def read_stacks(directory):
+    stacks = Counter()
+    path = Path(directory) / STACKS_FILE
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            stack, _, count = line.rpartition(" ")
+            stacks[stack] += int(count)
+    return stacks
+
+
+def write_flamegraph(directory, title):
+    """Draw the folded stacks in `directory` as an SVG flamegraph"""
+    stacks = read_stacks(directory)
+    total = sum(stacks.values())
+    root = {"value": total, "children": {}}
+    depth = 0
+    for stack, count in stacks.items():
+        node = root
+        frames = stack.split(";")
+        depth = max(depth, len(frames))
+        for frame in frames:
+            node = node["children"].setdefault(frame, {"value": 0, "children": {}})
+            node["value"] += count
+    height = (depth + 3) * ROW_HEIGHT
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}" '
+             f'font-family="monospace" font-size="11">',
+             f'<rect width="100%" height="100%" fill="#fdfdf6"/>',
+             f'<text x="{SVG_WIDTH / 2}" y="14" text-anchor="middle" font-size="13">'
+             f'{escape(title)}</text>']
+
+    def place(name, node, x, level):
+        width = node["value"] / total * SVG_WIDTH
+        if width < MIN_WIDTH:
+            return
+        y = height - (level + 1) * ROW_HEIGHT
+        crc = zlib.crc32(name.encode())
+        colour = f"rgb({205 + crc % 50},{(crc >> 8) % 180 + 50},{(crc >> 16) % 55})"
+        share = node["value"] / total
+        label = name if len(name) * 7 < width - 4 else name[:max(0, int((width - 4) / 7) - 2)] + ".."
+        parts.append(f'<g><title>{escape(name)} ({node["value"]} samples, {share:.1%})</title>'
+                     f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{ROW_HEIGHT - 1}" '
+                     f'fill="{colour}" rx="2"/>'
+                     + (f'<text x="{x + 3:.1f}" y="{y + ROW_HEIGHT - 4}">{escape(label)}</text>'
+                        if width > 21 else "") + "</g>")
+        for child_name, child in sorted(node["children"].items()):
+            place(child_name, child, x, level + 1)
+            x += child["value"] / total * SVG_WIDTH
+
+    if total:
+        place("all", root, 0.0, 0)
+    parts.append("</svg>")
+    (Path(directory) / FLAMEGRAPH_FILE).write_text("\n".join(parts), encoding="utf-8")
+
+
+def stack_phase(stack):
+    for frame in reversed(stack.split(";")):
+        match = FRAME.fullmatch(frame)
+        if match is None:
+            continue
+        for phase, module, function in STACK_PHASES:
+            if module.fullmatch(match["module"]) and function.fullmatch(match["function"]):
+                return phase
+    return "other"
+
+
+def summarise(directory):
+    """Seconds by phase, by function (self time) and by XSLT template for a profile"""
+    directory = Path(directory)
+    meta = json.loads((directory / META_FILE).read_text(encoding="utf-8"))
+    per_sample = meta["seconds_per_sample"]
+    phases, functions = Counter(), Counter()
+    for stack, count in read_stacks(directory).items():
+        phases[stack_phase(stack)] += count * per_sample
+        functions[stack.rpartition(";")[2]] += count * per_sample
+    templates = {}
+    if (directory / TEMPLATES_FILE).exists():
+        raw = json.loads((directory / TEMPLATES_FILE).read_text(encoding="utf-8"))
+        templates = {key: {"calls": entry["calls"],
+                           "seconds": entry["ticks"] / XSLT_TICKS_PER_SECOND}
+                     for key, entry in raw.items()}
+    divisions = {}
+    if (directory / DIVISIONS_FILE).exists():
+        divisions = json.loads((directory / DIVISIONS_FILE).read_text(encoding="utf-8"))
+    return {"meta": meta, "phases": dict(phases), "functions": dict(functions),
+            "templates": templates, "divisions": divisions}
+
+
+def template_label(key):
+    stylesheet, match, name, mode = key.split("|")
+    label = f"match={match}" if match else f"name={name}"
+    if mode:
+        label += f" mode={mode}"
+    return f"{stylesheet}: {label}"
+
+
+def show(project_dir, build_id):
+    directory = profile_path(project_dir, build_id)
+    if not (directory / META_FILE).exists():
+        print(f"Error: no profile for build {build_id} in {PROFILE_DIR.as_posix()}/")
+        return 1
+    summary = summarise(directory)
+    meta = summary["meta"]
+    print(f"Build {build_id}: pretext {' '.join(meta['args'])}, {meta['wall']:.1f}s, "
+          f"{meta['samples']} samples")
+    print(f"Flamegraph: {directory / FLAMEGRAPH_FILE}")
+    print()
+    print("Time by phase (heuristic, from the module paths of the sampled stacks)")
+    for phase, seconds in sorted(summary["phases"].items(), key=lambda item: -item[1]):
+        print(f"  {phase:<10} {seconds:8.2f}s  {seconds / meta['wall']:6.1%}")
+    print()
+    print(f"Top {TOP} functions by self time")
+    for label, seconds in Counter(summary["functions"]).most_common(TOP):
+        print(f"  {seconds:8.2f}s  {label}")
+    if summary["templates"]:
+        print()
+        print(f"Top {TOP} XSLT templates")
+        ranked = sorted(summary["templates"].items(), key=lambda item: -item[1]["seconds"])
+        for key, entry in ranked[:TOP]:
+            print(f"  {entry['seconds']:8.2f}s {entry['calls']:>8} calls  {template_label(key)}")
+    elif not meta.get("xslt_profiled"):
+        print()
+        print("No XSLT template timings: lxml was not importable in the pretext process")
+    if summary["divisions"]:
+        print()
+        print(f"Top {TOP} divisions (preview build of each on its own)")
+        ranked = sorted(summary["divisions"].items(), key=lambda item: -item[1])
+        for xml_id, seconds in ranked[:TOP]:
+            print(f"  {seconds:8.2f}s  {xml_id}")
+    return 0
+
+
+def find_profile(project_dir, ref, target=None):
+    """A build id from an id or a git commit (the latest profiled build of it)"""
+    from build_history import PROFILED, connect
+
+    if ref.isdigit() and (profile_path(project_dir, ref) / META_FILE).exists():
+        return int(ref)
+    query = "SELECT id FROM builds WHERE mode = ? AND git_commit LIKE ?"
+    params = [PROFILED, ref + "%"]
+    if target:
+        query += " AND target = ?"
+        params.append(target)
+    with closing(connect(project_dir)) as db:
+        rows = db.execute(query + " ORDER BY id DESC", params).fetchall()
+    for row in rows:
+        if (profile_path(project_dir, row["id"]) / META_FILE).exists():
+            return row["id"]
+    return None
+
+
+def compare(project_dir, first, second, target=None):
+    """Print the changes between two profiles, largest first"""
+    ids = [find_profile(project_dir, ref, target) for ref in (first, second)]
+    for ref, build_id in zip((first, second), ids):
+        if build_id is None:
+            print(f"Error: no profiled build matches {ref}")
+            return 1
+    old, new = (summarise(profile_path(project_dir, build_id)) for build_id in ids)
+    print(f"Build {ids[0]} -> build {ids[1]}: "
+          f"{old['meta']['wall']:.1f}s -> {new['meta']['wall']:.1f}s")
+    sections = [
+        ("phase", old["phases"], new["phases"], str),
+        ("function", old["functions"], new["functions"], str),
+        ("XSLT template", {k: v["seconds"] for k, v in old["templates"].items()},
+         {k: v["seconds"] for k, v in new["templates"].items()}, template_label),
+        ("division", old["divisions"], new["divisions"], str),
+    ]
+    for title, before, after, label in sections:
+        deltas = {key: after.get(key, 0.0) - before.get(key, 0.0)
+                  for key in set(before) | set(after)}
+        ranked = sorted(deltas.items(), key=lambda item: -abs(item[1]))[:TOP]
+        if not ranked:
+            continue
+        print()
+        print(f"Largest changes by {title}")
+        for key, delta in ranked:
+            print(f"  {delta:+8.2f}s  {before.get(key, 0.0):7.2f}s -> "
+                  f"{after.get(key, 0.0):7.2f}s  {label(key)}")
+    return 0
+
+
+def time_divisions(project_dir, python, tag):
+    """Seconds for a preview build of every chapter or section on its own"""
+    import xml.etree.ElementTree as ET
+
+    from preview import KEY_FILE, Previews, PreviewError, expand
+    from ptx_source import MAIN_FILE, XML_ID
+
+    main_path = Path(project_dir) / MAIN_FILE
+    root = expand(ET.parse(main_path).getroot(), main_path.parent)
+    previews = Previews(project_dir, python)
+    timings = {}
+    for elem in root.iter(tag):
+        xml_id = elem.get(XML_ID)
+        if not xml_id:
+            continue
+        (previews.scratch_dir(xml_id) / KEY_FILE).unlink(missing_ok=True)
+        start = time.perf_counter()
+        try:
+            previews.ensure(xml_id)
+        except PreviewError as error:
+            print(f"✗ {error}")
+            continue
+        timings[xml_id] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile pretext builds")
+    parser.add_argument("--project-dir", default=".")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="run a profiled build")
+    build.add_argument("target", nargs="?", default="web")
+    build.add_argument("--python", default=sys.executable,
+                       help="Python interpreter with pretext installed")
+    build.add_argument("--divisions", choices=["chapter", "section"],
+                       help="also time a preview build of every chapter or section")
+    show_parser = sub.add_parser("show", help="tables for a profile")
+    show_parser.add_argument("build_id", nargs="?", help="build id or commit (default: latest)")
+    compare_parser = sub.add_parser("compare", help="compare two profiles")
+    compare_parser.add_argument("first", help="build id or git commit")
+    compare_parser.add_argument("second", help="build id or git commit")
+    compare_parser.add_argument("--target")
+    sample = sub.add_parser("sample", help=argparse.SUPPRESS)
+    sample.add_argument("--out", required=True)
+    sample.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    sample.add_argument("module")
+    sample.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.command == "sample":
+        return sample_module(args.out, args.module, args.args, args.interval)
+    if args.command == "build":
+        from build_runner import pretext_command
+        result = profile_build(pretext_command(args.python, "build", args.target),
+                               args.project_dir, args.target)
+        if args.divisions and result["returncode"] == 0:
+            timings = time_divisions(args.project_dir, args.python, args.divisions)
+            path = profile_path(args.project_dir, result["id"]) / DIVISIONS_FILE
+            path.write_text(json.dumps(timings, indent=2), encoding="utf-8")
+        if (profile_path(args.project_dir, result["id"]) / META_FILE).exists():
+            show(args.project_dir, result["id"])
+        return result["returncode"]
+    if args.command == "compare":
+        return compare(args.project_dir, args.first, args.second, args.target)
+    build_id = args.build_id
+    if build_id is None or not build_id.isdigit():
+        build_id = find_profile(args.project_dir, build_id or "")
+        if build_id is None:
+            print("No profiled builds yet.")
+            return 1
+    return show(args.project_dir, build_id)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
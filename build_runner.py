@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Run PreTeXt builds for LC Maths
+Streams pretext output line by line (optionally with a target prefix),
+measures each build and can build several targets at once, e.g. web and
+print for a release.
+"""
+
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from build_history import record_build
+from build_log import FATAL, BuildLog
+
+ALL_TARGETS = ("web", "print")
+
+# Log lines that mark the start of a build phase, checked in order
+PHASE_MARKERS = [
+    ("latex", re.compile(r"This is (pdfTeX|XeTeX|LuaHBTeX|LuaTeX)|latexmk|Running .*latex", re.I)),
+    ("knowls", re.compile(r"knowl", re.I)),
+    ("xslt", re.compile(r"xslt?|converting .* to (html|latex)|transform", re.I)),
+    ("xinclude", re.compile(r"xinclude|assembl", re.I)),
+]
+
+_print_lock = threading.Lock()
+
+
+def pretext_command(python, *args):
+    """Return the command line for `python -m pretext args...`"""
+    return [str(python), "-m", "pretext"] + [str(arg) for arg in args]
+
+
+def emit(line, prefix=None):
+    """Print one log line, prefixed and never interleaved with other workers"""
+    emit_lines([line], prefix)
+
+
+def emit_lines(lines, prefix=None):
+    """Print several lines as one block, e.g. a log summary"""
+    with _print_lock:
+        for line in lines:
+            print(f"[{prefix}] {line}" if prefix else line, flush=True)
+
+
+def detect_phase(line):
+    """Return the build phase a log line starts, if any"""
+    for phase, pattern in PHASE_MARKERS:
+        if pattern.search(line):
+            return phase
+    return None
+
+
+def wait_with_usage(proc):
+    """Wait for a child and return (returncode, cpu seconds, peak RSS in KB)"""
+    if not hasattr(os, "wait4"):
+        return proc.wait(), None, None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss covers the child and every descendant it waited for;
+    # Linux reports KB, macOS reports bytes
+    peak = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return proc.returncode, usage.ru_utime + usage.ru_stime, peak
+
+
+def kill_tree(proc):
+    """Stop a child and everything it started, e.g. pretext and its LaTeX runs"""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def run_measured(cmd, cwd=None, prefix=None, log=None, env=None):
+    """
+    Run a command, streaming its merged stdout/stderr, in `env` (default:
+    this process's environment).
+
+    Returns a dict with returncode, wall and cpu seconds, peak_rss_kb and
+    phases ({phase: seconds} for the phases recognised in the log). With a
+    BuildLog, each line is also classified, and the command and its children
+    are killed as soon as the log says to stop; "stopped" then holds why.
+    """
+    env = dict(os.environ if env is None else env, PYTHONUNBUFFERED="1")
+    started = time.time()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1,
+        # Its own process group, so a stopped build takes its LaTeX runs with it
+        start_new_session=log is not None and os.name != "nt",
+    )
+    phases = {}
+    stopped = None
+    current, current_start = None, start
+    try:
+        for line in proc.stdout:
+            emit(line.rstrip("\n"), prefix)
+            phase = detect_phase(line)
+            if phase is not None and phase != current:
+                now = time.perf_counter()
+                if current is not None:
+                    phases[current] = phases.get(current, 0.0) + now - current_start
+                current, current_start = phase, now
+            if log is not None and stopped is None and log.feed(line):
+                stopped = log.stop_reason
+                emit(f"✗ Stopping the build: {stopped}", prefix)
+                kill_tree(proc)
+    except KeyboardInterrupt:
+        if log is not None:
+            kill_tree(proc)
+        else:
+            proc.terminate()
+        raise
+    finally:
+        proc.stdout.close()
+    returncode, cpu, peak_rss_kb = wait_with_usage(proc)
+    if stopped is not None and returncode == 0:
+        returncode = 1
+    end = time.perf_counter()
+    if current is not None:
+        phases[current] = phases.get(current, 0.0) + end - current_start
+    return {
+        "started": started,
+        "returncode": returncode,
+        "wall": end - start,
+        "cpu": cpu,
+        "peak_rss_kb": peak_rss_kb,
+        "phases": phases,
+        "stopped": stopped,
+    }
+
+
+def stream_command(cmd, cwd=None, prefix=None, env=None):
+    """Run a command, streaming its merged stdout/stderr, and return the exit code"""
+    return run_measured(cmd, cwd, prefix, env=env)["returncode"]
+
+
+def run_build(cmd, project_dir, target, prefix=None, profile=False, fail_fast=True, env=None):
+    """
+    Run a pretext build, record it in the build history and return the result.
+
+    The output goes through a BuildLog: with `fail_fast` the build is killed
+    on the first fatal error, and a deduplicated summary of its warnings and
+    errors is printed at the end. With `profile`, the build runs under
+    build_profile.py's sampler and the profile is saved alongside its
+    history record.
+    """
+    log = BuildLog(project_dir, fail_on=FATAL if fail_fast else None)
+    if profile:
+        from build_profile import profile_build
+        result = profile_build(cmd, project_dir, target, prefix, log=log, env=env)
+    else:
+        result = run_measured(cmd, cwd=project_dir, prefix=prefix, log=log, env=env)
+        record_build(project_dir, target, cmd, result)
+    emit_lines(log.summary(target), prefix)
+    return result
+
+
+def build_target(python, project_dir, target, *extra_args, profile=False, fail_fast=True):
+    """Build one target in its own pretext process; return (code, seconds)"""
+    cmd = pretext_command(python, "build", target, *extra_args)
+    emit(f"Running: {' '.join(cmd)}", target)
+    result = run_build(cmd, project_dir, target, prefix=target, profile=profile,
+                       fail_fast=fail_fast)
+    return result["returncode"], result["wall"]
+
+
+def build_targets(python, project_dir, targets=ALL_TARGETS, profile=False, fail_fast=True):
+    """
+    Build several targets concurrently, one pretext process per target.
+
+    Prints a summary with each target's status and time plus the overall
+    wall-clock time, and returns 0 only if every target succeeded.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        futures = {
+            target: pool.submit(build_target, python, project_dir, target, profile=profile,
+                                fail_fast=fail_fast)
+            for target in targets
+        }
+        results = {target: future.result() for target, future in futures.items()}
+    wall = time.perf_counter() - start
+
+    print()
+    print("=" * 60)
+    print("Build summary")
+    print("=" * 60)
+    for target, (returncode, seconds) in results.items():
+        status = "✓ ok" if returncode == 0 else f"✗ failed ({returncode})"
+        print(f"  {target:<8} {status:<16} {seconds:7.1f}s")
+    serial = sum(seconds for _, seconds in results.values())
+    print(f"  Wall clock: {wall:.1f}s (serial would be ~{serial:.1f}s)")
+    failed = [target for target, (returncode, _) in results.items() if returncode != 0]
+    if failed:
+        print(f"✗ Failed: {', '.join(failed)}")
+        return 1
+    print("✓ All targets built")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build PreTeXt targets in parallel")
+    parser.add_argument("targets", nargs="*", default=list(ALL_TARGETS),
+                        help="targets from project.ptx (default: web print)")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Python interpreter with pretext installed")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="do not stop a build at its first fatal error")
+    args = parser.parse_args()
+    if not (Path(args.project_dir) / "project.ptx").exists():
+        print(f"Error: project.ptx not found in {args.project_dir}")
+        return 1
+    return build_targets(args.python, args.project_dir, args.targets,
+                         fail_fast=not args.keep_going)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Streaming chapter writer for LC Maths source generators
+Chapters are described as a stream of structured elements (divisions,
+paragraphs, definitions, examples, exercises) and serialised by an
+incremental XML writer. The writer records where each element with an
+xml:id starts and ends, so a single element can be regenerated by xml:id;
+its old copy is located by parsing the file on disk. Files are only
+touched when the serialised bytes actually differ.
+"""
+
+import xml.parsers.expat
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+from source_output import write_if_changed
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XI_NAMESPACE = "http://www.w3.org/2001/XInclude"
+
+
+@dataclass
+class Division:
+    """A division: introduction, section, subsection, conclusion, ...
+
+    `children` are the structured elements written after the title.
+    """
+    tag: str
+    xml_id: Optional[str] = None
+    title: Optional[str] = None
+    children: list = field(default_factory=list)
+
+
+@dataclass
+class Paragraph:
+    """A <p> of PreTeXt markup; lines keep their indentation relative to the <p>"""
+    text: str
+
+
+@dataclass
+class Assemblage:
+    """An <assemblage>: a titled, highlighted run of paragraphs"""
+    xml_id: Optional[str]
+    title: str
+    paragraphs: List[str]
+
+
+@dataclass
+class Objectives:
+    """<objectives> listing one item of PreTeXt markup per entry"""
+    title: str
+    items: List[str]
+
+
+@dataclass
+class Block:
+    """A definition, theorem or example with a statement and optional solution"""
+    tag: str
+    xml_id: Optional[str]
+    title: Optional[str]
+    statement: List[str]
+    solution: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Exercise:
+    """An exercise; each part is a list of paragraphs of PreTeXt markup"""
+    statement: List[str]
+    hint: List[str] = field(default_factory=list)
+    answer: List[str] = field(default_factory=list)
+    solution: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Exercises:
+    """An <exercises> division"""
+    xml_id: Optional[str]
+    title: str
+    exercises: List[Exercise]
+
+
+@dataclass
+class Table:
+    """A <table> of cells holding PreTeXt markup; the header row comes first"""
+    xml_id: Optional[str]
+    title: str
+    header: List[str]
+    rows: List[List[str]]
+
+
+@dataclass
+class Figure:
+    """A <figure> holding one <latex-image>, given as LaTeX source"""
+    xml_id: str
+    caption: str
+    latex: str
+    width: str = "50%"
+
+
+@dataclass
+class Include:
+    """An xi:include of another source file, relative to the chapter"""
+    href: str
+
+
+class ChapterWriter:
+    """Incremental XML writer that keeps track of nesting and indentation"""
+
+    def __init__(self, indent="  "):
+        self.indent = indent
+        self.parts = []
+        self.stack = []
+        self.length = 0
+        # xml:id -> (start, end) offsets of the element's lines
+        self.spans = {}
+
+    def write(self, text):
+        """Append raw, already-indented text"""
+        self.parts.append(text)
+        self.length += len(text)
+
+    def line(self, text):
+        """Append one line at the current depth"""
+        self.write(self.indent * len(self.stack) + text + "\n")
+
+    def blank(self):
+        """Append an empty line"""
+        self.write("\n")
+
+    def start(self, tag, xml_id=None, **attrs):
+        """Open an element"""
+        attributes = ""
+        if xml_id:
+            attributes += f' xml:id="{xml_id}"'
+        for name, value in attrs.items():
+            attributes += f' {name.replace("_", ":")}="{value}"'
+        start = self.length
+        self.line(f"<{tag}{attributes}>")
+        self.stack.append((tag, xml_id, start))
+
+    def end(self):
+        """Close the innermost open element"""
+        tag, xml_id, start = self.stack.pop()
+        self.line(f"</{tag}>")
+        if xml_id:
+            self.spans[xml_id] = (start, self.length)
+
+    def title(self, text):
+        """Write a <title>"""
+        self.line(f"<title>{text}</title>")
+
+    def paragraph(self, text):
+        """Write one <p>"""
+        self.start("p")
+        for line in text.splitlines():
+            self.line(line)
+        self.end()
+
+    def paragraphs(self, tag, paragraphs):
+        """Write <tag> holding one <p> per entry (nothing if empty)"""
+        if not paragraphs:
+            return
+        self.start(tag)
+        for paragraph in paragraphs:
+            self.paragraph(paragraph)
+        self.end()
+
+    def element(self, element):
+        """Serialise one structured element"""
+        if isinstance(element, Division):
+            self.start(element.tag, element.xml_id)
+            if element.title:
+                self.title(element.title)
+            for child in element.children:
+                self.blank()
+                self.element(child)
+            self.end()
+        elif isinstance(element, Paragraph):
+            self.paragraph(element.text)
+        elif isinstance(element, Assemblage):
+            self.start("assemblage", element.xml_id)
+            self.title(element.title)
+            for paragraph in element.paragraphs:
+                self.paragraph(paragraph)
+            self.end()
+        elif isinstance(element, Objectives):
+            self.start("objectives")
+            self.title(element.title)
+            self.start("ul")
+            for item in element.items:
+                self.line(f"<li><p>{item}</p></li>")
+            self.end()
+            self.end()
+        elif isinstance(element, Block):
+            self.start(element.tag, element.xml_id)
+            if element.title:
+                self.title(element.title)
+            self.paragraphs("statement", element.statement)
+            self.paragraphs("proof" if element.tag == "theorem" else "solution",
+                            element.solution)
+            self.end()
+        elif isinstance(element, Exercises):
+            self.start("exercises", element.xml_id)
+            self.title(element.title)
+            for exercise in element.exercises:
+                self.blank()
+                self.element(exercise)
+            self.end()
+        elif isinstance(element, Exercise):
+            self.start("exercise")
+            self.paragraphs("statement", element.statement)
+            self.paragraphs("hint", element.hint)
+            self.paragraphs("answer", element.answer)
+            self.paragraphs("solution", element.solution)
+            self.end()
+        elif isinstance(element, Table):
+            self.start("table", element.xml_id)
+            self.title(element.title)
+            self.start("tabular")
+            for header, row in [(True, element.header)] + [(False, r) for r in element.rows]:
+                if header:
+                    self.start("row", header="yes")
+                else:
+                    self.start("row")
+                for cell in row:
+                    self.line(f"<cell>{cell}</cell>")
+                self.end()
+            self.end()
+            self.end()
+        elif isinstance(element, Figure):
+            self.start("figure", element.xml_id)
+            self.line(f"<caption>{element.caption}</caption>")
+            # The image needs its own xml:id to name the generated files
+            self.start("image", f"{element.xml_id}-image", width=element.width)
+            self.start("latex-image")
+            for text in element.latex.splitlines():
+                self.line(text)
+            self.end()
+            self.end()
+            self.end()
+        elif isinstance(element, Include):
+            self.line(f'<xi:include href="{element.href}"/>')
+        else:
+            raise TypeError(f"Cannot write {element!r}")
+
+    def getvalue(self):
+        """Return everything written so far"""
+        return "".join(self.parts)
+
+
+def write_chapter(xml_id, title, elements):
+    """Serialise a chapter from a stream of structured elements
+
+    Returns the ChapterWriter, whose `spans` locate each element by xml:id.
+    """
+    writer = ChapterWriter()
+    writer.write(XML_DECLARATION)
+    writer.start("chapter", xml_id, xmlns_xi=XI_NAMESPACE)
+    writer.title(title)
+    for element in elements:
+        writer.blank()
+        writer.element(element)
+    writer.blank()
+    writer.end()
+    return writer
+
+
+def render_fragment(element):
+    """Serialise one element as a source file of its own, for xi:include"""
+    writer = ChapterWriter()
+    writer.write(XML_DECLARATION)
+    writer.element(element)
+    return writer.getvalue()
+
+
+def element_span(text, xml_id):
+    """Return (start, end) offsets of the whole lines holding the element
+    with this xml:id, found by parsing `text` as XML, or None
+    """
+    data = text.encode("utf-8")
+    parser = xml.parsers.expat.ParserCreate()
+    # Entities such as &nbsp; come from a DTD we do not read; skip them
+    parser.UseForeignDTD(True)
+    found = {}
+    events = [0]
+    open_elements = []
+
+    def start_element(name, attrs):
+        events[0] += 1
+        open_elements.append((attrs.get("xml:id"), parser.CurrentByteIndex, events[0]))
+
+    def end_element(name):
+        element_id, start, seen = open_elements.pop()
+        index = parser.CurrentByteIndex
+        if element_id == xml_id and "span" not in found:
+            # An empty element <x/> ends where expat reports its end
+            if seen == events[0] and data[index - 2:index] == b"/>":
+                found["span"] = (start, index)
+            else:
+                found["span"] = (start, data.index(b">", index) + 1)
+        events[0] += 1
+
+    def character_data(_):
+        events[0] += 1
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    parser.Parse(data, True)
+    if "span" not in found:
+        return None
+    start, end = found["span"]
+    start = data.rfind(b"\n", 0, start) + 1
+    end = data.find(b"\n", end)
+    end = len(data) if end == -1 else end + 1
+    return len(data[:start].decode("utf-8")), len(data[:end].decode("utf-8"))
+
+
+def replace_element(existing, writer, xml_id):
+    """Splice the element with `xml_id`, as serialised by `writer`, into `existing`"""
+    if xml_id not in writer.spans:
+        raise KeyError(f"xml:id {xml_id!r} is not produced by this generator")
+    old_span = element_span(existing, xml_id)
+    if old_span is None:
+        raise KeyError(f"xml:id {xml_id!r} is not in the existing file")
+    start, end = writer.spans[xml_id]
+    return existing[:old_span[0]] + writer.getvalue()[start:end] + existing[old_span[1]:]
+
+
+def add_include(path, href, output, xml_id=None):
+    """
+    xi:include `href` at the end of the element with `xml_id` (by default
+    the root element) unless the file already includes it.
+
+    Writes through `output`, a source_output.SourceOutput. Returns True if
+    the file changed.
+    """
+    path = Path(path)
+    text = path.read_text(encoding="utf-8")
+    if f'href="{href}"' in text:
+        return False
+    if xml_id is None:
+        end = text.rindex("</")
+        indent = "  "
+    else:
+        span = element_span(text, xml_id)
+        if span is None:
+            raise KeyError(f"xml:id {xml_id!r} is not in {path}")
+        end = text.rindex("</", span[0], span[1])
+        opening = text[span[0]:]
+        indent = opening[:len(opening) - len(opening.lstrip())] + "  "
+    line_start = text.rindex("\n", 0, end) + 1
+    include = f'{indent}<xi:include href="{href}"/>\n'
+    # Keep a blank line between the include and its neighbours
+    if text[:line_start].endswith("\n\n"):
+        include += "\n"
+    else:
+        include = "\n" + include
+    return output.write(path, text[:line_start] + include + text[line_start:])
+
+
+def update_chapter(path, writer, xml_id=None, output=None):
+    """
+    Write a generated chapter, or just the element with `xml_id` from it.
+
+    `writer` is the ChapterWriter returned by write_chapter. `output` is an
+    optional source_output.SourceOutput that records the result. Returns
+    True if the file on disk changed.
+    """
+    path = Path(path)
+    if xml_id is None:
+        content = writer.getvalue()
+    else:
+        content = replace_element(path.read_text(encoding="utf-8"), writer, xml_id)
+    if output is not None:
+        return output.write(path, content)
+    return write_if_changed(path, content)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Persistent dependency graph of the LC Maths source tree
+Records the xi:include edges from main.ptx, where every xml:id is defined
+(file and line), which output page and knowls it ends up in, and which
+xrefs point at it. The graph is kept in .build-cache/depgraph.json and
+updated by re-scanning only the files whose size or mtime changed, so
+"what must be rebuilt or redeployed if this file changes?" is answered
+in milliseconds.
+"""
+
+import argparse
+import json
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from ptx_source import MAIN_FILE, PUBLICATION_FILE
+from source_output import write_if_changed
+from validator import scan_file
+
+GRAPH_FILE = Path(".build-cache") / "depgraph.json"
+GRAPH_VERSION = 1
+
+# Elements that get their own page at each chunking level, used when there
+# is no built output to read the page list from
+PAGE_TAGS = {
+    0: {"book", "article"},
+    1: {"frontmatter", "backmatter", "preface", "chapter", "appendix", "index"},
+    2: {"section", "exercises", "worksheet", "references", "solutions"},
+}
+
+
+def chunking_level(project_dir):
+    """Chunking level from publication.ptx (PreTeXt's default is 0)"""
+    path = Path(project_dir) / PUBLICATION_FILE
+    if not path.exists():
+        return 0
+    node = ET.parse(path).getroot().find("common/chunking")
+    return int(node.get("level", 0)) if node is not None else 0
+
+
+class DependencyGraph:
+    """Include, definition, output and cross-reference edges of the book"""
+
+    def __init__(self, project_dir):
+        self.project_dir = Path(project_dir).resolve()
+        self.path = self.project_dir / GRAPH_FILE
+        self.files = {}
+        self.rescanned = []
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except ValueError:
+                data = {}
+            if data.get("version") == GRAPH_VERSION:
+                self.files = data["files"]
+
+    def relative(self, path):
+        return Path(path).resolve().relative_to(self.project_dir).as_posix()
+
+    def update(self):
+        """Re-scan files that changed since the last update; return their names"""
+        files = {}
+        self.rescanned = []
+
+        def visit(path, include_parent):
+            rel = self.relative(path)
+            if rel in files:
+                return
+            stat = path.stat()
+            entry = self.files.get(rel)
+            if entry is None or entry["stat"] != [stat.st_mtime_ns, stat.st_size]:
+                entry = self.scan(path, stat)
+                self.rescanned.append(rel)
+            entry["include_parent"] = include_parent
+            files[rel] = entry
+            for href, parent in entry["includes"]:
+                target = path.parent / href
+                if target.is_file():
+                    visit(target.resolve(), parent)
+
+        visit((self.project_dir / MAIN_FILE).resolve(), None)
+        changed = self.rescanned or set(files) != set(self.files)
+        self.files = files
+        if changed:
+            self.save()
+        return self.rescanned
+
+    def scan(self, path, stat):
+        """Graph entry for one source file"""
+        scan = scan_file(path)
+        return {
+            "stat": [stat.st_mtime_ns, stat.st_size],
+            "ids": [[xml_id, line, tag, parent] for xml_id, line, tag, parent in scan.ids],
+            "xrefs": [[target, line, parent] for target, line, parent in scan.xrefs],
+            "includes": [[href, parent] for href, _, parse, parent in scan.includes
+                         if parse == "xml" and href],
+            "error": str(scan.error) if scan.error else None,
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": GRAPH_VERSION, "files": self.files}
+        write_if_changed(self.path, json.dumps(data, separators=(",", ":")))
+
+    # Derived indexes
+
+    def definitions(self):
+        """xml:id -> (file, line, tag, parent xml:id across files)"""
+        index = {}
+        for rel, entry in self.files.items():
+            for xml_id, line, tag, parent in entry["ids"]:
+                index[xml_id] = (rel, line, tag, parent or entry["include_parent"])
+        return index
+
+    def output_pages(self, definitions):
+        """Names (without .html) of the ids that get their own page"""
+        web_dir = self.project_dir / "output" / "web"
+        built = {path.stem for path in web_dir.glob("*.html")}
+        if built:
+            return {xml_id for xml_id in definitions if xml_id in built}
+        level = chunking_level(self.project_dir)
+        tags = set().union(*(PAGE_TAGS[n] for n in PAGE_TAGS if n <= level))
+        return {xml_id for xml_id, (_, _, tag, _) in definitions.items() if tag in tags}
+
+    def knowl_files(self):
+        """Knowl file names in the output, loose or packed into bundles"""
+        knowl_dir = self.project_dir / "output" / "web" / "knowl"
+        names = {path.name for path in knowl_dir.glob("*.html")}
+        index = knowl_dir / "bundle-index.json"
+        if index.exists():
+            names |= set(json.loads(index.read_text(encoding="utf-8"))["knowls"])
+        return names
+
+    def page_of(self, xml_id, definitions, pages):
+        """Output page (xml:id) an element is rendered on"""
+        while xml_id is not None:
+            if xml_id in pages:
+                return xml_id
+            xml_id = definitions[xml_id][3] if xml_id in definitions else None
+        return None
+
+    def referrers(self):
+        """Target xml:id -> [(file, line, xml:id enclosing the xref)]"""
+        index = {}
+        for rel, entry in self.files.items():
+            for target, line, parent in entry["xrefs"]:
+                index.setdefault(target, []).append(
+                    (rel, line, parent or entry["include_parent"]))
+        return index
+
+    def lookup(self, xml_id):
+        """Everything known about one xml:id, or None"""
+        definitions = self.definitions()
+        if xml_id not in definitions:
+            return None
+        pages = self.output_pages(definitions)
+        knowls = self.knowl_files()
+        rel, line, tag, _ = definitions[xml_id]
+        return {
+            "xml_id": xml_id,
+            "tag": tag,
+            "file": rel,
+            "line": line,
+            "page": self.page_of(xml_id, definitions, pages),
+            "knowls": sorted(name for name in (f"{xml_id}.html", f"{xml_id}-hidden.html")
+                             if name in knowls),
+            "referenced_by": [
+                {"file": f, "line": n, "page": self.page_of(p, definitions, pages)}
+                for f, n, p in self.referrers().get(xml_id, [])
+            ],
+        }
+
+    def affected(self, paths):
+        """What to rebuild and redeploy if the given source files change"""
+        definitions = self.definitions()
+        pages = self.output_pages(definitions)
+        knowls = self.knowl_files()
+        referrers = self.referrers()
+        rebuild, out_pages, out_knowls, xref_pages = set(), set(), set(), set()
+        for path in paths:
+            rel = self.relative(path)
+            entry = self.files.get(rel)
+            if entry is None:
+                raise KeyError(f"{path} is not part of the book")
+            if entry["include_parent"] is None:
+                # main.ptx itself: docinfo, titles and structure affect everything
+                rebuild.add("full")
+                out_pages |= pages
+                out_knowls |= knowls
+                continue
+            ids = [xml_id for xml_id, _, _, _ in entry["ids"]]
+            if ids:
+                rebuild.add(ids[0])
+            for xml_id in ids:
+                page = self.page_of(xml_id, definitions, pages)
+                if page:
+                    out_pages.add(page)
+                out_knowls |= {name for name in (f"{xml_id}.html", f"{xml_id}-hidden.html")
+                               if name in knowls}
+                # Pages quoting this element's number or title in an xref
+                for source, _, parent in referrers.get(xml_id, []):
+                    if self.files[source]["ids"]:
+                        rebuild.add(self.files[source]["ids"][0][0])
+                    page = self.page_of(parent, definitions, pages)
+                    if page:
+                        xref_pages.add(page)
+        return {
+            "rebuild": sorted(rebuild),
+            "pages": sorted(page + ".html" for page in out_pages | xref_pages),
+            "xref_pages": sorted(page + ".html" for page in xref_pages - out_pages),
+            "knowls": sorted(out_knowls),
+        }
+
+
+def load_graph(project_dir):
+    """Load the persisted graph and bring it up to date"""
+    graph = DependencyGraph(project_dir)
+    graph.update()
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the source dependency graph")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("update", help="re-scan changed files")
+    affected = sub.add_parser("affected", help="what to rebuild if these files change")
+    affected.add_argument("files", nargs="+")
+    lookup = sub.add_parser("id", help="where an xml:id is defined, rendered and used")
+    lookup.add_argument("xml_id")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    graph = load_graph(args.project_dir)
+    if args.command == "update":
+        result = {"files": len(graph.files), "rescanned": graph.rescanned}
+    elif args.command == "affected":
+        try:
+            result = graph.affected(args.files)
+        except KeyError as error:
+            print(f"Error: {error.args[0]}")
+            return 1
+    else:
+        result = graph.lookup(args.xml_id)
+        if result is None:
+            print(f"Error: unknown xml:id '{args.xml_id}'")
+            return 1
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    for key, value in result.items():
+        if isinstance(value, list):
+            print(f"{key}:")
+            for item in value:
+                if isinstance(item, dict):
+                    item = f"{item['file']}:{item['line']} (page {item['page']})"
+                print(f"  {item}")
+        else:
+            print(f"{key}: {value}")
+    print(f"({elapsed * 1000:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Local server for the LC Maths web build
+Serves output/web (and the PDFs in output/print under /print/) from one
+asyncio event loop, so a whole class can browse the book from one teacher
+machine. Responses carry strong ETags from content hashes and answer
+revalidation with 304; fingerprinted assets get long-lived Cache-Control;
+range requests are supported for the large PDFs; precompressed .br/.gz
+sidecars are used when the client accepts them. In watch mode it also
+pushes live-reload messages to open pages over a websocket.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import mimetypes
+import re
+import sys
+import webbrowser
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+LIVERELOAD_PATH = "/__livereload"
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Precompressed sidecars written by web_compress.py, in order of preference
+SIDECAR_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Names like pretext.3f9a0c1b.css or index-5e6f7a8b9c.js never change content
+FINGERPRINT_RE = re.compile(r"[.-][0-9a-f]{8,}\.\w+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+KEEP_ALIVE_TIMEOUT = 15
+
+RELOAD_SCRIPT = """<script>
+(function () {
+  var ws = new WebSocket("ws://" + location.host + "%s");
+  ws.onmessage = function (event) {
+    var msg = JSON.parse(event.data);
+    var page = location.pathname.replace(/^\\//, "") || "index.html";
+    if (msg.reload === "all" || (msg.changed || []).indexOf(page) !== -1) {
+      location.reload();
+    }
+  };
+})();
+</script>
+""" % LIVERELOAD_PATH
+
+
+def websocket_frame(text):
+    """Encode a single unmasked websocket text frame"""
+    payload = text.encode("utf-8")
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x81, length])
+    elif length < 65536:
+        header = bytes([0x81, 126]) + length.to_bytes(2, "big")
+    else:
+        header = bytes([0x81, 127]) + length.to_bytes(8, "big")
+    return header + payload
+
+
+def parse_range(header, size):
+    """Parse a single `bytes=` range; return (start, end) inclusive, None, or 'invalid'"""
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+class ETagCache:
+    """Content-hash ETags, recomputed only when a file's size or mtime changes"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, path):
+        stat = path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.entries.get(path)
+        if cached is None or cached[0] != key:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            cached = (key, '"' + digest.hexdigest()[:32] + '"')
+            self.entries[path] = cached
+        return cached[1]
+
+
+class DevServer:
+    """Caching static file server with optional live reload"""
+
+    def __init__(self, root, host="127.0.0.1", port=8128, live_reload=False, mounts=None):
+        self.root = Path(root).resolve()
+        self.host = host
+        self.port = port
+        self.live_reload = live_reload
+        # URL prefix -> directory, e.g. {"/print/": output/print}
+        self.mounts = {prefix: Path(path).resolve() for prefix, path in (mounts or {}).items()}
+        self.etags = ETagCache()
+        self.clients = set()
+        self.server = None
+
+    async def start(self):
+        """Start listening"""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Serving {self.root} at http://{self.host}:{self.port}/")
+
+    async def serve_forever(self):
+        """Start listening and serve until cancelled"""
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def broadcast(self, message):
+        """Send a JSON message to every connected live-reload client"""
+        frame = websocket_frame(json.dumps(message))
+        for writer in list(self.clients):
+            try:
+                writer.write(frame)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self.clients.discard(writer)
+
+    async def notify_changed(self, pages):
+        """Reload the open pages that are in `pages`, or everything for assets"""
+        if not pages:
+            return
+        if any(not page.endswith(".html") for page in pages):
+            await self.broadcast({"reload": "all"})
+        else:
+            await self.broadcast({"changed": sorted(pages)})
+
+    async def read_request(self, reader):
+        """Read a request line and headers, or None on EOF"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 3:
+            return None
+        return parts[0], parts[1], parts[2], headers
+
+    async def handle(self, reader, writer):
+        """Handle one connection, serving requests until it closes"""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader),
+                                                     KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return
+                if request is None:
+                    return
+                method, target, version, headers = request
+                path = unquote(urlsplit(target).path)
+                if path == LIVERELOAD_PATH and headers.get("upgrade", "").lower() == "websocket":
+                    await self.handle_websocket(reader, writer, headers)
+                    return
+                keep_alive = (version == "HTTP/1.1"
+                              and headers.get("connection", "").lower() != "close")
+                if method not in ("GET", "HEAD"):
+                    await self.send_error(writer, 405, "Method Not Allowed", keep_alive)
+                else:
+                    await self.send_file(writer, method, path, headers, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if writer not in self.clients:
+                writer.close()
+
+    async def handle_websocket(self, reader, writer, headers):
+        """Complete the websocket handshake and hold the connection open"""
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+        ).decode("ascii")
+        writer.write(
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept.encode("ascii") + b"\r\n\r\n"
+        )
+        await writer.drain()
+        self.clients.add(writer)
+        try:
+            # Clients never send anything we need; wait for close or EOF
+            while True:
+                header = await reader.readexactly(2)
+                length = header[1] & 0x7F
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(await reader.readexactly(8), "big")
+                if header[1] & 0x80:
+                    length += 4
+                await reader.readexactly(length)
+                if header[0] & 0x0F == 0x8:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def resolve(self, path):
+        """Map a URL path to a file under root or a mount, or None"""
+        root, rel = self.root, path
+        for prefix, directory in self.mounts.items():
+            if path.startswith(prefix):
+                root, rel = directory, path[len(prefix):]
+                break
+        candidate = (root / rel.lstrip("/")).resolve()
+        if candidate != root and root not in candidate.parents:
+            return None
+        if candidate.is_dir():
+            candidate = candidate / "index.html"
+        return candidate if candidate.is_file() else None
+
+    def negotiate(self, filepath, headers):
+        """Pick a precompressed sidecar the client accepts, if one is fresh"""
+        accepted = {
+            token.split(";")[0].strip()
+            for token in headers.get("accept-encoding", "").split(",")
+        }
+        for encoding, suffix in SIDECAR_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            sidecar = filepath.with_name(filepath.name + suffix)
+            if sidecar.is_file() and sidecar.stat().st_mtime >= filepath.stat().st_mtime:
+                return encoding, sidecar
+        return None, filepath
+
+    async def send_file(self, writer, method, path, headers, keep_alive):
+        """Send a static file, honouring If-None-Match, Range and Accept-Encoding"""
+        filepath = self.resolve(path)
+        if filepath is None:
+            await self.send_error(writer, 404, "Not Found", keep_alive)
+            return
+        content_type = mimetypes.guess_type(filepath.name)[0] or "application/octet-stream"
+        response_headers = {
+            "Content-Type": content_type,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": IMMUTABLE if FINGERPRINT_RE.search(filepath.name) else REVALIDATE,
+        }
+
+        if self.live_reload and content_type == "text/html":
+            # Injected pages are never cached: they change with every rebuild
+            body = filepath.read_bytes()
+            body = body.replace(b"</body>", RELOAD_SCRIPT.encode("utf-8") + b"</body>", 1)
+            response_headers["Cache-Control"] = "no-store"
+            response_headers["Content-Length"] = str(len(body))
+            await self.send_response(writer, 200, "OK", response_headers,
+                                     body if method == "GET" else b"", keep_alive)
+            return
+
+        range_header = headers.get("range")
+        encoding = None
+        if range_header is None:
+            encoding, filepath = self.negotiate(filepath, headers)
+        etag = self.etags.get(filepath)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+            etag = etag[:-1] + "-" + encoding + '"'
+        response_headers["ETag"] = etag
+        response_headers["Accept-Ranges"] = "bytes"
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match == "*" or etag in
+                              [tag.strip() for tag in if_none_match.split(",")]):
+            await self.send_response(writer, 304, "Not Modified", response_headers,
+                                     b"", keep_alive)
+            return
+
+        size = filepath.stat().st_size
+        start, end = 0, size - 1
+        status, reason = 200, "OK"
+        if range_header is not None and headers.get("if-range", etag) == etag:
+            requested = parse_range(range_header, size)
+            if requested == "invalid":
+                response_headers["Content-Range"] = f"bytes */{size}"
+                await self.send_error(writer, 416, "Range Not Satisfiable", keep_alive,
+                                      response_headers)
+                return
+            if requested is not None:
+                start, end = requested
+                status, reason = 206, "Partial Content"
+                response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response_headers["Content-Length"] = str(end - start + 1 if size else 0)
+        await self.send_response(writer, status, reason, response_headers, b"", keep_alive)
+        if method == "GET" and size:
+            await self.stream_file(writer, filepath, start, end)
+
+    async def stream_file(self, writer, filepath, start, end):
+        """Write bytes start..end of a file in chunks without blocking the loop"""
+        loop = asyncio.get_running_loop()
+        with open(filepath, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await loop.run_in_executor(None, f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+                remaining -= len(chunk)
+
+    async def send_error(self, writer, status, reason, keep_alive=False, headers=None):
+        """Send a plain-text error response"""
+        body = f"{status} {reason}\n".encode("utf-8")
+        headers = dict(headers or {})
+        headers.update({
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Length": str(len(body)),
+        })
+        await self.send_response(writer, status, reason, headers, body, keep_alive)
+
+    async def send_response(self, writer, status, reason, headers, body, keep_alive=False):
+        """Write an HTTP/1.1 response head (and body, if given)"""
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+def serve(project_dir, host="127.0.0.1", port=8128, open_browser=True, page=""):
+    """Serve output/web (and output/print under /print/) until Ctrl+C, opening `page`"""
+    project_dir = Path(project_dir)
+    root = project_dir / "output" / "web"
+    if not root.exists():
+        print(f"Error: {root} does not exist - build the web target first")
+        return 1
+    mounts = {}
+    if (project_dir / "output" / "print").exists():
+        mounts["/print/"] = project_dir / "output" / "print"
+    server = DevServer(root, host, port, mounts=mounts)
+    if open_browser:
+        browse_host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+        webbrowser.open(f"http://{browse_host}:{port}/{page}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print()
+        print("Server stopped.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the built book")
+    parser.add_argument("project_dir", nargs="?", default=".")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="use 0.0.0.0 to serve other machines, e.g. a classroom")
+    parser.add_argument("--port", type=int, default=8128)
+    parser.add_argument("--no-browser", action="store_true")
+    args = parser.parse_args()
+    return serve(args.project_dir, args.host, args.port, not args.no_browser)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
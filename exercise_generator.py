@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Parametric exercise generator for the LC Maths strand chapters
+An exercise template declares integer parameter ranges, vectorised
+formulas for its answers and a vectorised "nice answer" predicate. Whole
+batches of candidates are drawn with NumPy, filtered in one pass and
+de-duplicated, so thousands of variants cost milliseconds; only the final
+variants are formatted into PreTeXt <exercise>/<solution> blocks.
+
+Each template is written to source/<chapter>/generated/<name>.ptx as an
+<exercises> division and xi:included at the end of its chapter. Variants
+are seeded, so a rerun with the same settings leaves the files untouched.
+
+Needs the optional `numpy` package.
+"""
+
+import argparse
+import sys
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from chapter_writer import Exercise, Exercises, add_include, render_fragment
+from source_output import SourceOutput
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GENERATED_DIR = "generated"
+DEFAULT_COUNT = 40
+MAX_ROUNDS = 12
+MAX_BATCH = 1 << 20
+
+
+@dataclass
+class Template:
+    """A family of exercises generated from integer parameters
+
+    `params` maps each parameter to an inclusive (low, high) range.
+    `solve` and `nice` work on whole batches: they receive a dict of NumPy
+    arrays and return derived arrays / a boolean mask. `render` formats one
+    variant, given as a dict of plain ints, into an Exercise.
+    """
+    name: str
+    chapter: str
+    title: str
+    params: Dict[str, Tuple[int, int]]
+    solve: Callable
+    nice: Callable
+    render: Callable
+
+
+# Formatting helpers for the render functions
+
+def term(coefficient, variable):
+    """A linear term such as 3x, -x or x"""
+    if coefficient == 1:
+        return variable
+    if coefficient == -1:
+        return f"-{variable}"
+    return f"{coefficient}{variable}"
+
+
+def linear(coefficient, constant, variable="x"):
+    """A linear expression such as 3x - 5"""
+    text = term(coefficient, variable)
+    if constant > 0:
+        text += f" + {constant}"
+    elif constant < 0:
+        text += f" - {-constant}"
+    return text
+
+
+def product(first, last):
+    """first × (first-1) × ... × last, as LaTeX"""
+    return " \\times ".join(str(n) for n in range(first, last - 1, -1))
+
+
+def factorial_table(n):
+    """0!, 1!, ..., n! as an int64 array (exact up to 20!)"""
+    return np.concatenate(([1], np.cumprod(np.arange(1, n + 1, dtype=np.int64))))
+
+
+# Algebra: linear equations with the unknown on both sides
+
+def solve_linear(p):
+    denominator = p["a"] - p["c"]
+    numerator = p["d"] - p["b"]
+    safe = np.where(denominator == 0, 1, denominator)
+    return {"x": numerator // safe, "remainder": numerator % safe}
+
+
+def nice_linear(p):
+    return ((p["a"] != p["c"]) & (p["a"] != 0) & (p["c"] != 0) & (p["remainder"] == 0)
+            & (p["x"] != 0) & (np.abs(p["x"]) <= 12))
+
+
+def render_linear(v):
+    a, b, c, d, x = v["a"], v["b"], v["c"], v["d"], v["x"]
+    left, right = a - c, d - b
+    solution = [
+        "Collect the <m>x</m> terms on the left and the numbers on the right:\n"
+        f"<me>{term(left, 'x')} = {right}</me>"
+    ]
+    if left != 1:
+        solution.append(f"Divide both sides by <m>{left}</m>: <m>x = {x}</m>.")
+    solution.append(f"Check: <m>{a}({x}) {'+' if b >= 0 else '-'} {abs(b)} = {a * x + b}</m> and "
+                    f"<m>{c}({x}) {'+' if d >= 0 else '-'} {abs(d)} = {c * x + d}</m>.")
+    return Exercise(
+        statement=[f"Solve <m>{linear(a, b)} = {linear(c, d)}</m>."],
+        answer=[f"<m>x = {x}</m>"],
+        solution=solution,
+    )
+
+
+# Counting: factorials and arrangements
+
+FACTORIAL_LIMIT = 12
+
+ARRANGEMENT_CONTEXTS = [
+    ("different books", "be arranged on a shelf"),
+    ("people", "stand in a queue"),
+    ("different coloured flags", "be flown one above the other on a pole"),
+    ("students", "sit in a row of chairs"),
+    ("different letters", "be arranged to make a code"),
+]
+
+
+def solve_factorials(p):
+    table = factorial_table(FACTORIAL_LIMIT)
+    return {"value": table[p["n"]] // table[np.clip(p["m"], 0, FACTORIAL_LIMIT)]}
+
+
+def nice_factorials(p):
+    return (p["m"] < p["n"]) & (p["n"] - p["m"] <= 4) & (p["value"] <= 100000)
+
+
+def render_factorials(v):
+    n, m, value = v["n"], v["m"], v["value"]
+    return Exercise(
+        statement=[f"Evaluate <m>\\dfrac{{{n}!}}{{{m}!}}</m> without a calculator."],
+        hint=[f"Write <m>{n}!</m> as <m>{product(n, m + 1)} \\times {m}!</m>."],
+        answer=[f"<m>{value}</m>"],
+        solution=[f"<m>\\dfrac{{{n}!}}{{{m}!}} = {product(n, m + 1)} = {value}</m>"],
+    )
+
+
+def solve_arrangements(p):
+    table = factorial_table(FACTORIAL_LIMIT)
+    return {"value": table[p["n"]] // table[np.clip(p["n"] - p["r"], 0, FACTORIAL_LIMIT)]}
+
+
+def nice_arrangements(p):
+    return (p["r"] <= p["n"]) & (p["value"] <= 50000)
+
+
+def render_arrangements(v):
+    n, r, value = v["n"], v["r"], v["value"]
+    things, action = ARRANGEMENT_CONTEXTS[v["context"]]
+    if r == n:
+        statement = f"In how many ways can <m>{n}</m> {things} {action}?"
+    else:
+        statement = f"In how many ways can <m>{r}</m> of <m>{n}</m> {things} {action}?"
+    return Exercise(
+        statement=[statement],
+        answer=[f"<m>{value}</m>"],
+        solution=[
+            f"There are <m>{n}</m> choices for the first place, <m>{n - 1}</m> for the "
+            f"second, and so on down to <m>{n - r + 1}</m> for place <m>{r}</m>:\n"
+            f"<me>{product(n, n - r + 1)} = {value}</me>"
+        ],
+    )
+
+
+# Number: laws of indices
+
+def solve_indices(p):
+    index = np.where(p["form"] == 0, p["m"] + p["n"] - p["p"], p["m"] * p["n"] - p["p"])
+    return {"index": index, "value": np.power(p["base"], np.clip(index, 0, 16))}
+
+
+def nice_indices(p):
+    return (p["index"] >= 2) & (p["value"] <= 1000)
+
+
+def render_indices(v):
+    base, m, n, p, index, value = v["base"], v["m"], v["n"], v["p"], v["index"], v["value"]
+    if v["form"] == 0:
+        expression = f"{base}^{{{m}}} \\times {base}^{{{n}}} \\div {base}^{{{p}}}"
+        step = (f"Add the indices when multiplying and subtract when dividing: "
+                f"<m>{base}^{{{m} + {n} - {p}}} = {base}^{{{index}}}</m>.")
+    else:
+        expression = f"({base}^{{{m}}})^{{{n}}} \\div {base}^{{{p}}}"
+        step = (f"Multiply the indices for a power of a power, then subtract when dividing: "
+                f"<m>{base}^{{{m} \\times {n} - {p}}} = {base}^{{{index}}}</m>.")
+    return Exercise(
+        statement=[f"Write <m>{expression}</m> as a single power of <m>{base}</m>, "
+                   f"and hence evaluate it."],
+        answer=[f"<m>{base}^{{{index}}} = {value}</m>"],
+        solution=[step, f"<m>{base}^{{{index}}} = {value}</m>"],
+    )
+
+
+TEMPLATES = {template.name: template for template in [
+    Template("linear-equations", "algebra", "Practice: Linear Equations",
+             {"a": (-9, 9), "b": (-20, 20), "c": (-9, 9), "d": (-20, 20)},
+             solve_linear, nice_linear, render_linear),
+    Template("factorials", "stats-probability", "Practice: Factorials",
+             {"n": (3, FACTORIAL_LIMIT), "m": (1, FACTORIAL_LIMIT - 1)},
+             solve_factorials, nice_factorials, render_factorials),
+    Template("arrangements", "stats-probability", "Practice: Arrangements",
+             {"n": (3, 10), "r": (2, 6), "context": (0, len(ARRANGEMENT_CONTEXTS) - 1)},
+             solve_arrangements, nice_arrangements, render_arrangements),
+    Template("indices", "number", "Practice: Indices",
+             {"form": (0, 1), "base": (2, 5), "m": (2, 9), "n": (2, 9), "p": (1, 9)},
+             solve_indices, nice_indices, render_indices),
+]}
+
+
+def generate(template, count, seed=0):
+    """
+    Draw up to `count` distinct nice variants of a template.
+
+    Returns (variants, draws): a dict of arrays (parameters and derived
+    values) of equal length, and the number of candidates drawn.
+    """
+    # The template name is part of the seed so templates do not share streams
+    rng = np.random.default_rng([seed, zlib.crc32(template.name.encode())])
+    names = list(template.params)
+    batch = max(4 * count, 1024)
+    pool = np.empty((0, len(names)), dtype=np.int64)
+    draws = 0
+    for _ in range(MAX_ROUNDS):
+        candidates = {name: rng.integers(low, high + 1, size=batch, dtype=np.int64)
+                      for name, (low, high) in template.params.items()}
+        candidates.update(template.solve(candidates))
+        draws += batch
+        rows = np.column_stack([candidates[name] for name in names])[template.nice(candidates)]
+        before = len(pool)
+        pool = np.concatenate([pool, rows])
+        # Distinct rows, kept in the order they were drawn
+        _, first = np.unique(pool, axis=0, return_index=True)
+        pool = pool[np.sort(first)]
+        if len(pool) >= count or len(pool) == before:
+            # Enough, or a whole batch brought nothing new: the nice variants are used up
+            break
+        batch = min(2 * batch, MAX_BATCH)
+    pool = pool[:count]
+    variants = {name: pool[:, column] for column, name in enumerate(names)}
+    variants.update(template.solve(variants))
+    return variants, draws
+
+
+def render_exercises(template, variants):
+    """The <exercises> division for a batch of variants"""
+    names = list(variants)
+    rows = zip(*(variants[name].tolist() for name in names))
+    exercises = [template.render(dict(zip(names, row))) for row in rows]
+    return Exercises(f"{template.name}-practice", template.title, exercises)
+
+
+def generated_includes(chapter_dir):
+    """hrefs of the generated exercise files for a chapter, for chapter generators"""
+    return [f"{GENERATED_DIR}/{path.name}"
+            for path in sorted((Path(chapter_dir) / GENERATED_DIR).glob("*.ptx"))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate parametric practice exercises")
+    parser.add_argument("templates", nargs="*",
+                        help=f"templates to generate (default: all of {', '.join(TEMPLATES)})")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="variants per template")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="generate and time the variants without writing any files")
+    args = parser.parse_args()
+    unknown = [name for name in args.templates if name not in TEMPLATES]
+    if unknown:
+        parser.error(f"unknown template(s): {', '.join(unknown)}")
+    if np is None:
+        print("Error: the exercise generator needs `pip install numpy`")
+        return 1
+
+    project_dir = Path(args.project_dir)
+    output = SourceOutput(project_dir)
+    for name in args.templates or TEMPLATES:
+        template = TEMPLATES[name]
+        started = time.perf_counter()
+        variants, draws = generate(template, args.count, args.seed)
+        division = render_exercises(template, variants)
+        elapsed = time.perf_counter() - started
+        found = len(division.exercises)
+        print(f"{name}: {found} variant(s) from {draws} draw(s) in {elapsed * 1000:.0f} ms")
+        if found < args.count:
+            print(f"  only {found} distinct nice variant(s) exist for these parameter ranges")
+        if args.dry_run:
+            continue
+        chapter_dir = project_dir / "source" / template.chapter
+        href = f"{GENERATED_DIR}/{name}.ptx"
+        output.write(chapter_dir / href, render_fragment(division))
+        add_include(chapter_dir / "chapter.ptx", href, output)
+    if not args.dry_run:
+        output.save()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
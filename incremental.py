@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Incremental web builds for LC Maths
+Keeps a manifest of content hashes for main.ptx, each chapter (with the
+files it includes) and the publication file, and only rebuilds the
+chapters that changed since the last successful build.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from depgraph import load_graph
+from ptx_source import (
+    MAIN_FILE,
+    PUBLICATION_FILE,
+    chapter_files,
+    docinfo_text,
+    file_hash,
+    main_without_docinfo,
+    root_xml_id,
+    text_hash,
+    tree_hash,
+)
+
+CACHE_DIR = Path(".build-cache")
+MANIFEST_NAME = "incremental-{target}.json"
+
+
+def manifest_path(project_dir, target="web"):
+    """Return the manifest file for a target"""
+    return Path(project_dir) / CACHE_DIR / MANIFEST_NAME.format(target=target)
+
+
+def snapshot(project_dir):
+    """Hash everything an incremental build depends on"""
+    project_dir = Path(project_dir)
+    chapters = {}
+    for path in chapter_files(project_dir):
+        rel = path.relative_to(project_dir.resolve()).as_posix()
+        chapters[rel] = {"hash": tree_hash(path), "xml_id": root_xml_id(path)}
+    return {
+        "docinfo": text_hash(docinfo_text(project_dir)),
+        "main": text_hash(main_without_docinfo(project_dir)),
+        "publication": file_hash(project_dir / PUBLICATION_FILE),
+        "chapters": chapters,
+    }
+
+
+def load_manifest(project_dir, target="web"):
+    """Load the manifest from the last successful build, or None"""
+    path = manifest_path(project_dir, target)
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(project_dir, state, target="web"):
+    """Record the state of a successful build"""
+    path = manifest_path(project_dir, target)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def changed_chapters(old, new):
+    """Return the xml:ids of chapters whose content hash changed"""
+    return [
+        info["xml_id"]
+        for rel, info in new["chapters"].items()
+        if old["chapters"].get(rel, {}).get("hash") != info["hash"]
+    ]
+
+
+def plan_build(project_dir, target="web"):
+    """
+    Work out what needs rebuilding.
+
+    Returns (reason, builds, state) where builds is a list of pretext
+    argument tuples (empty when the output is up to date) and state is the
+    snapshot to save once they all succeed.
+    """
+    project_dir = Path(project_dir)
+    state = snapshot(project_dir)
+    full = [("build", target, "--no-generate")]
+    old = load_manifest(project_dir, target)
+
+    if old is None:
+        return "no previous build manifest", full, state
+    if not (project_dir / "output" / target).exists():
+        return f"output/{target} is missing", full, state
+    if old.get("docinfo") != state["docinfo"]:
+        return "docinfo macros or preambles changed", full, state
+    if old.get("publication") != state["publication"]:
+        return "publication settings changed", full, state
+    if old.get("main") != state["main"]:
+        return f"{MAIN_FILE.as_posix()} changed", full, state
+    if set(old.get("chapters", {})) != set(state["chapters"]):
+        return "chapter list changed", full, state
+
+    changed = changed_chapters(old, state)
+    if not changed:
+        return "up to date", [], state
+    if None in changed:
+        return "a changed chapter has no xml:id", full, state
+
+    # Chapters with xrefs into a changed chapter quote its numbers and titles
+    changed_paths = [project_dir / rel for rel, info in state["chapters"].items()
+                     if info["xml_id"] in changed]
+    referring = [xml_id for xml_id in load_graph(project_dir).affected(changed_paths)["rebuild"]
+                 if xml_id not in changed]
+    reason = f"changed: {', '.join(changed)}"
+    if referring:
+        reason += f" (xrefs from: {', '.join(referring)})"
+    builds = [("build", target, "--no-generate", "-x", xml_id) for xml_id in changed + referring]
+    return reason, builds, state
+
+
+def run_incremental(run, project_dir, target="web"):
+    """
+    Run an incremental build through run(*pretext_args) -> returncode.
+
+    The manifest is only updated when every step succeeds, so a failed
+    chapter is rebuilt again next time.
+    """
+    reason, builds, state = plan_build(project_dir, target)
+    print(f"Incremental build ({target}): {reason}")
+    if not builds:
+        print("✓ Nothing to rebuild")
+        return 0
+    for args in builds:
+        returncode = run(*args)
+        if returncode != 0:
+            return returncode
+    save_manifest(project_dir, state, target)
+    return 0
+
+
+def record_full_build(project_dir, target="web"):
+    """Save the manifest after a full build made outside run_incremental"""
+    save_manifest(project_dir, snapshot(project_dir), target)
+
+
+def main():
+    """Print the incremental build plan without building anything"""
+    project_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path.cwd()
+    reason, builds, _ = plan_build(project_dir)
+    print(f"Reason: {reason}")
+    for args in builds:
+        print("  pretext " + " ".join(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
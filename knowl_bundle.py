@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Pack the per-paragraph knowl files of output/web into per-chapter bundles
+Each knowl's body is stored once, without the repeated head and banner,
+in a bundle per chapter with an offset index. Every bundle has a .gz
+sidecar, which devserver.py (and any server that honours precompressed
+files) sends with Content-Encoding: gzip, so the browser decompresses it
+and the client needs no decoder of its own. A small client script
+(knowl-bundle.js) serves knowl requests from the bundles, so a page makes
+one request per chapter instead of one per knowl.
+"""
+
+import argparse
+import gzip
+import json
+import re
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from ptx_source import XML_ID, chapter_files
+from source_output import write_if_changed
+
+INDEX_NAME = "bundle-index.json"
+BUNDLE_NAME = "bundle-{chapter}.bin"
+CLIENT_NAME = "knowl-bundle.js"
+FALLBACK_CHAPTER = "book"
+
+BODY_RE = re.compile(r'<body(?: class="([^"]*)")?>\n?(.*?)</body>', re.DOTALL)
+INCONTEXT_RE = re.compile(r'<span class="incontext"><a href="([^"#]+)')
+KNOWL_REF_RE = re.compile(r'data-knowl="(?:\./)?knowl/([^"]+)"')
+
+CLIENT_JS = r"""// Serves PreTeXt knowl requests from the bundles written by knowl_bundle.py
+(function () {
+  var base = document.currentScript.src.replace(/[^\/]*$/, "");
+  var index = null;
+  var bundles = {};
+
+  function loadIndex() {
+    if (!index) {
+      index = fetch(base + "knowl/bundle-index.json").then(function (r) { return r.json(); });
+    }
+    return index;
+  }
+
+  function loadBundle(name) {
+    if (!bundles[name]) {
+      bundles[name] = fetch(base + "knowl/" + name).then(function (r) {
+        if (!r.ok) { throw new Error(name + ": " + r.status); }
+        return r.arrayBuffer();
+      });
+    }
+    return bundles[name];
+  }
+
+  function knowlName(url) {
+    var match = /(?:^|\/)knowl\/([^\/?#]+\.html)/.exec(url);
+    return match ? match[1] : null;
+  }
+
+  // Resolve a knowl URL to a full HTML document, or null to use the file
+  function knowlHtml(url) {
+    var name = knowlName(url);
+    if (!name) { return Promise.resolve(null); }
+    return loadIndex().then(function (idx) {
+      var entry = idx.knowls[name];
+      if (!entry) { return null; }
+      return loadBundle(idx.bundles[entry[0]]).then(function (data) {
+        var body = new TextDecoder().decode(new Uint8Array(data, entry[1], entry[2]));
+        return '<!DOCTYPE html><html><head><meta charset="UTF-8"></head>' +
+          '<body class="' + idx.body_classes[entry[3]] + '">' + body + "</body></html>";
+      });
+    }).catch(function () { return null; });
+  }
+
+  var open = XMLHttpRequest.prototype.open;
+  var send = XMLHttpRequest.prototype.send;
+  var setRequestHeader = XMLHttpRequest.prototype.setRequestHeader;
+
+  XMLHttpRequest.prototype.open = function (method, url) {
+    if (knowlName(String(url))) {
+      this._knowl = { args: Array.prototype.slice.call(arguments), headers: [] };
+      return;
+    }
+    this._knowl = null;
+    return open.apply(this, arguments);
+  };
+
+  XMLHttpRequest.prototype.setRequestHeader = function (name, value) {
+    if (this._knowl) { this._knowl.headers.push([name, value]); return; }
+    return setRequestHeader.apply(this, arguments);
+  };
+
+  XMLHttpRequest.prototype.send = function (body) {
+    var xhr = this;
+    var pending = xhr._knowl;
+    if (!pending) { return send.apply(xhr, arguments); }
+    knowlHtml(String(pending.args[1])).then(function (html) {
+      if (html !== null) {
+        pending.args[1] = URL.createObjectURL(new Blob([html], { type: "text/html" }));
+      }
+      open.apply(xhr, pending.args);
+      pending.headers.forEach(function (h) { setRequestHeader.apply(xhr, h); });
+      send.call(xhr, body);
+    });
+  };
+
+  var originalFetch = window.fetch;
+  window.fetch = function (input, init) {
+    var url = typeof input === "string" ? input : input.url;
+    if (!knowlName(url)) { return originalFetch.apply(this, arguments); }
+    return knowlHtml(url).then(function (html) {
+      if (html === null) { return originalFetch(input, init); }
+      return new Response(html, { headers: { "Content-Type": "text/html" } });
+    });
+  };
+
+  // Fetch this page's chapter bundle up front
+  loadIndex().then(function (idx) {
+    var page = location.pathname.split("/").pop() || "index.html";
+    var bundle = idx.pages[page];
+    if (bundle !== undefined) { loadBundle(idx.bundles[bundle]); }
+  });
+})();
+"""
+
+
+def bundle_chapter(bundle_name):
+    """Chapter xml:id of a bundle file name"""
+    prefix, suffix = BUNDLE_NAME.split("{chapter}")
+    return bundle_name[len(prefix):-len(suffix)]
+
+
+def page_chapters(project_dir):
+    """Map output page names (xml:id + .html) to the chapter they belong to"""
+    pages = {}
+    for path in chapter_files(project_dir):
+        root = ET.parse(path).getroot()
+        chapter = root.get(XML_ID)
+        for elem in root.iter():
+            if elem.get(XML_ID):
+                pages[elem.get(XML_ID) + ".html"] = chapter
+    return pages
+
+
+def read_knowls(knowl_dir):
+    """Return {name: (body class, body html, in-context page)} for loose knowl files"""
+    knowls = {}
+    for path in sorted(Path(knowl_dir).glob("*.html")):
+        text = path.read_text(encoding="utf-8")
+        match = BODY_RE.search(text)
+        if match is None:
+            continue
+        incontext = INCONTEXT_RE.search(text)
+        knowls[path.name] = (match.group(1) or "", match.group(2),
+                             incontext.group(1) if incontext else None)
+    return knowls
+
+
+def assign_chapters(knowls, pages):
+    """Chapter for each knowl: via its in-context page, else via a knowl that opens it"""
+    chapters = {}
+    for name, (_, _, page) in knowls.items():
+        if page is not None:
+            chapters[name] = pages.get(page, FALLBACK_CHAPTER)
+    # Hidden knowls (solutions, hints, ...) have no in-context link; inherit
+    # the chapter of whichever knowl references them, repeating for chains
+    changed = True
+    while changed:
+        changed = False
+        for name, (_, body, _) in knowls.items():
+            if name not in chapters:
+                continue
+            for ref in KNOWL_REF_RE.findall(body):
+                if ref in knowls and ref not in chapters:
+                    chapters[ref] = chapters[name]
+                    changed = True
+    for name in knowls:
+        chapters.setdefault(name, FALLBACK_CHAPTER)
+    return chapters
+
+
+def load_index(knowl_dir):
+    """Load an existing bundle index, or None"""
+    path = Path(knowl_dir) / INDEX_NAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def inject_script(web_dir, script_name, marker="</head>"):
+    """Add a <script> for `script_name` before `marker` on every page that lacks
+    it; return pages changed. Shared with search_index.py."""
+    tag = f'<script src="{script_name}"></script>'
+    changed = 0
+    for page in Path(web_dir).glob("*.html"):
+        text = page.read_text(encoding="utf-8")
+        if tag in text or marker not in text:
+            continue
+        write_if_changed(page, text.replace(marker, tag + "\n" + marker, 1))
+        changed += 1
+    return changed
+
+
+def pack_knowls(project_dir, web_dir=None, keep_files=False):
+    """
+    Pack loose knowl files into per-chapter bundles.
+
+    Bundles of chapters with loose knowl files (i.e. rebuilt since the
+    last pack) are rewritten: the loose files replace their entries, and
+    the entries that were not regenerated are carried over, since an
+    incremental build only writes the knowls of the chapters it rebuilt.
+    Bundles of other chapters are kept as they are. Unless keep_files is
+    set, the loose files are removed once the bundles and index are written.
+    """
+    project_dir = Path(project_dir)
+    web_dir = Path(web_dir) if web_dir else project_dir / "output" / "web"
+    knowl_dir = web_dir / "knowl"
+    knowls = read_knowls(knowl_dir)
+    if not knowls:
+        print("No loose knowl files to pack.")
+        return 0
+
+    chapters = assign_chapters(knowls, page_chapters(project_dir))
+    old = load_index(knowl_dir) or {"bundles": [], "body_classes": [], "knowls": {},
+                                    "pages": {}}
+    rebuilt = set(chapters.values())
+
+    # Keep entries of chapters that were not rebuilt, and the bodies of
+    # knowls in rebuilt chapters that this build did not regenerate
+    bundle_names = []
+    entries = {}
+    pages = {}
+    body_classes = []
+    carried = {}
+    old_data = {}
+    for name, (bundle, offset, length, body_class) in old["knowls"].items():
+        bundle_name = old["bundles"][bundle]
+        chapter = bundle_chapter(bundle_name)
+        if chapter in rebuilt:
+            if name not in knowls:
+                if bundle_name not in old_data:
+                    path = knowl_dir / bundle_name
+                    old_data[bundle_name] = path.read_bytes() if path.exists() else None
+                if old_data[bundle_name] is not None:
+                    carried[name] = (chapter, old["body_classes"][body_class],
+                                     old_data[bundle_name][offset:offset + length])
+            continue
+        if bundle_name not in bundle_names:
+            bundle_names.append(bundle_name)
+        body_class = old["body_classes"][body_class]
+        if body_class not in body_classes:
+            body_classes.append(body_class)
+        entries[name] = [bundle_names.index(bundle_name), offset, length,
+                         body_classes.index(body_class)]
+    raw_bytes = packed_bytes = 0
+    for chapter in sorted(rebuilt):
+        bundle_name = BUNDLE_NAME.format(chapter=chapter)
+        bundle_names.append(bundle_name)
+        number = len(bundle_names) - 1
+        contents = {name: (body_class, body)
+                    for name, (source, body_class, body) in carried.items() if source == chapter}
+        for name in (n for n, c in chapters.items() if c == chapter):
+            body_class, body, page = knowls[name]
+            contents[name] = (body_class, body.encode("utf-8"))
+            if page is not None:
+                pages[page] = number
+            raw_bytes += (knowl_dir / name).stat().st_size
+        data = bytearray()
+        for name, (body_class, body) in sorted(contents.items()):
+            # Knowls from different kinds of page keep their own body class
+            if body_class not in body_classes:
+                body_classes.append(body_class)
+            entries[name] = [number, len(data), len(body), body_classes.index(body_class)]
+            data += body
+        compressed = gzip.compress(bytes(data), compresslevel=9, mtime=0)
+        packed_bytes += len(compressed)
+        write_if_changed(knowl_dir / bundle_name, bytes(data))
+        write_if_changed(knowl_dir / (bundle_name + ".gz"), compressed)
+
+    # Pages keep their bundle, at its new position in the list
+    for page, bundle in old["pages"].items():
+        bundle_name = old["bundles"][bundle]
+        if page not in pages and bundle_name in bundle_names:
+            pages[page] = bundle_names.index(bundle_name)
+
+    index = {
+        "body_classes": body_classes,
+        "bundles": bundle_names,
+        "knowls": entries,
+        "pages": pages,
+    }
+    write_if_changed(knowl_dir / INDEX_NAME, json.dumps(index, separators=(",", ":")))
+    write_if_changed(web_dir / CLIENT_NAME, CLIENT_JS)
+    injected = inject_script(web_dir, CLIENT_NAME)
+
+    if not keep_files:
+        for name in knowls:
+            (knowl_dir / name).unlink()
+
+    print(f"Packed {len(knowls)} knowl(s) into {len(rebuilt)} bundle(s): "
+          f"{raw_bytes / 1024:.0f} KB -> {packed_bytes / 1024:.0f} KB")
+    if injected:
+        print(f"Added {CLIENT_NAME} to {injected} page(s)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack knowl files into per-chapter bundles")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--web-dir", help="built web output (default: output/web)")
+    parser.add_argument("--keep-files", action="store_true",
+                        help="keep the individual knowl files as a compatibility output")
+    args = parser.parse_args()
+    return pack_knowls(args.project_dir, args.web_dir, args.keep_files)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Precompiled LaTeX formats for the LC Maths preambles
+Loading tikz and pgfplots (and the rest of the book's packages) is most of
+the start-up time of every LaTeX run. This dumps those packages into a
+format file once and reuses it, keyed on the preamble text and the TeX
+installation (engine version and the installed base format), so a new
+package or a TeX Live update rebuilds it automatically.
+
+Two kinds of format are made:
+
+- a preload format, named like the engine's own format (pdflatex.fmt) so
+  every run that finds it through TEXFORMATS starts with the packages
+  already loaded - used for `pretext generate latex-image`, whose LaTeX
+  runs we do not control;
+- a preamble format made with mylatexformat from the book's own preamble,
+  used by print_parallel.py, which skips the dumped part of the preamble.
+
+The preamble format only speeds up the parallel print build
+(`lcmaths.py build print --parallel-print`). A plain `pretext build print`
+runs LaTeX itself on a preamble it writes during the build, so it cannot
+start from a format dumped in advance.
+
+Formats reach the LaTeX runs through TEXFORMATS in the `env=` of the child
+process (see format_env); this process's own environment is never changed.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from ptx_source import text_hash
+
+FORMAT_DIR = Path(".build-cache") / "latex-format"
+PACKAGE_RE = re.compile(r"^\s*\\usepackage(\[[^\]]*\])?\{([^}]*)\}", re.M)
+# Commands that open files or write to them; they cannot be dumped
+UNDUMPABLE_RE = re.compile(r"^\s*\\(?:makeindex|makeglossaries|printindex|newwrite)\b", re.M)
+END_OF_DUMP = "\\csname endofdump\\endcsname"
+
+
+def tex_version(engine="pdflatex"):
+    """Identify the TeX installation: engine banner plus the base format's size and mtime"""
+    if shutil.which(engine) is None:
+        return None
+    banner = subprocess.run([engine, "--version"], capture_output=True, text=True)
+    version = banner.stdout.splitlines()[0] if banner.stdout else ""
+    if shutil.which("kpsewhich") is None:
+        return version
+    env = dict(os.environ)
+    env.pop("TEXFORMATS", None)
+    found = subprocess.run(["kpsewhich", f"-engine={engine.replace('latex', 'tex')}",
+                            f"{engine}.fmt"], capture_output=True, text=True, env=env)
+    base = found.stdout.strip()
+    if base and Path(base).exists():
+        stat = Path(base).stat()
+        version += f" {base} {stat.st_size} {stat.st_mtime_ns}"
+    return version
+
+
+def package_lines(preamble):
+    """The \\usepackage lines of a preamble, as \\RequirePackage lines"""
+    return [
+        f"\\RequirePackage{options or ''}{{{names}}}"
+        for options, names in PACKAGE_RE.findall(preamble)
+    ]
+
+
+def format_slot(project_dir, name, key):
+    """Directory for one format version; older versions of the same name are removed"""
+    root = Path(project_dir) / FORMAT_DIR
+    slot = root / f"{name}-{key[:16]}"
+    if root.exists():
+        for old in root.glob(f"{name}-*"):
+            if old != slot:
+                shutil.rmtree(old, ignore_errors=True)
+    return slot
+
+
+def dump(engine, slot, jobname, args, cwd):
+    """Run the engine in ini mode; return True if the format was written"""
+    slot.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ)
+    env.pop("TEXFORMATS", None)
+    cmd = [engine, "-ini", "-interaction=nonstopmode", f"-jobname={jobname}",
+           f"-output-directory={slot.resolve()}", f"&{engine}"] + args
+    result = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True,
+                            errors="replace")
+    fmt = slot / f"{jobname}.fmt"
+    if result.returncode != 0 or not fmt.exists():
+        print(f"Format {jobname} could not be dumped; see {slot / (jobname + '.log')}")
+        fmt.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def preload_format(project_dir, name, preamble, engine="pdflatex"):
+    """
+    Directory holding an <engine>.fmt with the preamble's packages preloaded.
+
+    Returns None when there is no TeX installation, nothing to preload, or
+    the packages cannot be loaded before \\documentclass.
+    """
+    version = tex_version(engine)
+    lines = package_lines(preamble)
+    if version is None or not lines:
+        return None
+    slot = format_slot(project_dir, name, text_hash("\n".join(lines + [version])))
+    if (slot / f"{engine}.fmt").exists():
+        return slot
+    source = slot / "preload.tex"
+    slot.mkdir(parents=True, exist_ok=True)
+    source.write_text("\n".join(lines) + "\n\\dump\n", encoding="utf-8")
+    print(f"Dumping {name} format ({len(lines)} package line(s))...")
+    return slot if dump(engine, slot, engine, [source.name], slot) else None
+
+
+def mark_dump_point(preamble):
+    """Insert the end-of-dump marker after the last package, before anything undumpable"""
+    packages = list(PACKAGE_RE.finditer(preamble))
+    if not packages:
+        return None
+    point = preamble.index("\n", packages[-1].end()) + 1
+    undumpable = UNDUMPABLE_RE.search(preamble)
+    if undumpable and undumpable.start() < point:
+        point = undumpable.start()
+    return preamble[:point] + END_OF_DUMP + "\n" + preamble[point:]
+
+
+def preamble_format(project_dir, name, tex_path, engine="pdflatex"):
+    """
+    Dump the dumpable part of a document's preamble with mylatexformat.
+
+    The document must already contain the end-of-dump marker (see
+    mark_dump_point). Returns (directory, format name) or None.
+    """
+    tex_path = Path(tex_path)
+    version = tex_version(engine)
+    text = tex_path.read_text(encoding="utf-8")
+    if version is None or END_OF_DUMP not in text:
+        return None
+    dumped = text[:text.index(END_OF_DUMP)]
+    key = text_hash(dumped + version)
+    slot = format_slot(project_dir, name, key)
+    if (slot / f"{name}.fmt").exists():
+        return slot, name
+    print(f"Dumping {name} format from the {tex_path.name} preamble...")
+    if not dump(engine, slot, name, ["mylatexformat.ltx", tex_path.name], tex_path.parent):
+        return None
+    return slot, name
+
+
+def format_env(directory, env=None):
+    """Environment in which TeX finds formats in `directory` before the system ones"""
+    env = dict(os.environ if env is None else env)
+    # A trailing separator keeps the default search path after ours
+    env["TEXFORMATS"] = f"{Path(directory).resolve()}{os.pathsep}{env.get('TEXFORMATS', '')}"
+    return env
+
+
+def main():
+    """Build (or confirm) the latex-image preload format"""
+    from latex_image_cache import docinfo_parts
+
+    parser = argparse.ArgumentParser(description="Dump precompiled LaTeX formats")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--engine", default="pdflatex")
+    args = parser.parse_args()
+    preamble, _ = docinfo_parts(args.project_dir)
+    slot = preload_format(args.project_dir, "latex-image", preamble, args.engine)
+    if slot is None:
+        print("No latex-image format (no TeX installation or no packages to preload)")
+        return 1
+    print(f"latex-image format: {slot / (args.engine + '.fmt')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for generated latex-image assets (TikZ/pgfplots)
+Each <latex-image> is keyed by a hash of its source, the latex-image
+preamble and the docinfo macros. Cached images are restored into
+generated-assets/latex-image and only new or changed images are sent to
+`pretext generate latex-image`, with the preamble's packages preloaded
+from a precompiled format (see latex_format.py).
+"""
+
+import copy
+import json
+import shutil
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from latex_format import format_env, preload_format
+from ptx_source import MAIN_FILE, XML_ID, chapter_files, source_tree, text_hash
+
+CACHE_DIR = Path(".build-cache") / "latex-image"
+ASSET_DIR = Path("generated-assets") / "latex-image"
+MAX_CACHE_BYTES = 500 * 1024 * 1024
+
+
+def docinfo_parts(project_dir):
+    """Return (latex-image preamble, macros) text from main.ptx docinfo"""
+    root = ET.parse(Path(project_dir) / MAIN_FILE).getroot()
+    docinfo = root.find("docinfo")
+    if docinfo is None:
+        return "", ""
+    preamble = docinfo.findtext("latex-image-preamble") or ""
+    macros = docinfo.findtext("macros") or ""
+    return preamble.strip(), macros.strip()
+
+
+def image_name(elem, parent):
+    """Name PreTeXt uses for the generated files: @label, else the xml:id"""
+    for node in (elem, parent):
+        if node is None:
+            continue
+        for attr in ("label", XML_ID):
+            if node.get(attr):
+                return node.get(attr)
+    return None
+
+
+def image_id(elem, parent):
+    """The xml:id `pretext generate -x` accepts for an image (never a @label)"""
+    for node in (elem, parent):
+        if node is not None and node.get(XML_ID):
+            return node.get(XML_ID)
+    return None
+
+
+def latex_images(root):
+    """Return [(name, xml:id, source text)] for every <latex-image> under `root`"""
+    images = []
+    parents = {child: parent for parent in root.iter() for child in parent}
+    for elem in root.iter("latex-image"):
+        # Without the text that follows the element, which is not part of the image
+        bare = copy.copy(elem)
+        bare.tail = None
+        source = ET.tostring(bare, encoding="unicode")
+        parent = parents.get(elem)
+        images.append((image_name(elem, parent), image_id(elem, parent), source))
+    return images
+
+
+def find_latex_images(project_dir):
+    """Return [(name, xml:id, source text)] for every <latex-image> in the book"""
+    project_dir = Path(project_dir)
+    images = []
+    files = [project_dir / MAIN_FILE]
+    for chapter in chapter_files(project_dir):
+        files += source_tree(chapter)
+    for path in files:
+        images += latex_images(ET.parse(path).getroot())
+    return images
+
+
+class LatexImageCache:
+    """Persistent store of generated image files, evicted least recently used"""
+
+    def __init__(self, project_dir, max_bytes=MAX_CACHE_BYTES):
+        self.project_dir = Path(project_dir)
+        self.root = self.project_dir / CACHE_DIR
+        self.asset_dir = self.project_dir / ASSET_DIR
+        self.index_path = self.root / "index.json"
+        self.max_bytes = max_bytes
+        self.index = {}
+        if self.index_path.exists():
+            try:
+                self.index = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except ValueError:
+                self.index = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def key(self, source, preamble, macros):
+        """Cache key for one image"""
+        return text_hash("\0".join((source, preamble, macros)))
+
+    def restore(self, key, name):
+        """Copy cached files for `key` into generated-assets; False on a miss"""
+        entry = self.index.get(key)
+        entry_dir = self.root / key
+        if entry is None or not entry_dir.is_dir():
+            return False
+        self.asset_dir.mkdir(parents=True, exist_ok=True)
+        for cached in entry_dir.iterdir():
+            target = self.asset_dir / (name + cached.suffix)
+            if not target.exists() or target.read_bytes() != cached.read_bytes():
+                shutil.copy2(cached, target)
+        entry["last_used"] = time.time()
+        return True
+
+    def store(self, key, name):
+        """Copy freshly generated files for `name` into the cache"""
+        outputs = sorted(self.asset_dir.glob(name + ".*")) if self.asset_dir.exists() else []
+        if not outputs:
+            return
+        entry_dir = self.root / key
+        if entry_dir.exists():
+            shutil.rmtree(entry_dir)
+        entry_dir.mkdir(parents=True)
+        size = 0
+        for output in outputs:
+            shutil.copy2(output, entry_dir / ("image" + output.suffix))
+            size += output.stat().st_size
+        self.index[key] = {"name": name, "size": size, "last_used": time.time()}
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        total = sum(entry["size"] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.root / key, ignore_errors=True)
+            del self.index[key]
+            total -= entry["size"]
+            self.evictions += 1
+
+    def save(self):
+        """Write the index"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path.write_text(json.dumps(self.index, indent=2), encoding="utf-8")
+
+    def report(self):
+        """Print hit/miss/eviction counts"""
+        print(f"latex-image cache: {self.hits} hit(s), {self.misses} miss(es), "
+              f"{self.evictions} eviction(s)")
+
+
+def generate_latex_images(run, project_dir, target="web", images=None):
+    """
+    Generate latex-image assets through the cache.
+
+    `run(*pretext_args, env=None)` runs pretext (in `env`, if given) and
+    returns its exit code. `images` limits this to some of the book's
+    images, as returned by latex_images (default: all of them). Images
+    without a @label or xml:id cannot be matched to their output files, and
+    images without an xml:id cannot be generated on their own with -x, so
+    if a missing image is either, the whole latex-image set is regenerated.
+    """
+    cache = LatexImageCache(project_dir)
+    preamble, macros = docinfo_parts(project_dir)
+    missing = []
+    unnamed = False
+    if images is None:
+        images = find_latex_images(project_dir)
+    for name, xml_id, source in images:
+        key = cache.key(source, preamble, macros)
+        if name is None:
+            unnamed = True
+            cache.misses += 1
+        elif cache.restore(key, name):
+            cache.hits += 1
+        else:
+            cache.misses += 1
+            missing.append((name, xml_id, key))
+            unnamed = unnamed or xml_id is None
+
+    def generate(env=None):
+        if unnamed:
+            return run("generate", "latex-image", "-t", target, env=env)
+        for _, xml_id, _ in missing:
+            returncode = run("generate", "latex-image", "-t", target, "-x", xml_id, env=env)
+            if returncode != 0:
+                return returncode
+        return 0
+
+    returncode = 0
+    if unnamed or missing:
+        # tikz and pgfplots come preloaded from a dumped format when TeX allows it
+        format_dir = preload_format(project_dir, "latex-image", preamble)
+        returncode = generate(format_env(format_dir) if format_dir is not None else None)
+        if returncode != 0 and format_dir is not None:
+            print("Retrying without the precompiled format...")
+            returncode = generate()
+
+    if returncode == 0:
+        for name, _, key in missing:
+            cache.store(key, name)
+    cache.evict()
+    cache.save()
+    cache.report()
+    return returncode
+
+
+def main():
+    """List latex-images and whether each is already cached"""
+    project_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path.cwd()
+    cache = LatexImageCache(project_dir)
+    preamble, macros = docinfo_parts(project_dir)
+    images = find_latex_images(project_dir)
+    for name, _, source in images:
+        key = cache.key(source, preamble, macros)
+        state = "cached" if key in cache.index else "missing"
+        print(f"  {name or '(no label or xml:id)'}: {state}")
+    print(f"{len(images)} latex-image(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
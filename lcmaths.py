@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Command-line entry point for building the LC Maths book
+One non-interactive command for every build task, for scripts and build
+hosts as well as the desk:
+
+    python lcmaths.py build [web|print|all] [--full] [--parallel-print] [--no-cache]
+                            [--profile]
+    python lcmaths.py preview [xml:id]
+    python lcmaths.py view | watch | validate | bench | clean
+
+The project is the --project-dir option, else $LCMATHS_PROJECT_DIR, else
+the nearest directory at or above the current one holding project.ptx.
+The interpreter that has pretext installed is --python, else
+$PRETEXT_PYTHON, else the one running this script.
+
+Build modules are imported only by the subcommands that use them, so
+`--help` and `validate` load little beyond argparse. Exit codes: 0
+success, 1 failure, 2 usage or configuration error, 130 interrupted.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ENV = "LCMATHS_PROJECT_DIR"
+PYTHON_ENV = "PRETEXT_PYTHON"
+PROJECT_MARKER = "project.ptx"
+BUILD_TARGETS = ("web", "print", "all")
+
+# What `clean` removes, by option
+CLEAN_PATHS = {
+    "cache": [Path(".build-cache")],
+    "assets": [Path("generated-assets")],
+    "output": [Path("output") / "web", Path("output") / "print", Path("output") / "latex"],
+}
+
+
+class ConfigError(Exception):
+    """The project or interpreter could not be found"""
+
+
+def find_project_dir(explicit=None):
+    """The project directory, from the argument, the environment or the working directory"""
+    candidate = explicit or os.environ.get(PROJECT_ENV)
+    if candidate:
+        path = Path(candidate).expanduser()
+        if not (path / PROJECT_MARKER).exists():
+            raise ConfigError(f"{PROJECT_MARKER} not found in {path}")
+        return path
+    cwd = Path.cwd()
+    for path in [cwd, *cwd.parents]:
+        if (path / PROJECT_MARKER).exists():
+            return path
+    raise ConfigError(f"no {PROJECT_MARKER} in the current directory or above "
+                      f"(set {PROJECT_ENV} to the project)")
+
+
+def pretext_python(explicit=None):
+    """The interpreter with pretext installed, from the argument or the environment"""
+    python = explicit or os.environ.get(PYTHON_ENV) or sys.executable
+    if Path(python).is_file():
+        return python
+    import shutil
+    if shutil.which(python) is None:
+        raise ConfigError(f"Python interpreter not found: {python}")
+    return python
+
+
+def pretext_runner(python, project_dir, profile=False, fail_fast=True):
+    """A run(*args, env=None) for pretext subcommands that records (and optionally
+    profiles) builds"""
+    from build_runner import pretext_command, run_build, stream_command
+
+    def run(*args, env=None):
+        cmd = pretext_command(python, *args)
+        print(f"Running: {' '.join(cmd)}")
+        if args[0] == "build":
+            return run_build(cmd, project_dir, args[1], profile=profile,
+                             fail_fast=fail_fast, env=env)["returncode"]
+        return stream_command(cmd, cwd=project_dir, env=env)
+
+    return run
+
+
+def build_web(args, run):
+    """Incremental web build, or a full one with cached latex-image generation"""
+    if not args.full:
+        from incremental import run_incremental
+        return run_incremental(run, args.project_dir)
+    from incremental import record_full_build
+    from latex_image_cache import generate_latex_images
+    returncode = generate_latex_images(run, args.project_dir)
+    if returncode == 0:
+        returncode = run("build", "web", "--no-generate")
+    if returncode == 0:
+        record_full_build(args.project_dir)
+    return returncode
+
+
+def build_outputs(args, targets):
+    """Run pretext for the targets that were not restored from the output cache"""
+    run = pretext_runner(args.python, args.project_dir, args.profile, not args.keep_going)
+    if targets == {"web", "print"} and not args.parallel_print and not args.full:
+        # Release build: one pretext process per target, side by side
+        from build_runner import build_targets
+        return build_targets(args.python, args.project_dir, profile=args.profile,
+                             fail_fast=not args.keep_going)
+    returncode = 0
+    if "web" in targets:
+        returncode = build_web(args, run)
+    if returncode == 0 and "print" in targets:
+        if args.parallel_print:
+            from print_parallel import build_print_parallel
+            returncode = build_print_parallel(args.python, args.project_dir)
+        else:
+            returncode = run("build", "print")
+    return returncode
+
+
+def cache_options(args, target):
+    """Settings besides the inputs that shape a cached target"""
+    if target == "print":
+        # The merged chapter-by-chapter PDF is not the same file as `build print`'s
+        return ["parallel-print"] if args.parallel_print else []
+    if args.no_post:
+        return ["no-post"]
+    return ["math" if args.math else "no-math"]
+
+
+def fully_built(args, targets):
+    """The targets build_outputs builds in full, the only ones worth caching"""
+    release = targets == {"web", "print"} and not args.parallel_print
+    # An incremental web build sits on top of the old output/web
+    return {target for target in targets if target == "print" or args.full or release}
+
+
+def cmd_build(args):
+    unknown = sorted(set(args.targets) - set(BUILD_TARGETS))
+    if unknown:
+        print(f"Error: unknown target {', '.join(unknown)} "
+              f"(choose from {', '.join(BUILD_TARGETS)})", file=sys.stderr)
+        return 2
+    targets = {"web", "print"} if "all" in args.targets else set(args.targets)
+    if not args.no_validate:
+        from validator import check_source
+        if check_source(args.project_dir) != 0:
+            print("✗ Source validation failed - not building")
+            return 1
+    cache = None
+    remaining = set(targets)
+    # A profile needs pretext to actually run
+    if not args.no_cache and not args.profile:
+        from incremental import record_full_build
+        from output_cache import OutputCache, build_key
+        cache = OutputCache()
+        # Keyed before building, so an edit made during the build is not cached
+        keys = {target: build_key(args.project_dir, args.python, target,
+                                  cache_options(args, target)) for target in targets}
+        for target in sorted(targets):
+            if cache.restore(keys[target], args.project_dir, target):
+                print(f"✓ {target}: restored from the output cache ({cache.root})")
+                if target == "web":
+                    record_full_build(args.project_dir)
+                remaining.discard(target)
+    returncode = build_outputs(args, remaining) if remaining else 0
+    # A restored web tree is already post-processed
+    if returncode == 0 and "web" in remaining and not args.no_post:
+        from post_build import run_post_build
+        returncode = run_post_build(args.project_dir, math=args.math)
+    if returncode == 0 and cache is not None:
+        for target in sorted(fully_built(args, remaining)):
+            cache.store(keys[target], args.project_dir, target)
+    print("✓ Build successful" if returncode == 0 else "✗ Build failed")
+    return returncode
+
+
+def cmd_view(args):
+    from devserver import serve
+    return serve(args.project_dir, args.host, args.port, not args.no_browser)
+
+
+def cmd_preview(args):
+    if args.xml_id is None:
+        from preview import serve_on_demand
+        return serve_on_demand(args.project_dir, args.python, args.host, args.port)
+    from preview import preview
+    return preview(args.project_dir, args.python, args.xml_id, args.host, args.port,
+                   not args.no_browser)
+
+
+def cmd_watch(args):
+    from watch import watch
+    return watch(args.project_dir, args.python, args.debounce, args.port, args.math)
+
+
+def cmd_validate(args):
+    from validator import check_source
+    return check_source(args.project_dir)
+
+
+def cmd_bench(args):
+    from benchmark import DEFAULT_SIZES, bench, parse_size
+    sizes = [parse_size(size) for size in args.sizes] if args.sizes else DEFAULT_SIZES
+    return bench(args.project_dir, args.python, sizes, args.targets, args.generate_only)
+
+
+def cmd_clean(args):
+    import shutil
+    kinds = ["cache"]
+    if args.assets or args.all:
+        kinds.append("assets")
+    if args.output or args.all:
+        kinds.append("output")
+    for kind in kinds:
+        for rel in CLEAN_PATHS[kind]:
+            path = args.project_dir / rel
+            if not path.exists():
+                continue
+            print(f"{'Would remove' if args.dry_run else 'Removing'} {rel.as_posix()}/")
+            if not args.dry_run:
+                shutil.rmtree(path)
+    return 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="lcmaths", description="Build, view and check the LC Maths book")
+    parser.add_argument("--project-dir", help=f"project root (default: ${PROJECT_ENV}, "
+                        f"else the nearest directory with {PROJECT_MARKER})")
+    parser.add_argument("--python", help=f"interpreter with pretext installed "
+                        f"(default: ${PYTHON_ENV}, else this one)")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    build = sub.add_parser("build", help="validate, build and post-process targets")
+    # Checked in cmd_build: argparse rejects a list default that is not in choices
+    build.add_argument("targets", nargs="*", default=["web"], metavar="target",
+                       help="web, print or all (default: web)")
+    build.add_argument("--full", action="store_true",
+                       help="full web build with latex-image generation (default: incremental)")
+    build.add_argument("--parallel-print", action="store_true",
+                       help="build the PDF chapter by chapter in parallel")
+    build.add_argument("--no-cache", action="store_true",
+                       help="always run pretext, without the whole-output cache")
+    build.add_argument("--profile", action="store_true",
+                       help="profile each pretext build (implies --no-cache; "
+                       "see build_profile.py)")
+    build.add_argument("--keep-going", action="store_true",
+                       help="do not stop a build at its first fatal error")
+    build.add_argument("--no-validate", action="store_true", help="skip source validation")
+    build.add_argument("--no-post", action="store_true", help="skip the post-build stages")
+    build.add_argument("--math", action="store_true",
+                       help="prerender math to SVG (default: MathJax in the browser)")
+    build.set_defaults(handler=cmd_build)
+
+    view = sub.add_parser("view", help="serve the built book")
+    view.add_argument("--host", default="127.0.0.1")
+    view.add_argument("--port", type=int, default=8128)
+    view.add_argument("--no-browser", action="store_true")
+    view.set_defaults(handler=cmd_view)
+
+    preview = sub.add_parser("preview", help="build and view one section by xml:id")
+    preview.add_argument("xml_id", nargs="?",
+                         help="division to preview (default: serve every division on demand)")
+    preview.add_argument("--host", default="127.0.0.1")
+    preview.add_argument("--port", type=int, default=8128)
+    preview.add_argument("--no-browser", action="store_true")
+    preview.set_defaults(handler=cmd_preview)
+
+    watch = sub.add_parser("watch", help="rebuild on save with live reload")
+    watch.add_argument("--debounce", type=float, default=0.3)
+    watch.add_argument("--port", type=int, default=8128)
+    watch.add_argument("--math", action="store_true", help="prerender math to SVG after each rebuild")
+    watch.set_defaults(handler=cmd_watch)
+
+    validate = sub.add_parser("validate", help="check the source tree")
+    validate.set_defaults(handler=cmd_validate)
+
+    bench = sub.add_parser("bench", help="benchmark builds of synthetic books")
+    bench.add_argument("--sizes", nargs="+", metavar="CxS",
+                       help="book sizes as CHAPTERSxSECTIONS (default: 5x4 ... 20x25)")
+    bench.add_argument("--targets", nargs="+", default=["web", "print"])
+    bench.add_argument("--generate-only", action="store_true")
+    bench.set_defaults(handler=cmd_bench)
+
+    clean = sub.add_parser("clean", help="remove build caches (and optionally output)")
+    clean.add_argument("--assets", action="store_true", help="also remove generated-assets/")
+    clean.add_argument("--output", action="store_true", help="also remove output/web, print, latex")
+    clean.add_argument("--all", action="store_true", help="remove all of the above")
+    clean.add_argument("--dry-run", action="store_true", help="list what would be removed")
+    clean.set_defaults(handler=cmd_clean)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        args.project_dir = find_project_dir(args.project_dir)
+        args.python = pretext_python(args.python)
+    except ConfigError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 2
+    try:
+        return args.handler(args)
+    except KeyboardInterrupt:
+        print()
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Prerender the math in the LC Maths web output to inline SVG
+Every inline and display expression MathJax would typeset in the browser
+is rendered once at build time, with PreTeXt's own macros (\\lt \\gt
+\\amp) and the docinfo macros (\\N \\Z \\Q \\R \\C) defined. Results
+are kept in a persistent cache keyed by (TeX, display mode, macro set),
+so a rebuild only renders expressions that are new.
+Pages whose math (and the knowls they open) is fully prerendered no longer
+load MathJax at all; a small stub stands in for it, because PreTeXt's own
+scripts still call MathJax.typesetPromise after opening a knowl. The cache
+is bounded in size and drops the least recently used expressions first.
+
+Rendering needs Node.js and the `mathjax-full` package
+(`npm install mathjax-full` in the project directory); without them this
+stage is skipped and MathJax typesets in the browser as before.
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from latex_image_cache import docinfo_parts
+from ptx_source import text_hash
+from source_output import write_if_changed
+
+CACHE_DIR = Path(".build-cache") / "math"
+CACHE_NAME = "svg-cache.json"
+STATUS_NAME = "knowl-status.json"
+STYLESHEET_NAME = "prerendered-math.css"
+STYLESHEET_TAG = f'<link href="{STYLESHEET_NAME}" rel="stylesheet" type="text/css">'
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+CACHE_VERSION = 2
+
+INLINE_RE = re.compile(r'<span class="process-math">\\\((.*?)\\\)</span>', re.DOTALL)
+DISPLAY_RE = re.compile(r'<div class="displaymath process-math"([^>]*)>(.*?)</div>', re.DOTALL)
+MACROS_DIV_RE = re.compile(r'<div id="latex-macros".*?</div>', re.DOTALL)
+UNRENDERED_RE = re.compile(r'class="[^"]*\bprocess-math\b')
+KNOWL_REF_RE = re.compile(r'data-knowl="(?:\./)?knowl/([^"]+)"')
+# Defined by PreTeXt's MathJax configuration for <, > and & in source math
+PRETEXT_MACROS = r"\newcommand{\lt}{<}\newcommand{\gt}{>}\newcommand{\amp}{&}"
+MATHJAX_CONFIG_RE = re.compile(r"<script>window\.MathJax = \{.*?</script>", re.DOTALL)
+MATHJAX_SCRIPT_RE = re.compile(r'<script src="[^"]*mathjax[^"]*"></script>', re.IGNORECASE)
+# Stands in for MathJax on fully prerendered pages: knowl.js and pretext.js
+# typeset knowl content and wait on MathJax.typesetPromise / startup.promise
+MATHJAX_STUB = ("<script>window.MathJax = {typeset: function () {}, "
+                "typesetPromise: function () { return Promise.resolve(); }, "
+                "startup: {promise: Promise.resolve()}};</script>")
+
+RENDER_JS = r"""// Batch TeX -> SVG renderer used by math_prerender.py
+// stdin: {"macros": "...", "items": [[tex, display], ...]}
+// stdout: {"css": "...", "svgs": [svg or null, ...]}
+const {mathjax} = require("mathjax-full/js/mathjax.js");
+const {TeX} = require("mathjax-full/js/input/tex.js");
+const {SVG} = require("mathjax-full/js/output/svg.js");
+const {liteAdaptor} = require("mathjax-full/js/adaptors/liteAdaptor.js");
+const {RegisterHTMLHandler} = require("mathjax-full/js/handlers/html.js");
+const {AllPackages} = require("mathjax-full/js/input/tex/AllPackages.js");
+
+let input = "";
+process.stdin.on("data", (chunk) => { input += chunk; });
+process.stdin.on("end", () => {
+  const request = JSON.parse(input);
+  const adaptor = liteAdaptor();
+  RegisterHTMLHandler(adaptor);
+  // Without noerrors/noundefined, bad TeX throws instead of rendering red text
+  const packages = AllPackages.filter((p) => p !== "noerrors" && p !== "noundefined");
+  const tex = new TeX({packages: packages});
+  const svg = new SVG({fontCache: "none"});
+  const doc = mathjax.document("", {InputJax: tex, OutputJax: svg});
+  // \newcommand definitions persist for the rest of the document
+  if (request.macros) { doc.convert(request.macros, {display: false}); }
+  const svgs = request.items.map(([source, display]) => {
+    try {
+      return adaptor.outerHTML(doc.convert(source, {display: display}));
+    } catch (err) {
+      return null;
+    }
+  });
+  const css = adaptor.textContent(svg.styleSheet(doc));
+  process.stdout.write(JSON.stringify({css: css, svgs: svgs}));
+});
+"""
+
+
+def node_environment(project_dir):
+    """Environment that lets node find a project-local mathjax-full"""
+    env = dict(os.environ)
+    paths = [str(Path(project_dir).resolve() / "node_modules")]
+    if env.get("NODE_PATH"):
+        paths.append(env["NODE_PATH"])
+    env["NODE_PATH"] = os.pathsep.join(paths)
+    return env
+
+
+def render(project_dir, macros, items):
+    """Render [(tex, display)] with node; return (css, svgs) or None if unavailable"""
+    node = shutil.which("node")
+    if node is None:
+        print("Math prerender skipped: node not found")
+        return None
+    script = Path(project_dir) / CACHE_DIR / "render.js"
+    write_if_changed(script, RENDER_JS)
+    request = json.dumps({"macros": macros, "items": items})
+    result = subprocess.run([node, str(script)], input=request, capture_output=True,
+                            text=True, encoding="utf-8",
+                            env=node_environment(project_dir))
+    if result.returncode != 0:
+        if "mathjax-full" in result.stderr:
+            print("Math prerender skipped: run `npm install mathjax-full` "
+                  "in the project directory")
+        else:
+            print(f"Math prerender failed:\n{result.stderr.strip()}")
+        return None
+    output = json.loads(result.stdout)
+    return output["css"], output["svgs"]
+
+
+def split_macros(text):
+    """Split a page around its hidden latex-macros block: (before, block, after)"""
+    match = MACROS_DIV_RE.search(text)
+    if match is None:
+        return text, "", ""
+    return text[:match.start()], match.group(0), text[match.end():]
+
+
+def display_source(body):
+    """TeX of a displaymath div body (\\begin{equation*}...)"""
+    return html.unescape(body.strip())
+
+
+def find_math(text):
+    """Yield (tex, display) for every expression MathJax would process"""
+    before, _, after = split_macros(text)
+    for part in (before, after):
+        for match in INLINE_RE.finditer(part):
+            yield html.unescape(match.group(1)), False
+        for match in DISPLAY_RE.finditer(part):
+            yield display_source(match.group(2)), True
+
+
+def renderable(tex):
+    """Math knowls (\\knowl) need the client-side MathJax extension"""
+    return "\\knowl" not in tex
+
+
+class MathCache:
+    """Persistent TeX -> SVG store for one macro set, evicted least recently used"""
+
+    def __init__(self, project_dir, macros, max_bytes=MAX_CACHE_BYTES):
+        self.path = Path(project_dir) / CACHE_DIR / CACHE_NAME
+        self.macro_hash = text_hash(macros)
+        self.max_bytes = max_bytes
+        self.data = {"version": CACHE_VERSION, "css": "", "svgs": {}, "last_used": {}}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except ValueError:
+                data = {}
+            if data.get("version") == CACHE_VERSION:
+                self.data = data
+        self.now = time.time()
+        self.hits = self.misses = self.evictions = 0
+
+    def key(self, tex, display):
+        """Cache key for one expression"""
+        return text_hash("\0".join((tex, "display" if display else "inline",
+                                    self.macro_hash)))
+
+    def __contains__(self, item):
+        key = self.key(*item)
+        if key not in self.data["svgs"]:
+            return False
+        self.data["last_used"][key] = self.now
+        return True
+
+    def get(self, tex, display):
+        """Cached SVG for an expression, or None (not cached, or failed to render)"""
+        return self.data["svgs"].get(self.key(tex, display))
+
+    def store(self, items, svgs, css):
+        """Store freshly rendered expressions; failures are stored as None"""
+        for item, svg in zip(items, svgs):
+            key = self.key(*item)
+            self.data["svgs"][key] = svg
+            self.data["last_used"][key] = self.now
+        if css:
+            self.data["css"] = css
+
+    def evict(self):
+        """Drop least recently used expressions until the SVGs fit max_bytes,
+        keeping the ones this run uses"""
+        svgs, last_used = self.data["svgs"], self.data["last_used"]
+        total = sum(len(svg or "") for svg in svgs.values())
+        for key in sorted(svgs, key=lambda key: last_used[key]):
+            if total <= self.max_bytes or last_used[key] == self.now:
+                break
+            total -= len(svgs.pop(key) or "")
+            last_used.pop(key, None)
+            self.evictions += 1
+
+    def save(self):
+        self.evict()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_if_changed(self.path, json.dumps(self.data, separators=(",", ":")))
+
+
+def replace_math(text, cache):
+    """Swap every cached expression in a page for its SVG; return new text"""
+
+    def inline(match):
+        tex = html.unescape(match.group(1))
+        svg = cache.get(tex, False) if renderable(tex) else None
+        if svg is None:
+            return match.group(0)
+        return f'<span class="prerendered-math">{svg}</span>'
+
+    def display(match):
+        tex = display_source(match.group(2))
+        svg = cache.get(tex, True) if renderable(tex) else None
+        if svg is None:
+            return match.group(0)
+        return f'<div class="displaymath prerendered-math"{match.group(1)}>{svg}</div>'
+
+    before, macros, after = split_macros(text)
+    parts = [DISPLAY_RE.sub(display, INLINE_RE.sub(inline, part)) for part in (before, after)]
+    return parts[0] + macros + parts[1]
+
+
+def has_unrendered(text):
+    """True if MathJax still has something to typeset in this text"""
+    before, _, after = split_macros(text)
+    return bool(UNRENDERED_RE.search(before) or UNRENDERED_RE.search(after))
+
+
+def drop_mathjax(text):
+    """Replace the MathJax configuration and loader of a page with MATHJAX_STUB"""
+    text = MATHJAX_SCRIPT_RE.sub("", text, count=1)
+    text, count = MATHJAX_CONFIG_RE.subn(lambda _: MATHJAX_STUB, text, count=1)
+    if count == 0 and "</head>" in text:
+        text = text.replace("</head>", MATHJAX_STUB + "\n</head>", 1)
+    return text
+
+
+def load_status(path):
+    """Knowl name -> True if it still contains unrendered math"""
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def prerender_math(project_dir, web_dir=None):
+    """Prerender the math in output/web; return 0 (unavailable renderers are not errors)"""
+    project_dir = Path(project_dir)
+    web_dir = Path(web_dir) if web_dir else project_dir / "output" / "web"
+    _, macros = docinfo_parts(project_dir)
+    macros = PRETEXT_MACROS + "\n" + macros
+    cache = MathCache(project_dir, macros)
+
+    pages = sorted(web_dir.glob("*.html"))
+    knowls = sorted((web_dir / "knowl").glob("*.html"))
+    texts = {path: path.read_text(encoding="utf-8") for path in pages + knowls}
+
+    wanted = []
+    seen = set()
+    for text in texts.values():
+        for item in find_math(text):
+            if not renderable(item[0]):
+                continue
+            if item in cache:
+                cache.hits += 1
+            elif item not in seen:
+                seen.add(item)
+                wanted.append(item)
+    cache.misses = len(wanted)
+    if wanted:
+        rendered = render(project_dir, macros, wanted)
+        if rendered is None:
+            cache.save()
+            return 0
+        css, svgs = rendered
+        cache.store(wanted, svgs, css)
+    # Also when every expression was cached, to record what was used
+    cache.save()
+
+    # Knowls first, so pages know whether the knowls they open still need MathJax
+    status_path = project_dir / CACHE_DIR / STATUS_NAME
+    status = load_status(status_path)
+    for path in knowls:
+        text = replace_math(texts[path], cache)
+        write_if_changed(path, text)
+        status[path.name] = has_unrendered(text)
+
+    if cache.data["css"]:
+        write_if_changed(web_dir / STYLESHEET_NAME, cache.data["css"])
+    full = 0
+    for path in pages:
+        text = replace_math(texts[path], cache)
+        if cache.data["css"] and STYLESHEET_TAG not in text and "</head>" in text:
+            text = text.replace("</head>", STYLESHEET_TAG + "\n</head>", 1)
+        # Unknown knowls (packed before this stage existed) count as unrendered
+        refs = KNOWL_REF_RE.findall(text)
+        if not has_unrendered(text) and not any(status.get(ref, True) for ref in refs):
+            text = drop_mathjax(text)
+            full += 1
+        write_if_changed(path, text)
+    status_path.parent.mkdir(parents=True, exist_ok=True)
+    write_if_changed(status_path, json.dumps(status, indent=1, sort_keys=True))
+
+    failed = sum(1 for item in wanted if cache.get(*item) is None)
+    print(f"Math: {cache.hits} cached, {cache.misses} rendered"
+          + (f" ({failed} left to MathJax)" if failed else "")
+          + (f", {cache.evictions} evicted" if cache.evictions else "")
+          + f"; {full}/{len(pages)} page(s) no longer load MathJax")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prerender output/web math to SVG")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--web-dir", help="built web output (default: output/web)")
+    args = parser.parse_args()
+    return prerender_math(args.project_dir, args.web_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
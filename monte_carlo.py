@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo experiments for the LC Maths Statistics and Probability strand
+Dice, card and Bernoulli-trial experiments are simulated a million times
+each as batched NumPy array operations on seeded, per-experiment random
+streams. Results are cached in .build-cache/monte-carlo/, keyed on the
+experiment spec, the trial count and the seed (and checked against the
+NumPy version that made them), so rerunning reuses them; with a warm
+cache NumPy is not needed at all.
+
+From the results the script writes, into source/stats-probability/generated/:
+
+- one subsection per chapter section, with simulated-versus-theoretical
+  tables and pgfplots figures, xi:included at the end of that section;
+- data/<experiment>.dat, the plotted data as whitespace-separated columns
+  for \\addplot table.
+
+latex-image runs in its own scratch directory, so the figures carry their
+data inline rather than reading the .dat files.
+"""
+
+import argparse
+import json
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from fractions import Fraction
+from math import comb
+from pathlib import Path
+from typing import Callable
+
+from chapter_writer import Division, Figure, Paragraph, Table, add_include, render_fragment
+from ptx_source import text_hash
+from source_output import SourceOutput, write_if_changed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CACHE_DIR = Path(".build-cache") / "monte-carlo"
+CHAPTER_DIR = Path("source") / "stats-probability"
+GENERATED_DIR = "generated"
+DEFAULT_TRIALS = 1_000_000
+BATCH = 1 << 18
+
+
+@dataclass
+class Experiment:
+    """A simulated experiment; `simulate(rng, trials, **params)` returns plain JSON data"""
+    name: str
+    simulate: Callable
+    params: dict = field(default_factory=dict)
+
+    def key(self, trials, seed):
+        spec = {"name": self.name, "params": self.params, "trials": trials, "seed": seed}
+        return text_hash(json.dumps(spec, sort_keys=True))
+
+
+def batches(trials):
+    """Batch sizes adding up to `trials`, to bound memory"""
+    for start in range(0, trials, BATCH):
+        yield min(BATCH, trials - start)
+
+
+# Experiments: each draws whole batches and tallies them with bincount
+
+def two_dice_sum(rng, trials):
+    counts = np.zeros(13, dtype=np.int64)
+    for size in batches(trials):
+        counts += np.bincount(rng.integers(1, 7, (size, 2)).sum(axis=1), minlength=13)
+    return {"counts": counts.tolist()}
+
+
+def die_running_mean(rng, trials, checkpoints):
+    """Mean score of one die after n rolls, at log-spaced n"""
+    marks = np.unique(np.geomspace(1, trials, checkpoints).astype(np.int64))
+    means = []
+    total, done = 0, 0
+    for size in batches(trials):
+        running = total + np.cumsum(rng.integers(1, 7, size))
+        inside = marks[(marks > done) & (marks <= done + size)]
+        means += (running[inside - done - 1] / inside).tolist()
+        total, done = int(running[-1]), done + size
+    return {"n": marks.tolist(), "mean": means, "overall": total / trials}
+
+
+def two_cards(rng, trials):
+    """Two cards dealt without replacement; cards are 0-51, suit = card // 13, ace = card % 13 == 0"""
+    tallies = dict.fromkeys(CARD_EVENTS, 0)
+    for size in batches(trials):
+        first = rng.integers(0, 52, size)
+        second = rng.integers(0, 51, size)
+        second += second >= first
+        suits, ranks = (first // 13, second // 13), (first % 13, second % 13)
+        events = {
+            "both-hearts": (suits[0] == 0) & (suits[1] == 0),
+            "same-suit": suits[0] == suits[1],
+            "at-least-one-ace": (ranks[0] == 0) | (ranks[1] == 0),
+            "ace-then-king": (ranks[0] == 0) & (ranks[1] == 12),
+        }
+        for name, hits in events.items():
+            tallies[name] += int(hits.sum())
+    return {"counts": tallies}
+
+
+def bernoulli_successes(rng, trials, p, n):
+    """Number of successes in n Bernoulli trials with success probability p"""
+    counts = np.zeros(n + 1, dtype=np.int64)
+    for size in batches(trials):
+        successes = (rng.random((size, n)) < float(Fraction(*p))).sum(axis=1)
+        counts += np.bincount(successes, minlength=n + 1)
+    return {"counts": counts.tolist()}
+
+
+def first_success(rng, trials, p, max_n):
+    """Trial of the first success; index 0 counts runs with none in max_n trials"""
+    counts = np.zeros(max_n + 1, dtype=np.int64)
+    for size in batches(trials):
+        hits = rng.random((size, max_n)) < float(Fraction(*p))
+        first = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, 0)
+        counts += np.bincount(first, minlength=max_n + 1)
+    return {"counts": counts.tolist()}
+
+
+# Card events and their exact probabilities
+CARD_EVENTS = {
+    "both-hearts": ("Both cards are hearts", Fraction(13, 52) * Fraction(12, 51)),
+    "same-suit": ("Both cards are the same suit", Fraction(12, 51)),
+    "at-least-one-ace": ("At least one ace", 1 - Fraction(48, 52) * Fraction(47, 51)),
+    "ace-then-king": ("An ace, then a king", Fraction(4, 52) * Fraction(4, 51)),
+}
+
+EXPERIMENTS = {experiment.name: experiment for experiment in [
+    Experiment("two-dice-sum", two_dice_sum),
+    Experiment("die-running-mean", die_running_mean, {"checkpoints": 60}),
+    Experiment("two-cards", two_cards),
+    Experiment("three-trials", bernoulli_successes, {"p": [1, 6], "n": 3}),
+    Experiment("first-success", first_success, {"p": [1, 6], "max_n": 8}),
+]}
+
+
+def run_experiment(project_dir, experiment, trials, seed):
+    """Cached result of an experiment; returns (result, seconds or None if cached)"""
+    key = experiment.key(trials, seed)
+    # One file per spec and seed, so switching seeds keeps both results
+    path = Path(project_dir) / CACHE_DIR / f"{experiment.name}-{key[:16]}.json"
+    if path.exists():
+        cached = json.loads(path.read_text(encoding="utf-8"))
+        # Streams can differ between NumPy versions; without NumPy any version will do
+        if cached.get("key") == key and (np is None or cached.get("numpy") == np.__version__):
+            return cached["result"], None
+    if np is None:
+        raise RuntimeError(f"{experiment.name} is not cached and needs `pip install numpy`")
+    # The experiment name is part of the seed so every experiment has its own stream
+    rng = np.random.default_rng([seed, zlib.crc32(experiment.name.encode())])
+    started = time.perf_counter()
+    result = experiment.simulate(rng, trials, **experiment.params)
+    seconds = time.perf_counter() - started
+    write_if_changed(path, json.dumps({"key": key, "numpy": np.__version__, "trials": trials,
+                                       "seed": seed, "result": result}))
+    return result, seconds
+
+
+# PreTeXt
+
+def fraction(value):
+    """Fraction as LaTeX"""
+    return str(value.numerator) if value.denominator == 1 else \
+        f"\\tfrac{{{value.numerator}}}{{{value.denominator}}}"
+
+
+def thousands(n):
+    """1\\,000\\,000 style LaTeX for a large integer"""
+    return f"{n:,}".replace(",", "\\,")
+
+
+def comparison_row(label, theory, count, trials):
+    return [label, f"<m>{fraction(theory)} \\approx {float(theory):.4f}</m>",
+            f"<m>{count / trials:.4f}</m>"]
+
+
+def pgfplots_table(columns, rows):
+    """Inline pgfplots table with \\\\ row separators"""
+    lines = [" ".join(columns) + "\\\\"]
+    lines += [" ".join(f"{value:.6g}" for value in row) + "\\\\" for row in rows]
+    return "\n".join(lines)
+
+
+def dat_file(columns, rows):
+    """Whitespace-separated data file for \\addplot table"""
+    return "\n".join([" ".join(columns)] + [" ".join(f"{v:.6g}" for v in row) for row in rows]) + "\n"
+
+
+def expected_value_section(results, trials):
+    dice = results["two-dice-sum"]["counts"]
+    dice_rows = [comparison_row(f"<m>{total}</m>", Fraction(6 - abs(total - 7), 36),
+                                dice[total], trials) for total in range(2, 13)]
+    running = results["die-running-mean"]
+    curve = list(zip(running["n"], running["mean"]))
+    cards = results["two-cards"]["counts"]
+    card_rows = [comparison_row(label, theory, cards[name], trials)
+                 for name, (label, theory) in CARD_EVENTS.items()]
+    children = [
+        Paragraph(f"Each experiment below was simulated <m>{thousands(trials)}</m> times. "
+                  "The relative frequency\n"
+                  "of each outcome is close to its theoretical probability, and gets closer as the\n"
+                  "number of trials grows."),
+        Table("table-sim-two-dice", "Sum of two dice: theory and simulation",
+              ["Sum", "Probability", "Relative frequency"], dice_rows),
+        Figure("fig-sim-die-mean", "Mean score of a fair die against the number of rolls. "
+               "The expected value <m>3.5</m> is not a possible score.",
+               "\\begin{tikzpicture}\n"
+               "\\begin{axis}[xmode=log, width=11cm, height=6cm, xlabel={Number of rolls},\n"
+               "  ylabel={Mean score}, ymin=1, ymax=6]\n"
+               "\\addplot[blue, thick, no marks] table[row sep=\\\\] {\n"
+               + pgfplots_table(["n", "mean"], curve) + "\n};\n"
+               f"\\addplot[red, dashed, domain=1:{trials}] {{3.5}};\n"
+               "\\end{axis}\n"
+               "\\end{tikzpicture}", width="80%"),
+        Table("table-sim-two-cards", "Two cards dealt from a shuffled deck",
+              ["Event", "Probability", "Relative frequency"], card_rows),
+    ]
+    data = {"die-running-mean": (["n", "mean"], curve),
+            "two-dice-sum": (["sum", "theory", "simulated"],
+                             [(t, (6 - abs(t - 7)) / 36, dice[t] / trials) for t in range(2, 13)])}
+    division = Division("subsection", "simulating-expected-value",
+                        "Simulation: Relative Frequency and Expected Value", children)
+    return division, data
+
+
+def bernoulli_section(results, trials):
+    three = EXPERIMENTS["three-trials"].params
+    p = Fraction(*three["p"])
+    n = three["n"]
+    counts = results["three-trials"]["counts"]
+    success_rows = [comparison_row(f"<m>{k}</m>", comb(n, k) * p ** k * (1 - p) ** (n - k),
+                                   counts[k], trials) for k in range(n + 1)]
+    max_n = EXPERIMENTS["first-success"].params["max_n"]
+    first = results["first-success"]["counts"]
+    theory = [(1 - p) ** (k - 1) * p for k in range(1, max_n + 1)]
+    first_rows = [comparison_row(f"<m>{k}</m>", theory[k - 1], first[k], trials)
+                  for k in range(1, max_n + 1)]
+    bars = [(k, float(theory[k - 1]), first[k] / trials) for k in range(1, max_n + 1)]
+    table = pgfplots_table(["n", "theory", "simulated"], bars)
+    children = [
+        Paragraph("A fair die is rolled and a six counts as a success, so each roll is a Bernoulli\n"
+                  f"trial with <m>p = {fraction(p)}</m>. "
+                  f"Each experiment was simulated <m>{thousands(trials)}</m> times."),
+        Table("table-sim-three-trials", f"Number of sixes in <m>{n}</m> rolls",
+              ["Sixes", "Probability", "Relative frequency"], success_rows),
+        Table("table-sim-first-success", "Roll on which the first six appears",
+              ["Roll <m>n</m>", "<m>(1-p)^{n-1}p</m>", "Relative frequency"], first_rows),
+        Figure("fig-sim-first-success", "First six on roll <m>n</m>: theory (left bars) "
+               "and simulation (right bars)",
+               "\\begin{tikzpicture}\n"
+               "\\begin{axis}[ybar, bar width=6pt, width=11cm, height=6cm, ymin=0,\n"
+               "  xlabel={Roll of the first six}, ylabel={Probability}, xtick=data,\n"
+               "  legend style={at={(0.97,0.97)}, anchor=north east}]\n"
+               f"\\addplot table[row sep=\\\\, x=n, y=theory] {{\n{table}\n}};\n"
+               f"\\addplot table[row sep=\\\\, x=n, y=simulated] {{\n{table}\n}};\n"
+               "\\legend{Theory, Simulation}\n"
+               "\\end{axis}\n"
+               "\\end{tikzpicture}", width="80%"),
+    ]
+    data = {"first-success": (["n", "theory", "simulated"], bars)}
+    division = Division("subsection", "simulating-bernoulli-trials",
+                        "Simulation: Bernoulli Trials", children)
+    return division, data
+
+
+# (section xml:id in the chapter, builder of the generated subsection)
+SECTIONS = [
+    ("concepts-probability", expected_value_section),
+    ("random-processes", bernoulli_section),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the probability experiments")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    project_dir = Path(args.project_dir)
+    results = {}
+    for name, experiment in EXPERIMENTS.items():
+        try:
+            results[name], seconds = run_experiment(project_dir, experiment, args.trials, args.seed)
+        except RuntimeError as error:
+            print(f"Error: {error}")
+            return 1
+        if seconds is None:
+            print(f"{name}: cached")
+        else:
+            print(f"{name}: {args.trials:,} trials in {seconds:.2f}s")
+
+    chapter_dir = project_dir / CHAPTER_DIR
+    output = SourceOutput(project_dir)
+    for section_id, build in SECTIONS:
+        division, data = build(results, args.trials)
+        href = f"{GENERATED_DIR}/{division.xml_id}.ptx"
+        output.write(chapter_dir / href, render_fragment(division))
+        add_include(chapter_dir / "chapter.ptx", href, output, section_id)
+        for name, (columns, rows) in data.items():
+            output.write(chapter_dir / GENERATED_DIR / "data" / f"{name}.dat",
+                         dat_file(columns, rows))
+    output.save()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Sieve-backed number theory for the LC Maths Number chapter
+A smallest-prime-factor table up to LIMIT is built once with a segmented
+sieve and kept in .build-cache/number-theory/ as raw unsigned 32-bit
+integers. Later runs memory-map the file instead of sieving again, so
+factorising, primality, HCF/LCM and divisibility queries are a few table
+lookups per number.
+
+The Number chapter generator uses it to write worked factorisation
+examples, factor trees and verification tables into the primes section.
+"""
+
+import argparse
+import math
+import mmap
+import os
+import sys
+import time
+from array import array
+from pathlib import Path
+
+from chapter_writer import Block, Division, Figure, Table
+
+TABLE_DIR = Path(".build-cache") / "number-theory"
+DEFAULT_LIMIT = 1 << 20
+SEGMENT = 1 << 18
+
+# Numbers and pairs used by the generated parts of the Number chapter
+FACTOR_TREE_NUMBERS = (84, 360, 1001)
+FACTORISATION_RANGE = (2, 61)
+HCF_LCM_PAIRS = ((84, 60), (48, 180), (360, 756), (126, 945), (1001, 1309))
+DIVISIBILITY_NUMBERS = (51, 57, 52, 738, 2024, 4311, 9876)
+
+
+def small_primes(limit):
+    """Primes up to and including `limit`, by a plain sieve"""
+    flags = bytearray([1]) * (limit + 1)
+    flags[:2] = b"\0\0"
+    for p in range(2, math.isqrt(limit) + 1):
+        if flags[p]:
+            flags[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return [n for n in range(limit + 1) if flags[n]]
+
+
+def build_table(path, limit):
+    """Sieve smallest prime factors below `limit` into `path`, one segment at a time"""
+    base = small_primes(math.isqrt(limit))
+    tmp = path.with_name(path.name + ".tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp, "wb") as f:
+        for low in range(0, limit, SEGMENT):
+            high = min(low + SEGMENT, limit)
+            # Every number starts as its own factor; primes keep it
+            segment = array("I", range(low, high))
+            # Largest primes first, so the smallest factor is written last
+            for p in reversed(base):
+                start = max(p * p, -(-low // p) * p)
+                if start < high:
+                    count = len(range(start, high, p))
+                    segment[start - low::p] = array("I", [p]) * count
+            segment.tofile(f)
+    os.replace(tmp, path)
+
+
+class SieveTable:
+    """Memory-mapped smallest-prime-factor table for 0 <= n < limit"""
+
+    def __init__(self, path, limit):
+        self.path = Path(path)
+        self.limit = limit
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.spf = memoryview(self.map).cast("I")
+
+    def check(self, n):
+        if not 1 <= n < self.limit:
+            raise ValueError(f"{n} is outside the table (1 <= n < {self.limit})")
+
+    def is_prime(self, n):
+        return 2 <= n < self.limit and self.spf[n] == n
+
+    def primes(self, upto):
+        """Primes up to and including `upto`"""
+        return [n for n in range(2, min(upto + 1, self.limit)) if self.spf[n] == n]
+
+    def factorise(self, n):
+        """Prime factorisation as [(prime, exponent)] in increasing order; [] for 1"""
+        self.check(n)
+        factors = []
+        while n > 1:
+            p = self.spf[n]
+            k = 0
+            while n % p == 0:
+                n //= p
+                k += 1
+            factors.append((p, k))
+        return factors
+
+    def divisor_count(self, n):
+        return math.prod(k + 1 for _, k in self.factorise(n))
+
+    def hcf(self, a, b):
+        """HCF from the factorisations: common primes to the lower power"""
+        fb = dict(self.factorise(b))
+        return math.prod(p ** min(k, fb[p]) for p, k in self.factorise(a) if p in fb)
+
+    def lcm(self, a, b):
+        """LCM from the factorisations: every prime to the higher power"""
+        powers = dict(self.factorise(a))
+        for p, k in self.factorise(b):
+            powers[p] = max(k, powers.get(p, 0))
+        return math.prod(p ** k for p, k in powers.items())
+
+    def divides(self, d, n):
+        """True if d divides n, by comparing exponents"""
+        fn = dict(self.factorise(n))
+        return all(fn.get(p, 0) >= k for p, k in self.factorise(d))
+
+    def close(self):
+        self.spf.release()
+        self.map.close()
+
+
+def load_table(project_dir, limit=DEFAULT_LIMIT):
+    """Memory-map the table for `limit`, sieving it first if it is not cached"""
+    path = Path(project_dir) / TABLE_DIR / f"spf-{limit}.u32"
+    expected = limit * array("I").itemsize
+    if not path.exists() or path.stat().st_size != expected:
+        started = time.perf_counter()
+        build_table(path, limit)
+        print(f"Sieved smallest prime factors below {limit} "
+              f"in {time.perf_counter() - started:.1f}s")
+    return SieveTable(path, limit)
+
+
+# PreTeXt for the Number chapter
+
+def power_product(factors, times="\\cdot"):
+    """2^{2} \\cdot 3 \\cdot 7 style LaTeX for a factorisation (1 for the empty one)"""
+    return f" {times} ".join(f"{p}^{{{k}}}" if k > 1 else str(p) for p, k in factors) or "1"
+
+
+def factor_tree(table, n, depth=0):
+    """TikZ child nodes splitting n into its smallest prime and the cofactor"""
+    indent = "  " * depth
+    if table.is_prime(n):
+        return f"{indent}node[draw, circle] {{{n}}}"
+    p = table.spf[n]
+    return (f"{indent}node {{{n}}}\n"
+            f"{indent}  child {{node[draw, circle] {{{p}}}}}\n"
+            f"{indent}  child {{\n{factor_tree(table, n // p, depth + 2)}\n{indent}  }}")
+
+
+def factor_tree_figure(table, n):
+    tree = factor_tree(table, n)
+    return Figure(
+        f"fig-factor-tree-{n}",
+        f"Factor tree for <m>{n}</m>",
+        "\\begin{tikzpicture}[level distance=10mm, sibling distance=16mm]\n"
+        f"\\{tree};\n"
+        "\\end{tikzpicture}",
+    )
+
+
+def factorisation_example(table, n):
+    """Worked example: repeated division by the smallest prime factor"""
+    steps = []
+    m = n
+    while m > 1:
+        p = table.spf[m]
+        steps.append(f"<m>{m} \\div {p} = {m // p}</m>")
+        m //= p
+    factors = table.factorise(n)
+    return Block(
+        "example", f"ex-factor-tree-{n}", f"Prime Factorisation of <m>{n}</m>",
+        [f"Write <m>{n}</m> as a product of primes."],
+        [
+            "Divide by the smallest prime that goes in, and repeat on the quotient until it is "
+            "<m>1</m>:\n" + ", ".join(steps) + ".",
+            f"So <m>{n} = {power_product(factors)}</m>. Each division is one branch of the "
+            "factor tree, with the prime circled.",
+        ],
+    )
+
+
+def factorisation_table(table):
+    low, high = FACTORISATION_RANGE
+    rows = []
+    for n in range(low, high):
+        factors = table.factorise(n)
+        rows.append([f"<m>{n}</m>",
+                     "prime" if table.is_prime(n) else f"<m>{power_product(factors)}</m>",
+                     f"<m>{table.divisor_count(n)}</m>"])
+    return Table("table-factorisations", f"Prime factorisations from <m>{low}</m> to <m>{high - 1}</m>",
+                 ["<m>n</m>", "Factorisation", "Number of divisors"], rows)
+
+
+def hcf_lcm_table(table):
+    rows = []
+    for a, b in HCF_LCM_PAIRS:
+        hcf, lcm = table.hcf(a, b), table.lcm(a, b)
+        rows.append([f"<m>{a}</m>", f"<m>{b}</m>",
+                     f"<m>{power_product(table.factorise(a))}</m>",
+                     f"<m>{power_product(table.factorise(b))}</m>",
+                     f"<m>{hcf}</m>", f"<m>{lcm}</m>",
+                     f"<m>{hcf} \\times {lcm} = {a * b} = {a} \\times {b}</m>"])
+    return Table("table-hcf-lcm", "HCF and LCM from prime factorisations",
+                 ["<m>a</m>", "<m>b</m>", "<m>a</m> factorised", "<m>b</m> factorised",
+                  "HCF", "LCM", "Check: <m>\\text{HCF} \\times \\text{LCM} = ab</m>"], rows)
+
+
+def divisibility_table(table):
+    rows = []
+    for n in DIVISIBILITY_NUMBERS:
+        digit_sum = sum(int(digit) for digit in str(n))
+        marks = ["yes" if table.divides(d, n) else "no" for d in (2, 3, 9)]
+        rows.append([f"<m>{n}</m>", f"<m>{digit_sum}</m>", *marks,
+                     f"<m>{power_product(table.factorise(n))}</m>"])
+    return Table("table-divisibility", "Divisibility tests checked against the factorisation",
+                 ["<m>n</m>", "Digit sum", "By <m>2</m>", "By <m>3</m>", "By <m>9</m>",
+                  "Factorisation"], rows)
+
+
+def primes_section_elements(table):
+    """Generated subsections appended to the primes section"""
+    yield Division("subsection", "factor-trees", "Factor Trees", children=[
+        element
+        for n in FACTOR_TREE_NUMBERS
+        for element in (factorisation_example(table, n), factor_tree_figure(table, n))
+    ])
+    yield Division("subsection", "prime-tables", "Tables of Factorisations", children=[
+        factorisation_table(table),
+        hcf_lcm_table(table),
+        divisibility_table(table),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the cached smallest-prime-factor table")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    sub = parser.add_subparsers(dest="command", required=True)
+    factor = sub.add_parser("factor", help="prime factorisations")
+    factor.add_argument("numbers", nargs="+", type=int)
+    hcf = sub.add_parser("hcf", help="HCF and LCM of two numbers")
+    hcf.add_argument("a", type=int)
+    hcf.add_argument("b", type=int)
+    primes = sub.add_parser("primes", help="primes up to a bound")
+    primes.add_argument("upto", type=int)
+    args = parser.parse_args()
+
+    table = load_table(args.project_dir, args.limit)
+    try:
+        if args.command == "factor":
+            # One at a time, so a bad argument does not hide the other results
+            failed = False
+            for n in args.numbers:
+                try:
+                    factors = table.factorise(n)
+                except ValueError as error:
+                    print(f"Error: {error}")
+                    failed = True
+                    continue
+                product = " * ".join(f"{p}^{k}" if k > 1 else str(p) for p, k in factors)
+                print(f"{n} = {product or 1}")
+            return 1 if failed else 0
+        elif args.command == "hcf":
+            print(f"HCF({args.a}, {args.b}) = {table.hcf(args.a, args.b)}")
+            print(f"LCM({args.a}, {args.b}) = {table.lcm(args.a, args.b)}")
+        else:
+            print(" ".join(map(str, table.primes(args.upto))))
+    except ValueError as error:
+        print(f"Error: {error}")
+        return 1
+    finally:
+        table.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Whole-output build cache for LC Maths
+Like ccache for the book: a build of a target is keyed on everything that
+goes into it (every file under source/ and assets/, publication.ptx,
+project.ptx, the pretext version and the TeX installation), and the
+finished output/<target> tree is stored under that key. Checking out an
+old commit, switching branches or re-running CI on an unchanged tree then
+restores the output in seconds instead of running pretext at all.
+
+Entries share a content-addressed object store, so two builds that differ
+in one page store one extra page. The store lives outside the project
+($LCMATHS_OUTPUT_CACHE, default ~/.cache/lcmaths/output) so it survives
+`lcmaths clean` and fresh checkouts, and is trimmed least recently used
+first to MAX_CACHE_BYTES.
+
+The web output is cached as it is served, after the post-build stages,
+and keyed on their settings (e.g. whether math is prerendered) and on the
+post-build modules' own code, so a restore needs no post-processing and a
+fix to a stage is never masked by an old tree. Only full builds are
+stored: an incremental build leaves whatever output/web held before in
+place, so its tree is not a pure function of the key.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from latex_format import tex_version
+from ptx_source import PROJECT_FILE, PUBLICATION_FILE, file_hash, text_hash
+from source_output import write_if_changed
+
+CACHE_ENV = "LCMATHS_OUTPUT_CACHE"
+SIZE_ENV = "LCMATHS_OUTPUT_CACHE_MB"
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+INPUT_DIRS = ("source", "assets")
+OUTPUT_DIRS = {"web": Path("output") / "web", "print": Path("output") / "print"}
+# The post-build code that shapes a cached web tree (see post_build.py)
+POST_BUILD_MODULES = ("post_build.py", "math_prerender.py", "search_index.py",
+                      "knowl_bundle.py", "web_compress.py")
+
+
+def cache_root():
+    """Directory of the shared output cache"""
+    if os.environ.get(CACHE_ENV):
+        return Path(os.environ[CACHE_ENV]).expanduser()
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "lcmaths" / "output"
+
+
+def pretext_version(python):
+    """Installed pretext version for an interpreter, or None"""
+    result = subprocess.run(
+        [str(python), "-c", "from importlib.metadata import version; print(version('pretext'))"],
+        capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def tree_files(directory):
+    """Files under a directory as sorted posix paths relative to it"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path.relative_to(directory).as_posix()
+                  for path in directory.rglob("*") if path.is_file())
+
+
+def build_key(project_dir, python, target, options=()):
+    """Hash of every input of a build of `target`, plus `options` that shape its output"""
+    project_dir = Path(project_dir)
+    # latex-images go through TeX for the web target too
+    parts = [f"target {target}", f"pretext {pretext_version(python)}", f"tex {tex_version()}",
+             f"options {' '.join(options)}"]
+    for name in INPUT_DIRS:
+        for rel in tree_files(project_dir / name):
+            parts.append(f"{name}/{rel} {file_hash(project_dir / name / rel)}")
+    for path in (PUBLICATION_FILE, PROJECT_FILE):
+        parts.append(f"{path.as_posix()} {file_hash(project_dir / path)}")
+    if target == "web":
+        for name in POST_BUILD_MODULES:
+            parts.append(f"{name} {file_hash(Path(__file__).with_name(name))}")
+    return text_hash("\n".join(parts))
+
+
+class OutputCache:
+    """Content-addressed store of output trees, evicted least recently used"""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = Path(root) if root else cache_root()
+        if max_bytes is None:
+            max_bytes = int(os.environ[SIZE_ENV]) * 1024 ** 2 if os.environ.get(SIZE_ENV) \
+                else MAX_CACHE_BYTES
+        self.max_bytes = max_bytes
+        self.index_path = self.root / "index.json"
+        self.index = {}
+        if self.index_path.exists():
+            try:
+                self.index = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except ValueError:
+                self.index = {}
+
+    def object_path(self, digest):
+        return self.root / "objects" / digest[:2] / digest[2:]
+
+    def manifest_path(self, key):
+        return self.root / "entries" / f"{key}.json"
+
+    def restore(self, key, project_dir, target):
+        """Replace output/<target> with the cached tree; False on a miss"""
+        entry = self.index.get(key)
+        manifest = self.manifest_path(key)
+        if entry is None or not manifest.exists():
+            return False
+        files = json.loads(manifest.read_text(encoding="utf-8"))
+        if not all(self.object_path(digest).exists() for digest in files.values()):
+            return False
+        output = Path(project_dir) / OUTPUT_DIRS[target]
+        if output.exists():
+            shutil.rmtree(output)
+        for rel, digest in files.items():
+            path = output / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # A copy, not a link: the post-build stages rewrite files in place
+            shutil.copyfile(self.object_path(digest), path)
+        entry["last_used"] = time.time()
+        self.save()
+        return True
+
+    def store(self, key, project_dir, target):
+        """Add the current output/<target> tree under `key`"""
+        output = Path(project_dir) / OUTPUT_DIRS[target]
+        files = {}
+        for rel in tree_files(output):
+            digest = file_hash(output / rel)
+            obj = self.object_path(digest)
+            if not obj.exists():
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                tmp = obj.with_name(obj.name + ".tmp")
+                shutil.copyfile(output / rel, tmp)
+                os.replace(tmp, obj)
+            files[rel] = digest
+        if not files:
+            return
+        write_if_changed(self.manifest_path(key), json.dumps(files, separators=(",", ":")))
+        self.index[key] = {"target": target, "files": len(files), "last_used": time.time()}
+        self.evict()
+        self.save()
+
+    def object_sizes(self):
+        """Size of every stored object, by digest"""
+        objects = self.root / "objects"
+        if not objects.exists():
+            return {}
+        return {path.parent.name + path.name: path.stat().st_size
+                for path in objects.glob("*/*") if not path.name.endswith(".tmp")}
+
+    def evict(self):
+        """Drop least recently used entries, then unreferenced objects, to fit max_bytes"""
+        sizes = self.object_sizes()
+        referenced = {}
+        for key in self.index:
+            manifest = self.manifest_path(key)
+            if manifest.exists():
+                referenced[key] = set(json.loads(manifest.read_text(encoding="utf-8")).values())
+        total = sum(sizes.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]["last_used"]):
+            if total <= self.max_bytes or len(self.index) == 1:
+                break
+            dropped = referenced.pop(key, set())
+            still_used = set().union(*referenced.values())
+            for digest in dropped - still_used:
+                self.object_path(digest).unlink(missing_ok=True)
+                total -= sizes.pop(digest, 0)
+            self.manifest_path(key).unlink(missing_ok=True)
+            del self.index[key]
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        write_if_changed(self.index_path, json.dumps(self.index, indent=2))
+
+    def stats(self):
+        sizes = self.object_sizes()
+        return {"root": str(self.root), "entries": len(self.index), "objects": len(sizes),
+                "bytes": sum(sizes.values()), "max_bytes": self.max_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the whole-output build cache")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Python interpreter with pretext installed")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="size and number of cached builds")
+    key = sub.add_parser("key", help="cache key of the current tree")
+    key.add_argument("target", choices=list(OUTPUT_DIRS))
+    key.add_argument("options", nargs="*",
+                     help="output options as lcmaths.py keys them "
+                          "(web: math, no-math or no-post; print: parallel-print)")
+    sub.add_parser("clear", help="remove the whole cache")
+    args = parser.parse_args()
+
+    cache = OutputCache()
+    if args.command == "stats":
+        stats = cache.stats()
+        print(f"{stats['root']}: {stats['entries']} build(s), {stats['objects']} file(s), "
+              f"{stats['bytes'] / 1024 ** 2:.1f} of {stats['max_bytes'] / 1024 ** 2:.0f} MB")
+    elif args.command == "key":
+        digest = build_key(args.project_dir, args.python, args.target, args.options)
+        state = "cached" if digest in cache.index else "not cached"
+        print(f"{digest} ({state})")
+    else:
+        shutil.rmtree(cache.root, ignore_errors=True)
+        print(f"Removed {cache.root}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
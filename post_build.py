@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Post-build stages for the LC Maths web output
+Run after a successful `pretext build web`, in order, on output/web.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from knowl_bundle import pack_knowls
+from math_prerender import prerender_math
+from search_index import build_search_index
+from web_compress import compress_web
+
+
+def run_post_build(project_dir, keep_knowl_files=False, math=False):
+    """Run the post-build stages on output/web (math prerendering only with `math`)"""
+    web_dir = Path(project_dir) / "output" / "web"
+    if not web_dir.exists():
+        print(f"Error: {web_dir} does not exist - build the web target first")
+        return 1
+    if math:
+        # Before packing, so the knowl bundles hold prerendered math
+        print("Post-build: prerendering math...")
+        returncode = prerender_math(project_dir, web_dir)
+        if returncode != 0:
+            return returncode
+    # Reads the pages after math prerendering, so it never indexes TeX
+    print("Post-build: indexing for search...")
+    returncode = build_search_index(project_dir, web_dir)
+    if returncode != 0:
+        return returncode
+    print("Post-build: packing knowls...")
+    returncode = pack_knowls(project_dir, web_dir, keep_files=keep_knowl_files)
+    if returncode != 0:
+        return returncode
+    # Last: minifies and compresses whatever the earlier stages wrote
+    print("Post-build: minifying and precompressing...")
+    return compress_web(project_dir, web_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the post-build stages on output/web")
+    parser.add_argument("project_dir", nargs="?", default=".")
+    parser.add_argument("--keep-knowl-files", action="store_true",
+                        help="keep individual knowl files alongside the bundles")
+    parser.add_argument("--math", action="store_true",
+                        help="prerender math to SVG (default: MathJax in the browser)")
+    args = parser.parse_args()
+    return run_post_build(args.project_dir, args.keep_knowl_files, args.math)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,9 @@
 REM PreTeXt Build Helper for LC Maths
 REM This uses the correct Python environment
 
-set PYTHON=C:\Users\ronan\anaconda3\envs\pretext\python.exe
+REM Set PRETEXT_PYTHON to the interpreter with pretext installed
+set PYTHON=python
+if defined PRETEXT_PYTHON set PYTHON=%PRETEXT_PYTHON%
 
 if "%1"=="" (
     echo Usage: pretext.bat [command]
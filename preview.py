@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Section previews for LC Maths
+Builds one division of the book, chosen by xml:id, on its own: the source
+is expanded through its xi:includes, the division is copied out with the
+docinfo macros and just the titles of the divisions around it, and pretext
+builds that into a scratch project in .build-cache/preview/<xml:id>/. A
+section page is ready in the time pretext takes to start, instead of after
+all five strands.
+
+    python preview.py primes              # build and open one section
+    python preview.py --on-demand         # build any section when first opened
+
+The on-demand server maps /<xml:id>/ to that section's preview, builds it
+when the page is first requested and rebuilds it only when its source
+changes. Cross-references to the rest of the book are unresolved in a
+preview; use a full build for those.
+"""
+
+import argparse
+import asyncio
+import copy
+import html
+import os
+import shutil
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from devserver import DevServer, serve
+from ptx_source import MAIN_FILE, PUBLICATION_FILE, XI_INCLUDE, XML_ID, text_hash
+from source_output import write_if_changed
+
+PREVIEW_DIR = Path(".build-cache") / "preview"
+KEY_FILE = "preview-key"
+# Shared with the real project rather than regenerated per preview
+LINKED_DIRS = ("assets", "generated-assets")
+DEFAULT_CHUNKING = 2
+
+# Elements that are pages or parts of the page tree when chunking
+DIVISIONS = {"frontmatter", "backmatter", "preface", "chapter", "appendix", "section",
+             "subsection", "subsubsection", "exercises", "worksheet", "references",
+             "glossary", "solutions"}
+
+PROJECT_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<project ptx-version="2">
+  <targets>
+    <target name="web">
+      <format>html</format>
+      <source>source/main.ptx</source>
+      <publication>publication/publication.ptx</publication>
+      <output-dir>output/web</output-dir>
+    </target>
+  </targets>
+</project>
+"""
+
+
+class PreviewError(Exception):
+    """The xml:id is not a division of the book, or its preview did not build"""
+
+
+def expand(element, base_dir):
+    """Replace xi:includes below `element` by what they include, recursively"""
+    for index, child in reversed(list(enumerate(element))):
+        if child.tag != XI_INCLUDE:
+            expand(child, base_dir)
+            continue
+        target = base_dir / child.get("href", "")
+        element.remove(child)
+        if not child.get("href") or not target.is_file():
+            continue
+        if child.get("parse", "xml") == "xml":
+            included = expand(ET.parse(target).getroot(), target.parent)
+            included.tail = child.tail
+            element.insert(index, included)
+            continue
+        text = target.read_text(encoding="utf-8") + (child.tail or "")
+        if index:
+            element[index - 1].tail = (element[index - 1].tail or "") + text
+        else:
+            element.text = (element.text or "") + text
+    return element
+
+
+def chunk_level(publication):
+    """The publication's <chunking level>, or DEFAULT_CHUNKING"""
+    chunking = publication.find("./common/chunking")
+    if chunking is None or not chunking.get("level", "").isdigit():
+        return DEFAULT_CHUNKING
+    return int(chunking.get("level"))
+
+
+def preview_source(project_dir, xml_id):
+    """
+    The preview of one division as (main.ptx, publication.ptx, page).
+
+    `page` is the file the division lands on, plus an #anchor when it is
+    deeper than the chunking level and shares a page with its parent.
+    """
+    project_dir = Path(project_dir)
+    main_path = project_dir / MAIN_FILE
+    root = expand(ET.parse(main_path).getroot(), main_path.parent)
+    parents = {child: parent for parent in root.iter() for child in parent}
+    target = next((elem for elem in root.iter() if elem.get(XML_ID) == xml_id), None)
+    if target is None:
+        raise PreviewError(f"no element with xml:id '{xml_id}' in {MAIN_FILE.as_posix()}")
+    chain = [target]
+    while chain[-1] in parents and parents[chain[-1]] is not root:
+        chain.append(parents[chain[-1]])
+    chain.reverse()
+    if len(chain) < 2 or chain[0].tag != "book" or target.tag not in DIVISIONS:
+        raise PreviewError(f"'{xml_id}' is a <{target.tag}>, not a division of the book")
+
+    # The surrounding divisions keep their ids and titles, nothing else
+    preview = ET.Element(root.tag, root.attrib)
+    docinfo = root.find("docinfo")
+    if docinfo is not None:
+        preview.append(copy.deepcopy(docinfo))
+    parent = preview
+    for depth, ancestor in enumerate(chain[:-1]):
+        shell = ET.SubElement(parent, ancestor.tag, ancestor.attrib)
+        shell.set(XML_ID, ancestor.get(XML_ID) or f"preview-{depth}")
+        title = ancestor.find("title")
+        if title is not None:
+            shell.append(copy.deepcopy(title))
+        parent = shell
+    parent.append(copy.deepcopy(target))
+
+    publication = ET.parse(project_dir / PUBLICATION_FILE).getroot()
+    divisions = [elem for elem in chain[1:] if elem.tag in DIVISIONS]
+    page_elem = divisions[min(len(divisions), max(chunk_level(publication), 1)) - 1]
+    page_id = page_elem.get(XML_ID) or f"preview-{chain.index(page_elem)}"
+    page = f"{page_id}.html" + ("" if page_elem is target else f"#{xml_id}")
+    html_options = publication.find("html")
+    if html_options is None:
+        html_options = ET.SubElement(publication, "html")
+    index_page = html_options.find("index-page")
+    if index_page is None:
+        index_page = ET.SubElement(html_options, "index-page")
+    index_page.set("ref", page_id)
+
+    declaration = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    return (declaration + ET.tostring(preview, encoding="unicode") + "\n",
+            declaration + ET.tostring(publication, encoding="unicode") + "\n",
+            page)
+
+
+def link_shared(project_dir, scratch):
+    """Point the scratch project at the real assets; True if generated-assets is shared"""
+    for name in LINKED_DIRS:
+        source, link = Path(project_dir).resolve() / name, scratch / name
+        if not source.is_dir() or link.is_symlink():
+            continue
+        if link.exists():
+            # A copy (no symlinks here): bring in anything generated since
+            shutil.copytree(source, link, dirs_exist_ok=True)
+            continue
+        try:
+            os.symlink(source, link, target_is_directory=True)
+        except OSError:
+            shutil.copytree(source, link)
+    return (scratch / "generated-assets").exists()
+
+
+class Previews:
+    """Scratch builds of single divisions, rebuilt only when their source changes"""
+
+    def __init__(self, project_dir, python):
+        self.project_dir = Path(project_dir)
+        self.python = python
+
+    def scratch_dir(self, xml_id):
+        return self.project_dir / PREVIEW_DIR / xml_id
+
+    def output_dir(self, xml_id):
+        return self.scratch_dir(xml_id) / "output" / "web"
+
+    def ensure(self, xml_id):
+        """Build the preview of `xml_id` if it is missing or stale; return its page
+
+        The preview is built with --no-generate against the book's
+        generated-assets, so the division's latex-images are part of its key
+        and any that are not generated yet are generated (through the
+        latex-image cache) first.
+        """
+        from build_runner import pretext_command, stream_command
+        from latex_image_cache import (LatexImageCache, docinfo_parts, generate_latex_images,
+                                       latex_images)
+
+        main, publication, page = preview_source(self.project_dir, xml_id)
+        scratch = self.scratch_dir(xml_id)
+        images = latex_images(ET.fromstring(main))
+        cache = LatexImageCache(self.project_dir)
+        preamble, macros = docinfo_parts(self.project_dir)
+        image_keys = [cache.key(source, preamble, macros) for _, _, source in images]
+        key = text_hash("\n".join([main, publication] + image_keys))
+        key_path = scratch / KEY_FILE
+        page_path = self.output_dir(xml_id) / page.partition("#")[0]
+        if key_path.exists() and key_path.read_text(encoding="utf-8") == key \
+                and page_path.exists():
+            print(f"Preview of {xml_id} is up to date")
+            return page
+        write_if_changed(scratch / MAIN_FILE, main)
+        write_if_changed(scratch / PUBLICATION_FILE, publication)
+        write_if_changed(scratch / "project.ptx", PROJECT_TEMPLATE)
+        if images:
+            def run(*args, env=None):
+                cmd = pretext_command(self.python, *args)
+                print(f"Running: {' '.join(cmd)}")
+                return stream_command(cmd, cwd=self.project_dir, prefix=xml_id, env=env)
+
+            if generate_latex_images(run, self.project_dir, images=images) != 0:
+                raise PreviewError(f"the latex-images of '{xml_id}' could not be generated")
+        args = ["build", "web"]
+        if link_shared(self.project_dir, scratch):
+            args.append("--no-generate")
+        cmd = pretext_command(self.python, *args)
+        print(f"Previewing {xml_id}: {' '.join(cmd)}")
+        key_path.unlink(missing_ok=True)
+        if stream_command(cmd, cwd=scratch, prefix=xml_id) != 0 or not page_path.exists():
+            raise PreviewError(f"the preview of '{xml_id}' did not build")
+        write_if_changed(key_path, key)
+        return page
+
+
+def preview(project_dir, python, xml_id, host="127.0.0.1", port=8128, open_browser=True):
+    """Build one division and serve its preview, opening its page"""
+    try:
+        page = Previews(project_dir, python).ensure(xml_id)
+    except PreviewError as error:
+        print(f"✗ {error}")
+        return 1
+    return serve(Path(project_dir) / PREVIEW_DIR / xml_id, host, port, open_browser, page)
+
+
+class PreviewServer(DevServer):
+    """Serves /<xml:id>/, building each division's preview on first request"""
+
+    def __init__(self, project_dir, python, host="127.0.0.1", port=8128):
+        super().__init__(Path(project_dir) / PREVIEW_DIR, host, port)
+        self.previews = Previews(project_dir, python)
+        self.locks = {}
+
+    async def send_file(self, writer, method, path, headers, keep_alive):
+        xml_id, _, rest = path.lstrip("/").partition("/")
+        if not xml_id:
+            await self.send_listing(writer, method, keep_alive)
+            return
+        if not rest or rest.endswith(".html"):
+            # Pages check their source; assets are served from the last build
+            async with self.locks.setdefault(xml_id, asyncio.Lock()):
+                loop = asyncio.get_running_loop()
+                try:
+                    page = await loop.run_in_executor(None, self.previews.ensure, xml_id)
+                except PreviewError as error:
+                    print(f"✗ {error}")
+                    await self.send_error(writer, 404, "Not Found", keep_alive)
+                    return
+            self.mounts[f"/{xml_id}/"] = self.previews.output_dir(xml_id).resolve()
+            if not rest:
+                await self.send_response(writer, 302, "Found",
+                                         {"Location": f"/{xml_id}/{page}",
+                                          "Content-Length": "0"}, b"", keep_alive)
+                return
+        await super().send_file(writer, method, path, headers, keep_alive)
+
+    async def send_listing(self, writer, method, keep_alive):
+        """Index of the book's chapters and sections, linking to their previews"""
+        main_path = self.previews.project_dir / MAIN_FILE
+        root = expand(ET.parse(main_path).getroot(), main_path.parent)
+        items = []
+        for elem in root.iter():
+            if elem.tag in ("chapter", "section") and elem.get(XML_ID):
+                xml_id = html.escape(elem.get(XML_ID))
+                title = html.escape("".join(elem.find("title").itertext())
+                                    if elem.find("title") is not None else xml_id)
+                indent = " style=\"margin-left:2em\"" if elem.tag == "section" else ""
+                items.append(f'<li{indent}><a href="/{xml_id}/">{title}</a> '
+                             f'<code>{xml_id}</code></li>')
+        body = ("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Section previews"
+                "</title></head><body><h1>Section previews</h1><ul>"
+                + "".join(items) + "</ul></body></html>").encode("utf-8")
+        headers = {"Content-Type": "text/html; charset=utf-8", "Cache-Control": "no-store",
+                   "Content-Length": str(len(body))}
+        await self.send_response(writer, 200, "OK", headers,
+                                 body if method == "GET" else b"", keep_alive)
+
+
+def serve_on_demand(project_dir, python, host="127.0.0.1", port=8128):
+    """Serve previews of every division, built as they are requested, until Ctrl+C"""
+    server = PreviewServer(project_dir, python, host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print()
+        print("Server stopped.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and view one section of the book")
+    parser.add_argument("xml_id", nargs="?", help="division to preview, e.g. primes")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Python interpreter with pretext installed")
+    parser.add_argument("--on-demand", action="store_true",
+                        help="serve every division, building each when first opened")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8128)
+    parser.add_argument("--no-browser", action="store_true")
+    args = parser.parse_args()
+    if args.on_demand:
+        return serve_on_demand(args.project_dir, args.python, args.host, args.port)
+    if not args.xml_id:
+        parser.error("give an xml:id to preview, or --on-demand")
+    return preview(args.project_dir, args.python, args.xml_id, args.host, args.port,
+                   not args.no_browser)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
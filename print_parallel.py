@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Parallel PDF build for the LC Maths print target
+Splits the book's LaTeX at the chapter boundaries into \\include files,
+runs one shared draft pass over the whole book so every chapter's .aux
+(page numbers, cross-references, table of contents) and the index are
+settled, then compiles each chapter with \\includeonly at the same time and
+merges the chapter pages into the final PDF. Each chapter's pages are also
+saved on their own as a proof PDF in output/print/proofs/.
+
+Merging needs the optional `pypdf` package or the `qpdf` command.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from build_history import record_build
+from build_log import parse_file
+from build_runner import emit, emit_lines, pretext_command, run_measured, stream_command
+from latex_format import format_env, mark_dump_point, preamble_format
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+LATEX_TARGET = "latex"
+LATEX_DIR = Path("output") / "latex"
+PRINT_DIR = Path("output") / "print"
+MASTER = "book"
+PARTS_DIR = "parts"
+MAX_AUX_PASSES = 4
+
+BEGIN_DOCUMENT_RE = re.compile(r"^\\begin\{document\}", re.M)
+CHAPTER_START_RE = re.compile(r"^\\(?:begin\{chapterptx\}|chapter\b)", re.M)
+BACK_RE = re.compile(r"^\\(?:backmatter|appendix)\b|^\\end\{document\}", re.M)
+LABEL_RE = re.compile(r"\\label\{([^}]+)\}")
+MARK_RE = re.compile(r"^PTX-CHAPTER-(START|END) (\S+) (\d+)$", re.M)
+
+# abspage counts shipped-out pages, so it gives physical PDF page indices
+MARK = "\\typeout{{PTX-CHAPTER-{kind} {name} \\the\\csname c@abspage\\endcsname}}"
+
+
+def split_book(tex):
+    """Split LaTeX source into (preamble, front, [(name, chapter)], back)"""
+    begin = BEGIN_DOCUMENT_RE.search(tex)
+    starts = [m.start() for m in CHAPTER_START_RE.finditer(tex, begin.end())]
+    if not starts:
+        raise ValueError("no chapters found in the LaTeX source")
+    back = BACK_RE.search(tex, starts[-1])
+    ends = starts[1:] + [back.start()]
+    chapters = []
+    for number, (start, end) in enumerate(zip(starts, ends), 1):
+        text = tex[start:end]
+        label = LABEL_RE.search(text)
+        name = re.sub(r"[^A-Za-z0-9-]", "-", label.group(1)) if label else f"chapter-{number:02}"
+        chapters.append((name, text))
+    return tex[:begin.end()], tex[begin.end():starts[0]], chapters, tex[back.start():]
+
+
+def write_master(latex_dir, tex):
+    """Write book.tex and one \\include file per chapter; return chapter names"""
+    preamble, front, chapters, back = split_book(tex)
+    # Everything up to the marker can be loaded from a precompiled format
+    preamble = mark_dump_point(preamble) or preamble
+    includes = []
+    for name, text in chapters:
+        body = (MARK.format(kind="START", name=name) + "\n" + text
+                + "\\clearpage\n" + MARK.format(kind="END", name=name) + "\n")
+        (latex_dir / f"ch-{name}.tex").write_text(body, encoding="utf-8")
+        includes.append(f"\\include{{ch-{name}}}\n")
+    (latex_dir / f"{MASTER}.tex").write_text(preamble + front + "".join(includes) + back,
+                                             encoding="utf-8")
+    return [name for name, _ in chapters]
+
+
+def aux_digest(directory):
+    """Hash of every .aux/.toc/.idx file, to see when the draft passes settle"""
+    digest = hashlib.sha256()
+    for path in sorted(Path(directory).glob("*")):
+        if path.suffix in (".aux", ".toc", ".idx", ".out"):
+            digest.update(path.name.encode() + path.read_bytes())
+    return digest.hexdigest()
+
+
+def latex_command(engine, fmt, *args):
+    """Engine command line, starting from the precompiled format `fmt` if given"""
+    cmd = [engine, "-interaction=nonstopmode", "-halt-on-error"]
+    if fmt is not None:
+        cmd.append(f"-fmt={fmt}")
+    return cmd + list(args)
+
+
+def aux_pass(latex_dir, engine, fmt=None, env=None):
+    """Draft-mode passes over the whole book until the aux files stop changing"""
+    previous = None
+    for _ in range(MAX_AUX_PASSES):
+        returncode = stream_command(latex_command(engine, fmt, "-draftmode", f"{MASTER}.tex"),
+                                    cwd=latex_dir, prefix="aux", env=env)
+        if returncode != 0:
+            return returncode
+        if (latex_dir / f"{MASTER}.idx").exists() and shutil.which("makeindex"):
+            stream_command(["makeindex", MASTER], cwd=latex_dir, prefix="aux", env=env)
+        current = aux_digest(latex_dir)
+        if current == previous:
+            return 0
+        previous = current
+    return 0
+
+
+def report_log(latex_dir, log, prefix=None):
+    """Print the classified warnings and errors of a failed LaTeX run"""
+    project_dir = latex_dir.parents[len(LATEX_DIR.parts) - 1]
+    emit_lines(parse_file(log, project_dir, cwd=latex_dir).summary(log.name), prefix)
+
+
+def compile_chapter(latex_dir, name, engine, fmt=None, env=None):
+    """Compile the book with only one chapter included, in its own directory"""
+    part_dir = latex_dir / PARTS_DIR / name
+    if part_dir.exists():
+        shutil.rmtree(part_dir)
+    part_dir.mkdir(parents=True)
+    # Private copies of the settled aux files; sources and images are found
+    # in the shared directory through TEXINPUTS
+    for path in latex_dir.iterdir():
+        if path.is_file() and path.suffix in (".aux", ".toc", ".ind", ".out", ".bbl"):
+            shutil.copy2(path, part_dir / path.name)
+    env = dict(os.environ if env is None else env, TEXINPUTS=f"{latex_dir.resolve()}{os.pathsep}")
+    cmd = latex_command(engine, fmt, f"-jobname={MASTER}",
+                        f"\\includeonly{{ch-{name}}}\\input{{{MASTER}}}")
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=part_dir, env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+    seconds = time.perf_counter() - started
+    log = part_dir / f"{MASTER}.log"
+    marks = {}
+    if log.exists():
+        text = log.read_text(encoding="utf-8", errors="replace")
+        marks = {kind: int(page) for kind, mark, page in MARK_RE.findall(text) if mark == name}
+    status = "ok" if proc.returncode == 0 else f"failed ({proc.returncode}), see {log}"
+    emit(f"{status} in {seconds:.1f}s", name)
+    if proc.returncode != 0 and log.exists():
+        report_log(latex_dir, log, name)
+    return {
+        "name": name,
+        "returncode": proc.returncode,
+        "pdf": part_dir / f"{MASTER}.pdf",
+        "start": marks.get("START"),
+        "end": marks.get("END"),
+        "seconds": seconds,
+    }
+
+
+def merge_pages(ranges, output):
+    """Write the pages [(pdf, first, stop)] (0-based, stop exclusive) to one PDF"""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if pypdf is not None:
+        writer = pypdf.PdfWriter()
+        readers = {}
+        for pdf, first, stop in ranges:
+            reader = readers.setdefault(pdf, pypdf.PdfReader(pdf))
+            for index in range(first, stop):
+                writer.add_page(reader.pages[index])
+        with open(output, "wb") as f:
+            writer.write(f)
+        return 0
+    pages = []
+    for pdf, first, stop in ranges:
+        if stop > first:
+            pages += [str(pdf), f"{first + 1}-{stop}"]
+    cmd = ["qpdf", "--empty", "--pages"] + pages + ["--", str(output)]
+    return subprocess.run(cmd).returncode
+
+
+def page_count(pdf):
+    """Number of pages in a PDF"""
+    if pypdf is not None:
+        return len(pypdf.PdfReader(pdf).pages)
+    result = subprocess.run(["qpdf", "--show-npages", str(pdf)], capture_output=True, text=True)
+    return int(result.stdout.strip())
+
+
+def build_print_parallel(python, project_dir, engine="pdflatex", workers=None, skip_latex=False):
+    """Build the print PDF chapter by chapter in parallel; return 0 on success"""
+    project_dir = Path(project_dir)
+    latex_dir = project_dir / LATEX_DIR
+    print_dir = project_dir / PRINT_DIR
+    if pypdf is None and not shutil.which("qpdf"):
+        print("Error: merging needs `pip install pypdf` or the qpdf command")
+        return 1
+    started = time.time()
+    timings = {}
+
+    clock = time.perf_counter()
+    if not skip_latex:
+        cmd = pretext_command(python, "build", LATEX_TARGET)
+        print(f"Running: {' '.join(cmd)}")
+        result = run_measured(cmd, cwd=project_dir, prefix=LATEX_TARGET)
+        if result["returncode"] != 0:
+            return result["returncode"]
+    sources = [p for p in latex_dir.glob("*.tex")
+               if p.stem != MASTER and not p.name.startswith("ch-")]
+    if len(sources) != 1:
+        print(f"Error: expected one LaTeX file from pretext in {latex_dir}, found {len(sources)}")
+        return 1
+    source = sources[0]
+    chapters = write_master(latex_dir, source.read_text(encoding="utf-8"))
+    timings["latex"] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    book_format = preamble_format(project_dir, MASTER, latex_dir / f"{MASTER}.tex", engine)
+    format_dir, fmt = book_format if book_format else (None, None)
+    env = format_env(format_dir) if format_dir is not None else None
+    timings["format"] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    print(f"Shared aux pass over {len(chapters)} chapter(s)...")
+    if aux_pass(latex_dir, engine, fmt, env) != 0:
+        print(f"✗ Draft pass failed, see {latex_dir / (MASTER + '.log')}")
+        if (latex_dir / f"{MASTER}.log").exists():
+            report_log(latex_dir, latex_dir / f"{MASTER}.log")
+        return 1
+    timings["aux"] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        parts = list(pool.map(lambda name: compile_chapter(latex_dir, name, engine, fmt, env),
+                              chapters))
+    timings["chapters"] = time.perf_counter() - clock
+    failed = [part["name"] for part in parts
+              if part["returncode"] != 0 or part["start"] is None or part["end"] is None]
+    if failed:
+        print(f"✗ Failed: {', '.join(failed)}")
+        return 1
+
+    clock = time.perf_counter()
+    first, last = parts[0], parts[-1]
+    ranges = [(first["pdf"], 0, first["start"])]
+    ranges += [(part["pdf"], part["start"], part["end"]) for part in parts]
+    ranges.append((last["pdf"], last["end"], page_count(last["pdf"])))
+    output = print_dir / f"{source.stem}.pdf"
+    returncode = merge_pages(ranges, output)
+    for part in parts:
+        if returncode == 0:
+            returncode = merge_pages([(part["pdf"], part["start"], part["end"])],
+                                     print_dir / "proofs" / f"{part['name']}.pdf")
+    timings["merge"] = time.perf_counter() - clock
+
+    wall = time.time() - started
+    serial = sum(part["seconds"] for part in parts)
+    print()
+    for part in parts:
+        print(f"  {part['name']:<24} {part['end'] - part['start']:4} page(s) "
+              f"{part['seconds']:7.1f}s")
+    print(f"  Chapters: {timings['chapters']:.1f}s wall (serial would be ~{serial:.1f}s)")
+    record_build(project_dir, "print-parallel", ["print_parallel.py", engine], {
+        "started": started,
+        "returncode": returncode,
+        "wall": wall,
+        "cpu": None,
+        "peak_rss_kb": None,
+        "phases": timings,
+    })
+    if returncode == 0:
+        print(f"✓ {output} and {len(parts)} proof PDF(s) in {print_dir / 'proofs'}")
+    return returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the print PDF chapter by chapter in parallel")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Python interpreter with pretext installed")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--engine", default="pdflatex")
+    parser.add_argument("--workers", type=int, help="parallel chapter jobs (default: CPU count)")
+    parser.add_argument("--skip-latex", action="store_true",
+                        help="reuse the LaTeX already in output/latex")
+    args = parser.parse_args()
+    return build_print_parallel(args.python, args.project_dir, args.engine, args.workers,
+                                args.skip_latex)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Helpers for reading the LC Maths PreTeXt source tree
+Shared by the build scripts so they all agree on what the book is made of
+"""
+
+import hashlib
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+XI_INCLUDE = "{http://www.w3.org/2001/XInclude}include"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+
+MAIN_FILE = Path("source") / "main.ptx"
+PUBLICATION_FILE = Path("publication") / "publication.ptx"
+PROJECT_FILE = Path("project.ptx")
+
+DOCINFO_RE = re.compile(r"<docinfo>.*?</docinfo>", re.DOTALL)
+
+
+def file_hash(path):
+    """Return the sha256 hex digest of a file (empty string if missing)"""
+    path = Path(path)
+    if not path.exists():
+        return ""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def text_hash(text):
+    """Return the sha256 hex digest of a string"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def included_files(path):
+    """Files xi:included by a source file: [(path, parse)], existing files only"""
+    path = Path(path)
+    found = []
+    for node in ET.parse(path).getroot().iter(XI_INCLUDE):
+        target = path.parent / node.get("href", "")
+        if node.get("href") and target.is_file():
+            found.append((target.resolve(), node.get("parse", "xml")))
+    return found
+
+
+def source_tree(path):
+    """A source file followed by every XML file it includes, recursively"""
+    files = [Path(path).resolve()]
+    for target, parse in included_files(path):
+        if parse == "xml":
+            files += source_tree(target)
+    return files
+
+
+def tree_hash(path):
+    """Hash of a source file and every file it xi:includes, recursively
+
+    A file without includes hashes the same as file_hash.
+    """
+    digests = [file_hash(path)]
+    for target, parse in included_files(path):
+        digests.append(tree_hash(target) if parse == "xml" else file_hash(target))
+    return digests[0] if len(digests) == 1 else text_hash("\n".join(digests))
+
+
+def chapter_files(project_dir):
+    """Return the xi:included files of main.ptx, in book order"""
+    main_path = Path(project_dir) / MAIN_FILE
+    root = ET.parse(main_path).getroot()
+    return [
+        (main_path.parent / node.get("href")).resolve()
+        for node in root.iter(XI_INCLUDE)
+        if node.get("href")
+    ]
+
+
+def root_xml_id(path):
+    """Return the xml:id of the root element of a source file"""
+    for _, elem in ET.iterparse(path, events=("start",)):
+        return elem.get(XML_ID)
+    return None
+
+
+def docinfo_text(project_dir):
+    """Return the raw <docinfo> block of main.ptx (macros and preambles)"""
+    text = (Path(project_dir) / MAIN_FILE).read_text(encoding="utf-8")
+    match = DOCINFO_RE.search(text)
+    return match.group(0) if match else ""
+
+
+def main_without_docinfo(project_dir):
+    """Return main.ptx with the <docinfo> block removed"""
+    text = (Path(project_dir) / MAIN_FILE).read_text(encoding="utf-8")
+    return DOCINFO_RE.sub("", text, count=1)
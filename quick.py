@@ -6,31 +6,48 @@ Run this from anywhere - it handles everything automatically
 
 import subprocess
 import sys
-from pathlib import Path
 
-# Configuration
-PROJECT_DIR = Path(r"E:\maths\lc-maths")
-PYTHON_PATH = Path(r"C:\Users\ronan\anaconda3\envs\pretext\python.exe")
+from build_runner import build_targets, pretext_command, run_build
+from devserver import serve
+from incremental import record_full_build, run_incremental
+from latex_image_cache import generate_latex_images
+from lcmaths import ConfigError, find_project_dir, pretext_python
+from post_build import run_post_build
+from preview import preview
+from validator import check_source
+from watch import watch
 
-def run_pretext_command(*args):
-    """Run a pretext command"""
-    cmd = [str(PYTHON_PATH), "-m", "pretext"] + list(args)
+# Configuration: resolved in main() from $LCMATHS_PROJECT_DIR / the working
+# directory and $PRETEXT_PYTHON, as in lcmaths.py
+PROJECT_DIR = None
+PYTHON_PATH = None
+# --profile on the command line profiles every pretext build (build_profile.py)
+PROFILE = False
+# --math prerenders the math after a web build (math_prerender.py)
+MATH = False
+
+def run_pretext_command(*args, env=None):
+    """Run a pretext command, recording builds in the build history"""
+    cmd = pretext_command(PYTHON_PATH, *args)
     print(f"Running: {' '.join(cmd)}")
     print("-" * 60)
-    result = subprocess.run(cmd, cwd=PROJECT_DIR)
+    if args[0] == "build":
+        returncode = run_build(cmd, PROJECT_DIR, args[1], profile=PROFILE, env=env)["returncode"]
+    else:
+        returncode = subprocess.run(cmd, cwd=PROJECT_DIR, env=env).returncode
     print()
-    return result.returncode
+    return returncode
 
 def main():
     """Main function"""
+    global PROJECT_DIR, PYTHON_PATH, PROFILE, MATH
     
-    # Check project exists
-    if not PROJECT_DIR.exists():
-        print(f"Error: Project directory not found: {PROJECT_DIR}")
-        return 1
-    
-    if not (PROJECT_DIR / "project.ptx").exists():
-        print(f"Error: project.ptx not found in {PROJECT_DIR}")
+    # Find the project and the pretext interpreter
+    try:
+        PROJECT_DIR = find_project_dir()
+        PYTHON_PATH = pretext_python()
+    except ConfigError as error:
+        print(f"Error: {error}")
         return 1
     
     print("=" * 60)
@@ -42,12 +59,26 @@ def main():
     # Simple menu
     print("Choose an option:")
     print("  1. Quick view (no rebuild) - FASTEST")
-    print("  2. Build and view (default)")
+    print("  2. Build and view (incremental)")
     print("  3. Full rebuild (with asset generation)")
     print("  4. Build PDF")
+    print("  5. Watch (rebuild on save, live reload)")
+    print("  6. Build all (web + PDF in parallel)")
+    print("  7. Preview one section by xml:id")
     print()
     
-    choice = input("Enter choice (1-4, or just press Enter for quick view): ").strip()
+    if "--profile" in sys.argv:
+        sys.argv.remove("--profile")
+        PROFILE = True
+    if "--math" in sys.argv:
+        sys.argv.remove("--math")
+        MATH = True
+    
+    # A choice on the command line skips the prompt
+    if len(sys.argv) > 1:
+        choice = sys.argv[1]
+    else:
+        choice = input("Enter choice (1-7, or just press Enter for quick view): ").strip()
     
     # Default to quick view if no input
     if not choice:
@@ -55,29 +86,41 @@ def main():
     
     print()
     
+    # Catch broken includes, duplicate ids and bad xrefs before pretext does
+    if choice in ("2", "3", "4", "6") and check_source(PROJECT_DIR) != 0:
+        print("✗ Source validation failed - not building")
+        return 1
+    
     if choice == "1":
         # Just view - fastest option
         print("Opening existing build in browser...")
-        run_pretext_command("view", "web")
+        serve(PROJECT_DIR)
         
     elif choice == "2":
-        # Standard build and view
+        # Incremental build and view - only changed chapters
         print("Building web version...")
-        returncode = run_pretext_command("build", "web", "--no-generate")
+        returncode = run_incremental(run_pretext_command, PROJECT_DIR)
+        if returncode == 0:
+            returncode = run_post_build(PROJECT_DIR, math=MATH)
         if returncode == 0:
             print("✓ Build successful! Opening browser...")
-            run_pretext_command("view", "web")
+            serve(PROJECT_DIR)
         else:
             print("✗ Build failed!")
             return 1
             
     elif choice == "3":
-        # Full rebuild with assets
+        # Full rebuild - latex-images come from the cache unless changed
         print("Full rebuild with asset generation...")
-        returncode = run_pretext_command("build", "web", "-g")
+        returncode = generate_latex_images(run_pretext_command, PROJECT_DIR)
+        if returncode == 0:
+            returncode = run_pretext_command("build", "web", "--no-generate")
+        if returncode == 0:
+            record_full_build(PROJECT_DIR)
+            returncode = run_post_build(PROJECT_DIR, math=MATH)
         if returncode == 0:
             print("✓ Build successful! Opening browser...")
-            run_pretext_command("view", "web")
+            serve(PROJECT_DIR)
         else:
             print("✗ Build failed!")
             return 1
@@ -87,6 +130,31 @@ def main():
         print("Building PDF version...")
         run_pretext_command("build", "print")
         
+    elif choice == "5":
+        # Watch mode - debounced incremental rebuilds with live reload
+        print("Starting watch mode...")
+        watch(PROJECT_DIR, PYTHON_PATH, math=MATH)
+        
+    elif choice == "6":
+        # Release build - both targets at once
+        print("Building web and PDF in parallel...")
+        if build_targets(PYTHON_PATH, PROJECT_DIR, profile=PROFILE) != 0:
+            return 1
+        if run_post_build(PROJECT_DIR, math=MATH) != 0:
+            return 1
+        
+    elif choice == "7":
+        # Section preview - only that division, in a scratch project
+        if len(sys.argv) > 2:
+            xml_id = sys.argv[2]
+        else:
+            xml_id = input("xml:id of the section (e.g. primes): ").strip()
+        if not xml_id:
+            print("No xml:id given")
+            return 1
+        if preview(PROJECT_DIR, PYTHON_PATH, xml_id) != 0:
+            return 1
+        
     else:
         print(f"Invalid choice: {choice}")
         return 1
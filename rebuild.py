@@ -4,28 +4,46 @@ Quick rebuild script for LC Maths PreTeXt book
 Run this from the lc-maths directory
 """
 
+import os
 import subprocess
 import sys
-from pathlib import Path
 
-# Path to the PreTeXt Python environment
-PYTHON_PATH = r"C:\Users\ronan\anaconda3\envs\pretext\python.exe"
+from build_runner import build_targets, run_build
+from devserver import serve
+from incremental import record_full_build, run_incremental
+from lcmaths import ConfigError, find_project_dir, pretext_python
+from post_build import run_post_build
+from validator import check_source
+
+# PreTeXt Python environment: $PRETEXT_PYTHON, else this interpreter
+PYTHON_PATH = None
 
 def run_command(cmd):
-    """Run a command and display output"""
+    """Run a command and display output, recording builds in the build history"""
     print(f"Running: {' '.join(cmd)}")
     print("-" * 60)
-    result = subprocess.run(cmd, capture_output=False, text=True)
+    if "build" in cmd:
+        target = cmd[cmd.index("build") + 1]
+        returncode = run_build(cmd, ".", target)["returncode"]
+    else:
+        returncode = subprocess.run(cmd, capture_output=False, text=True).returncode
     print()
-    return result.returncode
+    return returncode
+
+def run_pretext(*args):
+    """Run a pretext subcommand with the PreTeXt Python environment"""
+    return run_command([PYTHON_PATH, "-m", "pretext"] + list(args))
 
 def main():
     """Main rebuild function"""
+    global PYTHON_PATH
     
-    # Check we're in the right directory
-    if not Path("project.ptx").exists():
-        print("Error: project.ptx not found!")
-        print("Make sure you're running this from E:\\maths\\lc-maths")
+    # Work from the project root, wherever we were started
+    try:
+        os.chdir(find_project_dir())
+        PYTHON_PATH = pretext_python()
+    except ConfigError as error:
+        print(f"Error: {error}")
         return 1
     
     print("=" * 60)
@@ -36,23 +54,37 @@ def main():
     # Ask what to build
     print("What would you like to do?")
     print("  1. Build web (HTML)")
-    print("  2. Build web and view")
+    print("  2. Build web and view (incremental)")
     print("  3. Build print (PDF)")
     print("  4. Just view existing web build")
+    print("  5. Build all (web + PDF in parallel)")
     print()
     
-    choice = input("Enter choice (1-4, default=2): ").strip() or "2"
+    # A choice on the command line skips the prompt
+    if len(sys.argv) > 1:
+        choice = sys.argv[1]
+    else:
+        choice = input("Enter choice (1-5, default=2): ").strip() or "2"
+    
+    # Catch broken includes, duplicate ids and bad xrefs before pretext does
+    if choice in ("1", "2", "3", "5") and check_source(".") != 0:
+        print("Source validation failed. Not building.")
+        return 1
     
     if choice == "1":
         # Build web only
-        run_command([PYTHON_PATH, "-m", "pretext", "build", "web"])
+        if run_command([PYTHON_PATH, "-m", "pretext", "build", "web"]) == 0:
+            record_full_build(".")
+            run_post_build(".")
         
     elif choice == "2":
-        # Build and view
-        returncode = run_command([PYTHON_PATH, "-m", "pretext", "build", "web"])
+        # Build and view - only chapters changed since the last build
+        returncode = run_incremental(run_pretext, ".")
+        if returncode == 0:
+            returncode = run_post_build(".")
         if returncode == 0:
             print("Build successful! Opening browser...")
-            run_command([PYTHON_PATH, "-m", "pretext", "view", "web"])
+            serve(".")
         else:
             print("Build failed. Not opening browser.")
             
@@ -62,7 +94,14 @@ def main():
         
     elif choice == "4":
         # Just view
-        run_command([PYTHON_PATH, "-m", "pretext", "view", "web"])
+        serve(".")
+        
+    elif choice == "5":
+        # Release build - web and print at the same time
+        if build_targets(PYTHON_PATH, ".") != 0:
+            return 1
+        if run_post_build(".") != 0:
+            return 1
         
     else:
         print(f"Invalid choice: {choice}")
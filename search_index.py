@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Offline full-text search for the LC Maths web output
+Tokenises the rendered pages - titles, <term> entries (dfn), definitions and
+body text, including the hidden knowl content PreTeXt inlines in each page -
+into an inverted index with one shard per strand (chapter). Postings are
+flat arrays of delta-encoded document numbers with parallel weights, and
+search.js answers prefix queries in the browser. It fetches a strand's shard
+only when a search covers that strand: the whole book, or the one strand the
+search is scoped to. Pages whose content has not changed since the last
+run are not re-tokenised.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+from html.parser import HTMLParser
+from pathlib import Path
+
+from knowl_bundle import inject_script, page_chapters
+from source_output import write_if_changed
+
+CACHE_FILE = Path(".build-cache") / "search-docs.json"
+SEARCH_DIR = "search"
+SHARD_NAME = "index-{strand}.json"
+MANIFEST_NAME = "manifest.json"
+CLIENT_NAME = "search.js"
+FALLBACK_STRAND = "book"
+CACHE_VERSION = 1
+
+TITLE_WEIGHT = 8
+TERM_WEIGHT = 5
+DEFINITION_WEIGHT = 3
+BODY_WEIGHT = 1
+
+MAIN_RE = re.compile(r'<main class="main">.*?</main>', re.DOTALL)
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SKIP_CLASSES = {"process-math", "prerendered-math", "displaymath"}
+# Shown in result titles but not worth indexing
+UNINDEXED_CLASSES = {"codenumber"}
+VOID_TAGS = {"area", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+             "source", "track", "wbr"}
+STOPWORDS = set("""
+a an and are as at be by for from has have if in is it its of on or so that the
+their then there these this to was we were what when which with you your
+""".split())
+
+CLIENT_JS = r"""// Offline search over the shards written by search_index.py
+(function () {
+  var base = document.currentScript.src.replace(/[^\/]*$/, "");
+  var manifest = null;
+  var shards = {};
+
+  function getJSON(url) {
+    return fetch(url).then(function (r) { return r.json(); });
+  }
+
+  function loadManifest() {
+    if (!manifest) {
+      manifest = getJSON(base + "search/manifest.json");
+    }
+    return manifest;
+  }
+
+  // Fetched on first use, so a scoped search never loads the other strands
+  function loadShard(strand) {
+    if (!shards[strand]) {
+      shards[strand] = getJSON(base + "search/index-" + strand + ".json");
+    }
+    return shards[strand];
+  }
+
+  function tokens(text) {
+    return (text.toLowerCase().match(/[a-z0-9]+/g) || []);
+  }
+
+  // First index in the sorted term list that is >= prefix
+  function lowerBound(terms, prefix) {
+    var lo = 0, hi = terms.length;
+    while (lo < hi) {
+      var mid = (lo + hi) >> 1;
+      if (terms[mid] < prefix) { lo = mid + 1; } else { hi = mid; }
+    }
+    return lo;
+  }
+
+  // doc -> score for every term starting with prefix
+  function prefixScores(shard, prefix) {
+    var scores = {};
+    for (var t = lowerBound(shard.terms, prefix);
+         t < shard.terms.length && shard.terms[t].lastIndexOf(prefix, 0) === 0; t++) {
+      var doc = 0;
+      for (var i = shard.offsets[t]; i < shard.offsets[t + 1]; i++) {
+        doc += shard.ids[i];
+        scores[doc] = Math.max(scores[doc] || 0, shard.weights[i]);
+      }
+    }
+    return scores;
+  }
+
+  function searchShard(shard, words) {
+    var total = null;
+    words.forEach(function (word) {
+      var scores = prefixScores(shard, word);
+      if (total === null) { total = scores; return; }
+      Object.keys(total).forEach(function (doc) {
+        if (scores[doc] === undefined) { delete total[doc]; } else { total[doc] += scores[doc]; }
+      });
+    });
+    return Object.keys(total || {}).map(function (doc) {
+      return { url: shard.docs[doc][0], title: shard.docs[doc][1], score: total[doc] };
+    });
+  }
+
+  // Search one strand, or the whole book when scope is ""
+  function search(query, scope, render) {
+    var words = tokens(query);
+    if (!words.length) { render([]); return; }
+    loadManifest().then(function (m) {
+      var results = [];
+      // Show results as each strand's shard arrives
+      (scope ? [scope] : m.strands).forEach(function (strand) {
+        loadShard(strand).then(function (shard) {
+          results = results.concat(searchShard(shard, words));
+          results.sort(function (a, b) { return b.score - a.score; });
+          render(results.slice(0, 20));
+        });
+      });
+    });
+  }
+
+  function install() {
+    var box = document.createElement("div");
+    box.className = "offline-search";
+    box.style.cssText = "position:relative;display:inline-block;margin:0 0.5em;";
+    var input = document.createElement("input");
+    input.type = "search";
+    input.placeholder = "Search";
+    input.setAttribute("aria-label", "Search the book");
+    var list = document.createElement("ul");
+    list.style.cssText = "position:absolute;z-index:100;background:#fff;list-style:none;" +
+      "margin:0;padding:0;min-width:22em;max-height:60vh;overflow:auto;" +
+      "box-shadow:0 2px 6px rgba(0,0,0,0.3);";
+    var scope = document.createElement("select");
+    scope.setAttribute("aria-label", "Search in");
+    scope.add(new Option("Whole book", ""));
+    box.appendChild(input);
+    box.appendChild(scope);
+    box.appendChild(list);
+    // Only the small manifest is fetched up front, to list the strands
+    function listStrands() {
+      loadManifest().then(function (m) {
+        if (scope.options.length > 1) { return; }
+        m.strands.forEach(function (strand) { scope.add(new Option(strand, strand)); });
+      });
+    }
+    input.addEventListener("focus", listStrands);
+    scope.addEventListener("focus", listStrands);
+    function update() {
+      var query = input.value, strand = scope.value;
+      search(query, strand, function (results) {
+        if (input.value !== query || scope.value !== strand) { return; }
+        list.innerHTML = "";
+        results.forEach(function (r) {
+          var li = document.createElement("li");
+          var a = document.createElement("a");
+          a.href = base + r.url;
+          a.textContent = r.title;
+          a.style.cssText = "display:block;padding:0.3em 0.6em;";
+          li.appendChild(a);
+          list.appendChild(li);
+        });
+      });
+    }
+    input.addEventListener("input", update);
+    scope.addEventListener("change", update);
+    var bar = document.querySelector("#primary-navbar .navbar-top-buttons") || document.body;
+    bar.insertBefore(box, bar.firstChild);
+  }
+
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", install);
+  } else {
+    install();
+  }
+})();
+"""
+
+
+def tokenize(text):
+    """Lower-case word tokens, without stopwords and single letters"""
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+class PageTokenizer(HTMLParser):
+    """Split a page's <main> into documents (the page, and each article/knowl
+    with an id) and collect weighted tokens and a title for each"""
+
+    def __init__(self, page):
+        super().__init__(convert_charrefs=True)
+        self.page = page
+        self.docs = {}
+        self.order = []
+        self.stack = []  # (tag, doc, weight, skip, heading, indexed)
+
+    def doc(self, key):
+        if key not in self.docs:
+            self.docs[key] = {"title": [], "tokens": {}, "title_done": False}
+            self.order.append(key)
+        return self.docs[key]
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+        doc, weight, skip, heading, indexed = ((None, BODY_WEIGHT, False, False, True)
+                                               if not self.stack else self.stack[-1][1:])
+        element_id = attrs.get("id")
+        if doc is None and tag == "section" and element_id:
+            doc = ""
+        elif element_id and tag == "article":
+            doc = element_id
+        elif element_id and doc == "" and "hidden-content" in classes:
+            # Hidden knowl content (hk-X) belongs to the article X it expands;
+            # hints and answers inside an article stay with that article
+            doc = element_id[3:] if element_id.startswith("hk-") else element_id
+        if doc is not None:
+            self.doc(doc)
+        if tag in ("script", "style") or classes & SKIP_CLASSES:
+            skip = True
+        if classes & UNINDEXED_CLASSES:
+            indexed = False
+        if re.fullmatch(r"h[1-6]", tag) and doc is not None and not self.docs[doc]["title_done"]:
+            heading = True
+        if heading or "title" in classes:
+            weight = max(weight, TITLE_WEIGHT)
+        elif tag == "dfn":
+            weight = max(weight, TERM_WEIGHT)
+        elif "definition" in classes:
+            weight = max(weight, DEFINITION_WEIGHT)
+        if tag not in VOID_TAGS:
+            self.stack.append((tag, doc, weight, skip, heading, indexed))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                closing = self.stack[i]
+                del self.stack[i:]
+                if closing[4] and closing[1] is not None:
+                    self.docs[closing[1]]["title_done"] = True
+                return
+
+    def handle_data(self, data):
+        if not self.stack:
+            return
+        _, doc, weight, skip, heading, indexed = self.stack[-1]
+        if doc is None or skip:
+            return
+        entry = self.docs[doc]
+        if heading:
+            entry["title"].append(data)
+        if not indexed:
+            return
+        for token in tokenize(data):
+            entry["tokens"][token] = max(entry["tokens"].get(token, 0), weight)
+
+    def documents(self):
+        """[(url, title, {token: weight})] in page order"""
+        titles = {key: " ".join("".join(entry["title"]).split()).rstrip(". ")
+                  for key, entry in self.docs.items()}
+        page_title = titles.get("") or self.page
+        result = []
+        for key in self.order:
+            if not self.docs[key]["tokens"]:
+                continue
+            title = titles[key]
+            if not re.search(r"[A-Za-z]", title):
+                # Bare exercise numbers: say which exercises they belong to
+                title = f"{page_title} {title}".strip()
+            url = self.page + ("#" + key if key else "")
+            result.append((url, title, self.docs[key]["tokens"]))
+        return result
+
+
+def main_region(text):
+    """The <main> element of a page, or '' if it has none"""
+    match = MAIN_RE.search(text)
+    return match.group(0) if match else ""
+
+
+def content_hash(region):
+    """Hash that ignores whitespace, so minification does not count as a change"""
+    return hashlib.sha256(re.sub(r"\s+", "", region).encode("utf-8")).hexdigest()
+
+
+def build_shard(docs):
+    """Inverted index for one strand: sorted terms, offsets, delta ids, weights"""
+    postings = {}
+    for number, (_, _, tokens) in enumerate(docs):
+        for token, weight in tokens.items():
+            postings.setdefault(token, []).append((number, weight))
+    terms = sorted(postings)
+    offsets, ids, weights = [0], [], []
+    for term in terms:
+        previous = 0
+        for number, weight in postings[term]:
+            ids.append(number - previous)
+            weights.append(weight)
+            previous = number
+        offsets.append(len(ids))
+    return {
+        "docs": [[url, title] for url, title, _ in docs],
+        "terms": terms,
+        "offsets": offsets,
+        "ids": ids,
+        "weights": weights,
+    }
+
+
+def build_search_index(project_dir, web_dir=None):
+    """Index output/web into per-strand shards; return 0"""
+    project_dir = Path(project_dir)
+    web_dir = Path(web_dir) if web_dir else project_dir / "output" / "web"
+    cache_path = project_dir / CACHE_FILE
+    cache = {}
+    if cache_path.exists():
+        data = json.loads(cache_path.read_text(encoding="utf-8"))
+        if data.get("version") == CACHE_VERSION:
+            cache = data["pages"]
+
+    chapters = page_chapters(project_dir)
+    pages = {}
+    tokenized = 0
+    for path in sorted(web_dir.glob("*.html")):
+        region = main_region(path.read_text(encoding="utf-8"))
+        if not region:
+            continue
+        digest = content_hash(region)
+        entry = cache.get(path.name)
+        if entry is None or entry["hash"] != digest:
+            tokenizer = PageTokenizer(path.name)
+            tokenizer.feed(region)
+            tokenizer.close()
+            entry = {"hash": digest, "docs": tokenizer.documents()}
+            tokenized += 1
+        entry["strand"] = chapters.get(path.name, FALLBACK_STRAND)
+        pages[path.name] = entry
+
+    strands = {}
+    for name in sorted(pages):
+        strands.setdefault(pages[name]["strand"], []).extend(pages[name]["docs"])
+    search_dir = web_dir / SEARCH_DIR
+    search_dir.mkdir(parents=True, exist_ok=True)
+    total_bytes = 0
+    for strand, docs in sorted(strands.items()):
+        shard = json.dumps(build_shard(docs), separators=(",", ":"))
+        write_if_changed(search_dir / SHARD_NAME.format(strand=strand), shard)
+        total_bytes += len(shard)
+    for stale in search_dir.glob(SHARD_NAME.format(strand="*")):
+        if stale.name not in {SHARD_NAME.format(strand=s) for s in strands}:
+            stale.unlink()
+    manifest = {"strands": sorted(strands)}
+    write_if_changed(search_dir / MANIFEST_NAME, json.dumps(manifest))
+    write_if_changed(web_dir / CLIENT_NAME, CLIENT_JS)
+    inject_script(web_dir, CLIENT_NAME)
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    write_if_changed(cache_path, json.dumps({"version": CACHE_VERSION, "pages": pages},
+                                            separators=(",", ":")))
+    documents = sum(len(docs) for docs in strands.values())
+    print(f"Search: {documents} document(s) in {len(strands)} shard(s), "
+          f"{total_bytes / 1024:.0f} KB; re-tokenised {tokenized}/{len(pages)} page(s)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline search index for output/web")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--web-dir", help="built web output (default: output/web)")
+    args = parser.parse_args()
+    return build_search_index(args.project_dir, args.web_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Shared output layer for the LC Maths source-generating scripts
+Skips writes whose content is identical to the file on disk, replaces
+changed files atomically, and records which source files actually changed
+in .build-cache/changed-sources.json for downstream builds. The summary is
+itself written only when its file list changes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from ptx_source import root_xml_id
+
+SUMMARY_FILE = Path(".build-cache") / "changed-sources.json"
+
+
+def write_if_changed(path, content):
+    """
+    Write `content` (str or bytes) to `path` only if it differs.
+
+    The new file is written to a temporary file in the same directory and
+    renamed over the old one, so readers never see a half-written file.
+    Returns True if the file changed.
+    """
+    path = Path(path)
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    if path.exists():
+        old = hashlib.sha256(path.read_bytes()).digest()
+        if old == hashlib.sha256(data).digest():
+            return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            os.chmod(tmp, path.stat().st_mode & 0o777)
+        else:
+            # mkstemp creates 0600 files; use the usual umask-based mode
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return True
+
+
+class SourceOutput:
+    """Writes source files for one script run and summarises what changed"""
+
+    def __init__(self, project_dir):
+        self.project_dir = Path(project_dir)
+        self.changed = []
+
+    def relative(self, path):
+        """Path relative to the project, in posix form when possible"""
+        try:
+            return Path(path).resolve().relative_to(self.project_dir.resolve()).as_posix()
+        except ValueError:
+            return str(path)
+
+    def write(self, path, content):
+        """Write one file if it changed; return True if it did"""
+        changed = write_if_changed(path, content)
+        # A file written twice in one run is listed once
+        if changed and Path(path) not in self.changed:
+            self.changed.append(Path(path))
+        return changed
+
+    def summary(self):
+        """Machine-readable summary of this run: the changed files, sorted"""
+        changed = []
+        for path in sorted(self.changed, key=self.relative):
+            entry = {"path": self.relative(path)}
+            if path.suffix == ".ptx":
+                entry["xml_id"] = root_xml_id(path)
+            changed.append(entry)
+        return {"changed": changed}
+
+    def save(self):
+        """Write the summary to .build-cache/changed-sources.json and print it"""
+        path = self.project_dir / SUMMARY_FILE
+        write_if_changed(path, json.dumps(self.summary(), indent=2) + "\n")
+        if self.changed:
+            print(f"Changed: {', '.join(entry['path'] for entry in self.summary()['changed'])}")
+        else:
+            print("No source files changed.")
+        return path
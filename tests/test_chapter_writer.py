@@ -0,0 +1,32 @@
+"""Regenerating one element of a generated chapter by xml:id"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from chapter_writer import Block, Division, Paragraph, update_chapter, write_chapter  # noqa: E402
+
+
+def elements(statement):
+    yield Division("section", "first", "First", [
+        Block("definition", "def-one", "One", [statement]),
+    ])
+    yield Division("section", "second", "Second", [Paragraph("Second section.")])
+
+
+def test_regenerate_one_element_keeps_the_rest(tmp_path):
+    path = tmp_path / "chapter.ptx"
+    update_chapter(path, write_chapter("ch", "Chapter", elements("Old statement.")))
+    # A hand edit elsewhere, and a comment that looks like the element's opening tag
+    edited = path.read_text(encoding="utf-8").replace(
+        "Second section.", 'Second&nbsp;section. <!-- <definition xml:id="def-one"> -->')
+    path.write_text(edited, encoding="utf-8")
+
+    writer = write_chapter("ch", "Chapter", elements("New statement."))
+    assert update_chapter(path, writer, "def-one")
+
+    text = path.read_text(encoding="utf-8")
+    assert "New statement." in text and "Old statement." not in text
+    assert '<!-- <definition xml:id="def-one"> -->' in text
+    assert text == edited.replace("Old statement.", "New statement.")
@@ -0,0 +1,90 @@
+"""Packing knowls after full and partial (-x) builds"""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import knowl_bundle  # noqa: E402
+
+MAIN = """<?xml version="1.0" encoding="UTF-8"?>
+<pretext xmlns:xi="http://www.w3.org/2001/XInclude">
+  <book xml:id="book">
+    <xi:include href="ch-a.ptx"/>
+    <xi:include href="ch-b.ptx"/>
+  </book>
+</pretext>
+"""
+
+CHAPTER = """<?xml version="1.0" encoding="UTF-8"?>
+<chapter xml:id="{chapter}"><section xml:id="{chapter}-sec"/></chapter>
+"""
+
+
+def knowl(body, page=None, refs=()):
+    incontext = f'<span class="incontext"><a href="{page}#x">in context</a></span>' if page else ""
+    links = "".join(f'<a data-knowl="./knowl/{ref}">more</a>' for ref in refs)
+    return (f'<!DOCTYPE html><html><head></head><body class="pretext-content">\n'
+            f'<p>{body}</p>{links}{incontext}</body></html>')
+
+
+# Every knowl of a full build: two chapters, a hidden solution and the
+# frontmatter, which falls back to the book bundle
+FULL_BUILD = {
+    "a-1.html": knowl("a one", "ch-a-sec.html", ["a-1-hidden.html"]),
+    "a-1-hidden.html": knowl("a one hidden"),
+    "b-1.html": knowl("b one", "ch-b-sec.html"),
+    "front-1.html": knowl("front one", "frontmatter.html"),
+    "orphan-hidden.html": knowl("not opened from anywhere"),
+}
+
+
+def write_knowls(web_dir, knowls):
+    knowl_dir = web_dir / "knowl"
+    knowl_dir.mkdir(parents=True, exist_ok=True)
+    for name, text in knowls.items():
+        (knowl_dir / name).write_text(text, encoding="utf-8")
+
+
+def bundled_bodies(web_dir):
+    knowl_dir = web_dir / "knowl"
+    index = json.loads((knowl_dir / knowl_bundle.INDEX_NAME).read_text(encoding="utf-8"))
+    bodies = {}
+    for name, (bundle, offset, length, _) in index["knowls"].items():
+        data = (knowl_dir / index["bundles"][bundle]).read_bytes()
+        bodies[name] = data[offset:offset + length].decode("utf-8")
+    return bodies
+
+
+def make_project(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "main.ptx").write_text(MAIN, encoding="utf-8")
+    for chapter in ("ch-a", "ch-b"):
+        (source / f"{chapter}.ptx").write_text(CHAPTER.format(chapter=chapter), encoding="utf-8")
+    web_dir = tmp_path / "output" / "web"
+    web_dir.mkdir(parents=True)
+    return web_dir
+
+
+def test_partial_rebuild_keeps_other_knowls(tmp_path):
+    web_dir = make_project(tmp_path)
+    write_knowls(web_dir, FULL_BUILD)
+    assert knowl_bundle.pack_knowls(tmp_path) == 0
+    before = bundled_bodies(web_dir)
+    assert set(before) == set(FULL_BUILD)
+    assert not list((web_dir / "knowl").glob("*.html"))
+
+    # `-x ch-a` writes only that chapter's knowls; its hidden knowl is not
+    # opened by a rebuilt knowl this time, so it lands in the book bundle
+    rebuilt = {"a-1.html": knowl("a one, edited", "ch-a-sec.html"),
+               "a-1-hidden.html": FULL_BUILD["a-1-hidden.html"]}
+    write_knowls(web_dir, rebuilt)
+    assert knowl_bundle.pack_knowls(tmp_path) == 0
+    after = bundled_bodies(web_dir)
+
+    assert set(after) >= set(before)
+    assert "a one, edited" in after["a-1.html"]
+    for name in ("b-1.html", "front-1.html", "orphan-hidden.html"):
+        assert after[name] == before[name]
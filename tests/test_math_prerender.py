@@ -0,0 +1,67 @@
+"""Prerendering math with a stand-in renderer"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import math_prerender  # noqa: E402
+
+MAIN = """<?xml version="1.0" encoding="UTF-8"?>
+<pretext><docinfo><macros>\\newcommand{\\N}{\\mathbb{N}}</macros></docinfo><book/></pretext>
+"""
+
+PAGE = """<!DOCTYPE html><html><head>
+<script>window.MathJax = {
+  tex: {}
+};
+</script><script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-chtml.js"></script>
+</head><body><main class="main">{math}</main></body></html>
+"""
+
+
+def fake_render(project_dir, macros, items):
+    return "svg{}", [f"<svg>{tex}</svg>" for tex, _ in items]
+
+
+def make_project(tmp_path, expressions):
+    (tmp_path / "source").mkdir(exist_ok=True)
+    (tmp_path / "source" / "main.ptx").write_text(MAIN, encoding="utf-8")
+    web_dir = tmp_path / "output" / "web"
+    web_dir.mkdir(parents=True, exist_ok=True)
+    math = "".join(f'<span class="process-math">\\({tex}\\)</span>' for tex in expressions)
+    (web_dir / "page.html").write_text(PAGE.replace("{math}", math), encoding="utf-8")
+    return web_dir
+
+
+def test_prerendered_page_keeps_a_mathjax_stub(tmp_path, monkeypatch):
+    monkeypatch.setattr(math_prerender, "render", fake_render)
+    web_dir = make_project(tmp_path, ["x^2", "\\N"])
+    assert math_prerender.prerender_math(tmp_path) == 0
+    text = (web_dir / "page.html").read_text(encoding="utf-8")
+    assert "<svg>x^2</svg>" in text
+    assert "tex-chtml.js" not in text
+    assert text.count(math_prerender.MATHJAX_STUB) == 1
+    # A second run leaves the page alone
+    assert math_prerender.prerender_math(tmp_path) == 0
+    assert (web_dir / "page.html").read_text(encoding="utf-8") == text
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = math_prerender.MathCache(tmp_path, "", max_bytes=40)
+    cache.now = 1
+    cache.store([("a", False), ("b", False), ("c", False)],
+                ["<svg>a</svg>", "<svg>b</svg>", "<svg>c</svg>"], "")
+    cache.save()
+    # This run needs more than fits, so nothing it uses is dropped
+    assert cache.evictions == 0
+
+    cache = math_prerender.MathCache(tmp_path, "", max_bytes=40)
+    cache.now = 2
+    assert ("b", False) in cache
+    cache.store([("d", False)], ["<svg>d</svg>"], "")
+    cache.save()
+    assert cache.evictions == 1
+    assert ("a", False) not in cache
+    assert [("b", False) in cache, ("c", False) in cache] == [True, True]
+    assert cache.get("d", False) == "<svg>d</svg>"
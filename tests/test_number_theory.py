@@ -0,0 +1,33 @@
+"""Factorising with the smallest-prime-factor table"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from number_theory import load_table  # noqa: E402
+
+
+@pytest.fixture
+def table(tmp_path):
+    table = load_table(tmp_path, limit=1000)
+    yield table
+    table.close()
+
+
+def test_factorise(table):
+    assert table.factorise(360) == [(2, 3), (3, 2), (5, 1)]
+    assert table.factorise(997) == [(997, 1)]
+    # The empty product
+    assert table.factorise(1) == []
+    assert table.divisor_count(1) == 1
+    assert table.divides(1, 84) and not table.divides(84, 1)
+    assert table.hcf(1, 84) == 1 and table.lcm(1, 84) == 84
+
+
+def test_factorise_outside_table(table):
+    for n in (0, -4, 1000):
+        with pytest.raises(ValueError):
+            table.factorise(n)
@@ -5,6 +5,8 @@ Update the LC Maths preface with comprehensive "How to Use This Book" content
 
 from pathlib import Path
 
+from source_output import SourceOutput
+
 def update_preface(base_path):
     """Update main.ptx with comprehensive preface"""
     
@@ -336,7 +338,12 @@ def update_preface(base_path):
 '''
     
     filepath = base_path / 'source' / 'main.ptx'
-    filepath.write_text(content, encoding='utf-8')
+    output = SourceOutput(base_path)
+    changed = output.write(filepath, content)
+    output.save()
+    if not changed:
+        print(f"✓ Preface already up to date: {filepath}")
+        return
     print(f"✓ Updated {filepath}")
     print()
     print("=" * 60)
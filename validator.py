@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Fast pre-build validator for the LC Maths source tree
+Streams source/main.ptx and every xi:included file through expat and
+checks, before pretext spends a minute finding out the hard way:
+
+- well-formedness
+- xi:include targets exist (and do not include themselves in a loop)
+- xml:id values are unique across the whole book
+- xref targets (@ref, @first, @last) exist
+
+Every problem is reported as file:line. Exits 1 if anything is wrong.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from xml.parsers import expat
+
+from ptx_source import MAIN_FILE, XI_INCLUDE, XML_ID
+
+XREF_ATTRIBUTES = ("ref", "first", "last")
+
+
+class Problem:
+    __slots__ = ("path", "line", "message")
+
+    def __init__(self, path, line, message):
+        self.path = path
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return f"{self.path}:{self.line}: {self.message}"
+
+
+# Plain classes rather than dataclasses: importing dataclasses (and inspect)
+# would cost more than the whole scan of a small book
+class FileScan:
+    """What one source file declares and refers to"""
+    __slots__ = ("path", "ids", "xrefs", "includes", "error")
+
+    def __init__(self, path):
+        self.path = path
+        # Each entry ends with the xml:id of the nearest enclosing element that has one
+        self.ids = []       # (xml:id, line, tag, parent)
+        self.xrefs = []     # (target xml:id, line, parent)
+        self.includes = []  # (href, line, parse, parent)
+        self.error = None
+
+
+def clark_name(name):
+    """expat's 'uri}local' names in ElementTree's '{uri}local' form"""
+    return "{" + name if "}" in name else name
+
+
+def scan_file(path):
+    """Stream one file through expat and collect ids, xrefs and includes"""
+    path = Path(path)
+    scan = FileScan(path)
+    parser = expat.ParserCreate(namespace_separator="}")
+    # Nearest xml:id in scope for each open element
+    scope = [None]
+
+    def start(name, attrs):
+        line = parser.CurrentLineNumber
+        tag = clark_name(name)
+        attrs = {clark_name(key): value for key, value in attrs.items()}
+        parent = scope[-1]
+        if XML_ID in attrs:
+            scan.ids.append((attrs[XML_ID], line, tag, parent))
+        if tag == XI_INCLUDE:
+            scan.includes.append((attrs.get("href", ""), line, attrs.get("parse", "xml"),
+                                  parent))
+        elif tag == "xref":
+            for attr in XREF_ATTRIBUTES:
+                for target in attrs.get(attr, "").replace(",", " ").split():
+                    scan.xrefs.append((target, line, parent))
+        scope.append(attrs.get(XML_ID, parent))
+
+    def end(name):
+        scope.pop()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    try:
+        with open(path, "rb") as f:
+            parser.ParseFile(f)
+    except expat.ExpatError as error:
+        scan.error = Problem(path, error.lineno,
+                             f"not well-formed: {expat.ErrorString(error.code)}")
+    return scan
+
+
+def scan_book(project_dir, main_file=MAIN_FILE):
+    """Scan main.ptx and everything it includes, depth first in book order
+
+    Returns (scans in book order, problems found while following includes).
+    """
+    scans = []
+    problems = []
+    seen = set()
+
+    def visit(path, stack):
+        scan = scan_file(path)
+        scans.append(scan)
+        seen.add(path)
+        for href, line, parse, _ in scan.includes:
+            target = (path.parent / href).resolve()
+            if not href:
+                problems.append(Problem(path, line, "xi:include without @href"))
+            elif not target.is_file():
+                problems.append(Problem(path, line, f"xi:include target not found: {href}"))
+            elif target in stack:
+                problems.append(Problem(path, line, f"xi:include loop: {href}"))
+            elif parse == "xml" and target not in seen:
+                visit(target, stack + [target])
+
+    main_path = (Path(project_dir) / main_file).resolve()
+    if not main_path.is_file():
+        return [], [Problem(main_path, 0, "file not found")]
+    visit(main_path, [main_path])
+    return scans, problems
+
+
+def relative(path, project_dir):
+    """Path relative to the project when possible, for short messages"""
+    try:
+        return Path(path).relative_to(Path(project_dir).resolve())
+    except ValueError:
+        return Path(path)
+
+
+def validate(project_dir):
+    """Return (problems, scans) for the whole book"""
+    scans, problems = scan_book(project_dir)
+    declared = {}
+    for scan in scans:
+        if scan.error:
+            problems.append(scan.error)
+        for xml_id, line, _, _ in scan.ids:
+            if xml_id in declared:
+                first = relative(declared[xml_id][0], project_dir)
+                problems.append(Problem(scan.path, line, f"duplicate xml:id '{xml_id}' "
+                                        f"(first at {first}:{declared[xml_id][1]})"))
+            else:
+                declared[xml_id] = (scan.path, line)
+    for scan in scans:
+        for target, line, _ in scan.xrefs:
+            if target not in declared:
+                problems.append(Problem(scan.path, line, f"xref to unknown xml:id '{target}'"))
+    return problems, scans
+
+
+def check_source(project_dir):
+    """Validate the book and print a report; return 0 if clean, 1 otherwise"""
+    started = time.perf_counter()
+    problems, scans = validate(project_dir)
+    elapsed = time.perf_counter() - started
+    for problem in sorted(problems, key=lambda p: (str(p.path), p.line)):
+        print(Problem(relative(problem.path, project_dir), problem.line, problem.message))
+    ids = sum(len(scan.ids) for scan in scans)
+    xrefs = sum(len(scan.xrefs) for scan in scans)
+    summary = (f"{len(scans)} file(s), {ids} xml:id(s), {xrefs} xref(s) "
+               f"in {elapsed * 1000:.0f} ms")
+    if problems:
+        print(f"Source validation failed: {len(problems)} problem(s); {summary}")
+        return 1
+    print(f"Source OK: {summary}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the PreTeXt source tree")
+    parser.add_argument("project_dir", nargs="?", default=".")
+    args = parser.parse_args()
+    return check_source(args.project_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Watch mode for LC Maths
+Monitors source/, publication/ and project.ptx, rebuilds the web target
+after a burst of saves settles, runs the post-build stages on the result
+(post_build.py: search index, knowl bundles, compression) and reloads the
+open pages that changed.
+
+Uses inotify on Linux and falls back to polling elsewhere (e.g. Windows).
+"""
+
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import struct
+import sys
+from pathlib import Path
+
+from build_runner import kill_tree
+from devserver import DevServer
+from incremental import plan_build, save_manifest
+from post_build import run_post_build
+from validator import check_source
+from web_compress import SIDECARS
+
+WATCHED_DIRS = ("source", "publication")
+WATCHED_FILES = ("project.ptx",)
+IGNORED_SUFFIXES = ("~", ".swp", ".swx", ".tmp")
+
+# inotify(7) constants
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_relevant(name):
+    """Ignore editor swap and backup files"""
+    return not (name.startswith(".#") or name.endswith(IGNORED_SUFFIXES))
+
+
+def page_hashes(web_dir):
+    """Hash every file in the web output, keyed by its URL path"""
+    hashes = {}
+    for path in Path(web_dir).rglob("*"):
+        if path.is_file():
+            rel = path.relative_to(web_dir).as_posix()
+            hashes[rel] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return hashes
+
+
+def sidecar_source(page):
+    """The file a precompressed .gz/.br sidecar was made from, else `page`"""
+    for suffix in SIDECARS:
+        if page.endswith(suffix):
+            return page[:-len(suffix)]
+    return page
+
+
+class InotifyWatcher:
+    """Recursive inotify watcher feeding an asyncio callback"""
+
+    def __init__(self, project_dir, on_change):
+        self.project_dir = Path(project_dir)
+        self.on_change = on_change
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add_watch(self, directory):
+        """Watch a directory (not recursive on its own)"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = Path(directory)
+
+    def start(self, loop):
+        """Add the watches and register the fd with the event loop"""
+        self.add_watch(self.project_dir)
+        for name in WATCHED_DIRS:
+            root = self.project_dir / name
+            if root.is_dir():
+                self.add_watch(root)
+                for sub in root.rglob("*"):
+                    if sub.is_dir():
+                        self.add_watch(sub)
+        loop.add_reader(self.fd, self.read_events)
+
+    def read_events(self):
+        """Drain pending events and report relevant paths"""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += length
+            directory = self.watches.get(wd)
+            if directory is None or not name or not is_relevant(name):
+                continue
+            path = directory / name
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_watch(path)
+            if directory == self.project_dir and name not in WATCHED_FILES:
+                continue
+            self.on_change(path)
+
+
+class PollingWatcher:
+    """mtime polling fallback for platforms without inotify"""
+
+    def __init__(self, project_dir, on_change, interval=0.5):
+        self.project_dir = Path(project_dir)
+        self.on_change = on_change
+        self.interval = interval
+        self.mtimes = {}
+
+    def scan(self):
+        """Return {path: mtime} for every watched file"""
+        mtimes = {}
+        paths = [self.project_dir / name for name in WATCHED_FILES]
+        for name in WATCHED_DIRS:
+            paths += (self.project_dir / name).rglob("*")
+        for path in paths:
+            if path.is_file() and is_relevant(path.name):
+                mtimes[path] = path.stat().st_mtime_ns
+        return mtimes
+
+    def start(self, loop):
+        """Take the initial snapshot and start polling"""
+        self.mtimes = self.scan()
+        loop.create_task(self.poll())
+
+    async def poll(self):
+        """Report files whose mtime changed or that appeared or vanished"""
+        while True:
+            await asyncio.sleep(self.interval)
+            current = self.scan()
+            for path in set(current) | set(self.mtimes):
+                if current.get(path) != self.mtimes.get(path):
+                    self.on_change(path)
+            self.mtimes = current
+
+
+class Watcher:
+    """Debounced rebuild loop with coalescing and live reload"""
+
+    def __init__(self, project_dir, python, debounce=0.3, port=8128, math=False):
+        self.project_dir = Path(project_dir)
+        self.python = python
+        self.debounce = debounce
+        self.math = math
+        self.web_dir = self.project_dir / "output" / "web"
+        self.server = DevServer(self.web_dir, port=port, live_reload=True)
+        self.pending = set()
+        self.timer = None
+        self.build_task = None
+        self.published = None
+
+    def on_change(self, path):
+        """Record a change and restart the debounce window"""
+        self.pending.add(path)
+        if self.timer is not None:
+            self.timer.cancel()
+        loop = asyncio.get_running_loop()
+        self.timer = loop.call_later(self.debounce, self.trigger)
+
+    def trigger(self):
+        """Start a rebuild, cancelling any build already in progress"""
+        self.timer = None
+        changed, self.pending = self.pending, set()
+        previous = self.build_task
+        if previous is not None and not previous.done():
+            print("Change during build - restarting")
+            previous.cancel()
+        names = ", ".join(sorted(os.path.relpath(p, self.project_dir) for p in changed))
+        print(f"Changed: {names}")
+        self.build_task = asyncio.get_running_loop().create_task(self.rebuild(previous))
+
+    async def run_pretext(self, *args):
+        """Run pretext, stopping it and its LaTeX runs if the rebuild is cancelled"""
+        cmd = [str(self.python), "-m", "pretext"] + list(args)
+        print(f"Running: {' '.join(cmd)}")
+        # Its own process group, so kill_tree reaches the children too
+        proc = await asyncio.create_subprocess_exec(*cmd, cwd=self.project_dir,
+                                                    start_new_session=os.name != "nt")
+        try:
+            return await proc.wait()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                kill_tree(proc)
+                await proc.wait()
+            raise
+
+    async def post_build(self):
+        """Run the post-build stages in a worker thread and return their status
+
+        Packing and compression rewrite output/web in place, so a rebuild
+        cancelled meanwhile still waits for them before it stops.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, run_post_build, self.project_dir, False, self.math)
+        cancelled = False
+        while True:
+            try:
+                returncode = await asyncio.shield(future)
+                break
+            except asyncio.CancelledError:
+                if future.done():
+                    raise
+                cancelled = True
+        if cancelled:
+            raise asyncio.CancelledError
+        return returncode
+
+    async def rebuild(self, previous=None):
+        """Incrementally rebuild and reload the pages that changed"""
+        if previous is not None:
+            # A cancelled build is still stopping its pretext; two builds
+            # must never write to output/web at once
+            await asyncio.gather(previous, return_exceptions=True)
+        # Compare against the last output pages were reloaded for, so that
+        # pages touched by a cancelled build are still reported
+        if self.published is None:
+            self.published = page_hashes(self.web_dir) if self.web_dir.exists() else {}
+        before = self.published
+        if check_source(self.project_dir) != 0:
+            print("✗ Fix the source and save again...")
+            return
+        reason, builds, state = plan_build(self.project_dir)
+        print(f"Rebuild: {reason}")
+        for args in builds:
+            returncode = await self.run_pretext(*args)
+            if returncode != 0:
+                print("✗ Build failed! Waiting for the next change...")
+                return
+        if builds:
+            save_manifest(self.project_dir, state)
+            if await self.post_build() != 0:
+                print("✗ Post-build failed! Waiting for the next change...")
+                return
+        after = page_hashes(self.web_dir)
+        # A page's compressed sidecars change with it; reloading them would
+        # otherwise count as an asset change and reload every page
+        changed = sorted({sidecar_source(page) for page, digest in after.items()
+                          if before.get(page) != digest})
+        print(f"✓ Rebuilt, {len(changed)} output file(s) changed")
+        self.published = after
+        await self.server.notify_changed(changed)
+
+    async def run(self):
+        """Build once, then serve and watch until interrupted"""
+        loop = asyncio.get_running_loop()
+        if sys.platform.startswith("linux"):
+            watcher = InotifyWatcher(self.project_dir, self.on_change)
+        else:
+            watcher = PollingWatcher(self.project_dir, self.on_change)
+        watcher.start(loop)
+        await self.rebuild()
+        print("Watching source/, publication/ and project.ptx (Ctrl+C to stop)")
+        await self.server.serve_forever()
+
+
+def watch(project_dir, python, debounce=0.3, port=8128, math=False):
+    """Run watch mode until Ctrl+C"""
+    try:
+        asyncio.run(Watcher(project_dir, python, debounce, port, math).run())
+    except KeyboardInterrupt:
+        print()
+        print("Stopped watching.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild and live-reload on save")
+    parser.add_argument("project_dir", nargs="?", default=".")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Python interpreter with pretext installed")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="seconds to wait for a burst of saves to settle")
+    parser.add_argument("--port", type=int, default=8128)
+    parser.add_argument("--math", action="store_true",
+                        help="prerender math to SVG after each rebuild")
+    args = parser.parse_args()
+    return watch(args.project_dir, args.python, args.debounce, args.port, args.math)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
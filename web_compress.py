@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Minify and precompress the LC Maths web output
+Minifies HTML (with inline CSS and JS), CSS and JS in output/web and writes
+.gz and .br sidecars next to every text asset, in parallel across a process
+pool. Files whose content hash is unchanged since the last run are skipped.
+
+Brotli sidecars need the optional `brotli` package; without it only .gz
+sidecars are written.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from source_output import write_if_changed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_FILE = Path(".build-cache") / "compress-manifest.json"
+TEXT_SUFFIXES = {".html", ".css", ".js", ".json", ".svg", ".xml", ".txt"}
+SIDECARS = (".gz", ".br")
+MIN_SIZE = 256
+
+RAW_BLOCK_RE = re.compile(
+    r"(<pre\b.*?</pre>|<textarea\b.*?</textarea>|<script\b[^>]*>.*?</script>"
+    r"|<style\b[^>]*>.*?</style>|<!--.*?-->)",
+    re.DOTALL | re.IGNORECASE,
+)
+SCRIPT_RE = re.compile(r"(<script\b[^>]*>)(.*?)(</script>)", re.DOTALL | re.IGNORECASE)
+STYLE_RE = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.DOTALL | re.IGNORECASE)
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_PUNCTUATION_RE = re.compile(r"\s*([{};,])\s*")
+
+
+def minify_css(text):
+    """Drop comments and collapse whitespace around CSS punctuation"""
+    text = CSS_COMMENT_RE.sub("", text)
+    text = re.sub(r"\s+", " ", text)
+    return CSS_PUNCTUATION_RE.sub(r"\1", text).strip()
+
+
+def minify_js(text):
+    """Conservative JS minification: trim lines and drop blank ones
+
+    Newlines are kept, so automatic semicolon insertion is unaffected.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def collapse_whitespace(text):
+    """Whitespace runs become one newline (if they had one) or one space"""
+    return re.sub(r"\s+", lambda m: "\n" if "\n" in m.group(0) else " ", text)
+
+
+def minify_html(text):
+    """Minify HTML, leaving <pre> and <textarea> content untouched"""
+    parts = []
+    pending = ""
+    for i, part in enumerate(RAW_BLOCK_RE.split(text)):
+        if i % 2 == 0:
+            pending += part
+            continue
+        if part.startswith("<!--") and not part.startswith("<!--[if"):
+            # Drop banners and notes; the text around them is collapsed together
+            continue
+        parts.append(collapse_whitespace(pending))
+        pending = ""
+        if part[:7].lower() == "<script":
+            match = SCRIPT_RE.match(part)
+            parts.append(match.group(1) + minify_js(match.group(2)) + match.group(3))
+        elif part[:6].lower() == "<style":
+            match = STYLE_RE.match(part)
+            parts.append(match.group(1) + minify_css(match.group(2)) + match.group(3))
+        else:
+            parts.append(part)
+    parts.append(collapse_whitespace(pending))
+    return "".join(parts)
+
+
+def minify(path, text):
+    """Minify by file type; other text assets are returned unchanged"""
+    if path.suffix == ".html":
+        return minify_html(text)
+    if path.suffix == ".css":
+        return minify_css(text)
+    if path.suffix == ".js" and not path.name.endswith(".min.js"):
+        return minify_js(text)
+    return text
+
+
+def process_file(path):
+    """Minify one file and write its sidecars; return (path, hash, saved bytes)"""
+    path = Path(path)
+    data = path.read_bytes()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        minified = data
+    else:
+        minified = minify(path, text).encode("utf-8")
+    write_if_changed(path, minified)
+    if len(minified) >= MIN_SIZE:
+        write_if_changed(path.with_name(path.name + ".gz"),
+                         gzip.compress(minified, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_if_changed(path.with_name(path.name + ".br"),
+                             brotli.compress(minified, quality=11))
+    return str(path), hashlib.sha256(minified).hexdigest(), len(data) - len(minified)
+
+
+def text_assets(web_dir):
+    """Every text asset in the web output"""
+    return sorted(
+        path for path in Path(web_dir).rglob("*")
+        if path.is_file() and path.suffix in TEXT_SUFFIXES
+    )
+
+
+def has_sidecars(path):
+    """True if the sidecars we would write for `path` exist"""
+    if path.stat().st_size < MIN_SIZE:
+        return True
+    wanted = SIDECARS if brotli is not None else (".gz",)
+    return all(path.with_name(path.name + suffix).exists() for suffix in wanted)
+
+
+def remove_orphans(web_dir):
+    """Delete sidecars whose original file is gone; return the count"""
+    removed = 0
+    for suffix in SIDECARS:
+        for sidecar in Path(web_dir).rglob("*" + suffix):
+            original = sidecar.with_name(sidecar.name[:-len(suffix)])
+            if original.suffix in TEXT_SUFFIXES and not original.exists():
+                sidecar.unlink()
+                removed += 1
+    return removed
+
+
+def compress_web(project_dir, web_dir=None, workers=None):
+    """Minify and precompress output/web; return 0"""
+    project_dir = Path(project_dir)
+    web_dir = Path(web_dir) if web_dir else project_dir / "output" / "web"
+    manifest_path = project_dir / MANIFEST_FILE
+    manifest = {}
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    todo = []
+    skipped = 0
+    for path in text_assets(web_dir):
+        rel = path.relative_to(web_dir).as_posix()
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        if manifest.get(rel) == digest and has_sidecars(path):
+            skipped += 1
+        else:
+            todo.append(path)
+
+    saved = 0
+    new_manifest = {
+        rel: digest for rel, digest in manifest.items() if (web_dir / rel).exists()
+    }
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for path, digest, saved_bytes in pool.map(process_file, todo, chunksize=16):
+                new_manifest[Path(path).relative_to(web_dir).as_posix()] = digest
+                saved += saved_bytes
+    removed = remove_orphans(web_dir)
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    write_if_changed(manifest_path, json.dumps(new_manifest, indent=1, sort_keys=True))
+    formats = ".gz and .br" if brotli is not None else ".gz (install brotli for .br)"
+    print(f"Compressed {len(todo)} file(s), {skipped} unchanged, "
+          f"minified away {saved / 1024:.0f} KB, {formats} sidecars")
+    if removed:
+        print(f"Removed {removed} orphaned sidecar(s)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify and precompress output/web")
+    parser.add_argument("--project-dir", default=".")
+    parser.add_argument("--web-dir", help="built web output (default: output/web)")
+    parser.add_argument("--workers", type=int, help="process pool size (default: CPU count)")
+    args = parser.parse_args()
+    return compress_web(args.project_dir, args.web_dir, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())